@@ -24,7 +24,7 @@ from .runit import RunIt
 from .constants import (
     VERSION, CURRENT_PROJECT, CURRENT_PROJECT_DIR,
     EXT_TO_RUNTIME, LANGUAGE_TO_RUNTIME, RUNIT_HOMEDIR,
-    SERVER_HOST, SERVER_PORT, CONFIG_FILE, API_VERSION
+    SERVER_HOST, SERVER_PORT, SERVER_WORKERS, CONFIG_FILE, API_VERSION
 )
 from .exceptions import (
     ProjectExistsError,
@@ -45,9 +45,10 @@ load_dotenv()
 
 # eventlet.monkey_patch()
 
-def start_webserver(project: RunIt, host: str = SERVER_HOST, port: int = SERVER_PORT):
+def start_webserver(project: RunIt, host: str = SERVER_HOST, port: int = SERVER_PORT,
+                    workers: int = SERVER_WORKERS):
     web_server = WebServer(project)
-    web_server.start(host, port)
+    web_server.start(host, port, workers)
 
 async def start_websocket(project: RunIt):
     url = os.getenv('RUNIT_API_ENDPOINT')
@@ -217,7 +218,7 @@ def run_project(args):
             except KeyboardInterrupt:
                 sys.exit(1)
         else:
-            start_webserver(project, args.host, args.port)
+            start_webserver(project, args.host, args.port, args.workers)
 
 def clone(args):
     """
@@ -422,6 +423,8 @@ def get_arguments():
     parser.add_argument('--expose', action='store_true', help='Expose local project on configured domain')
     parser.add_argument('--host', type=str, default='127.0.0.1', help='Host address to run project on')
     parser.add_argument('--port', type=int, default=5000, help='Host port to run project on')
+    parser.add_argument('-w', '--workers', type=int, default=SERVER_WORKERS,
+                        help='Number of server processes forked from one warm parent')
     parser.add_argument('-x', '--arguments', action='append', default=[], help='Comma separated function arguments')
     parser.add_argument('-c','--config', type=is_file, default='runit.json', 
                         help="Configuration File, defaults to 'runit.json'") 
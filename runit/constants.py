@@ -7,6 +7,7 @@ load_dotenv()
 VERSION = "0.4.6"
 CURRENT_PROJECT = ""
 NOT_FOUND_FILE = '404.html'
+PUBLIC_FOLDER = 'public'
 DOT_RUNIT_IGNORE = '.runitignore'
 CONFIG_FILE = 'runit.json'
 STARTER_CONFIG_FILE = 'runit.json'
@@ -19,7 +20,34 @@ PROJECTS_DIR = Path(RUNIT_WORKDIR, 'projects')
 TEMPLATES_FOLDER = Path(RUNIT_HOMEDIR, 'templates')
 SERVER_HOST = '0.0.0.0'
 SERVER_PORT = 9000
+SERVER_WORKERS = int(os.getenv('RUNIT_WORKERS', 1))
+LIMIT_CONCURRENCY = int(os.getenv('RUNIT_LIMIT_CONCURRENCY', 100))
+SHUTDOWN_TIMEOUT = float(os.getenv('RUNIT_SHUTDOWN_TIMEOUT', 30))
+RECYCLE_MAX_REQUESTS = int(os.getenv('RUNIT_RECYCLE_MAX_REQUESTS', 0))
+RECYCLE_MAX_RSS_MB = float(os.getenv('RUNIT_RECYCLE_MAX_RSS_MB', 0))
+RECYCLE_MAX_AGE = float(os.getenv('RUNIT_RECYCLE_MAX_AGE', 0))
 API_VERSION = 'v1'
+EXECUTOR_WORKERS = int(os.getenv('RUNIT_EXECUTOR_WORKERS', min(32, (os.cpu_count() or 1) + 4)))
+WORKER_POOL_SIZE = int(os.getenv('RUNIT_WORKER_POOL_SIZE', 4))
+WORKER_TIMEOUT = float(os.getenv('RUNIT_WORKER_TIMEOUT', 300))
+PHP_WORKER_MAX_REQUESTS = int(os.getenv('RUNIT_PHP_MAX_REQUESTS', 500))
+FUNCTION_CACHE_PATH = os.getenv('RUNIT_FUNCTION_CACHE', Path(RUNIT_WORKDIR, 'cache', 'functions.db'))
+FUNCTION_CACHE_SIZE = int(os.getenv('RUNIT_FUNCTION_CACHE_SIZE', 256))
+RESULT_CACHE_SIZE = int(os.getenv('RUNIT_RESULT_CACHE_SIZE', 1024))
+RESULT_CACHE_BYTES = int(os.getenv('RUNIT_RESULT_CACHE_BYTES', 64 * 1024 * 1024))
+RESULT_CACHE_MIN_MS = float(os.getenv('RUNIT_RESULT_CACHE_MIN_MS', 0))
+BATCH_MAX_CALLS = int(os.getenv('RUNIT_BATCH_MAX_CALLS', 256))
+BATCH_CONCURRENCY = int(os.getenv('RUNIT_BATCH_CONCURRENCY', 16))
+RUNNER_ARGS_FORMAT = os.getenv('RUNIT_ARGS_FORMAT', 'json')
+PAYLOAD_DIR = os.getenv('RUNIT_PAYLOAD_DIR', Path(RUNIT_WORKDIR, 'payloads'))
+PAYLOAD_THRESHOLD = int(os.getenv('RUNIT_PAYLOAD_THRESHOLD', 1024 * 1024))
+UPLOAD_MAX_FILE_SIZE = int(os.getenv('RUNIT_UPLOAD_MAX_FILE_SIZE', 100 * 1024 * 1024))
+UPLOAD_MAX_FIELD_SIZE = int(os.getenv('RUNIT_UPLOAD_MAX_FIELD_SIZE', 1024 * 1024))
+UPLOAD_MAX_PARTS = int(os.getenv('RUNIT_UPLOAD_MAX_PARTS', 1000))
+COMPRESS_MIN_SIZE = int(os.getenv('RUNIT_COMPRESS_MIN_SIZE', 1024))
+STATIC_MAX_AGE = int(os.getenv('RUNIT_STATIC_MAX_AGE', 3600))
+PROCESS_POOL_SIZE = int(os.getenv('RUNIT_PROCESS_POOL_SIZE', os.cpu_count() or 1))
+DISCOVERY_WORKERS = int(os.getenv('RUNIT_DISCOVERY_WORKERS', min(8, os.cpu_count() or 1)))
 
 EXT_TO_LOADER = {
     '.py': os.path.join(TOOLS_DIR, 'python', 'loader.py'),
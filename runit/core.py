@@ -1,19 +1,38 @@
 import asyncio
 import os
+import time
 import signal
 import logging
-from typing import Optional
+import threading
+from typing import Optional, Union
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, Response, FileResponse
+from starlette.background import BackgroundTask, BackgroundTasks
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 import sys
 from pathlib import Path
 from dotenv import find_dotenv, dotenv_values, set_key
 
+from .languages.runtime import Runtime
+from .languages.processes import ProcessPool
+from .languages.workers import WorkerPool
+from .languages.streams import Stream
+from .languages.envelope import Envelope, dumps, OK, ERROR, NOT_FOUND
+from .languages.payloads import Payload, OCTET_STREAM, payloads_in, spool, sweep, write
+from .uploads import parse_multipart, parse_urlencoded
+from .static import AssetIndex
+from .prefork import PreforkServer, RecyclePolicy
+from .responses import EncodedBodies, accepted_encoding, compress, etag_matches, is_compressible, strong_etag
+from .exceptions import MalformedUpload, UploadTooLarge
 from .constants import (
-    RUNIT_HOMEDIR, SERVER_HOST, SERVER_PORT, VERSION
+    RUNIT_HOMEDIR, SERVER_HOST, SERVER_PORT, VERSION, EXECUTOR_WORKERS,
+    BATCH_MAX_CALLS, BATCH_CONCURRENCY, PAYLOAD_THRESHOLD, UPLOAD_MAX_FILE_SIZE,
+    COMPRESS_MIN_SIZE, PUBLIC_FOLDER, STATIC_MAX_AGE, SERVER_WORKERS,
+    LIMIT_CONCURRENCY, SHUTDOWN_TIMEOUT
 )
 
 logging.basicConfig(
@@ -74,15 +93,51 @@ class RunitServerSetup:
 import json
 
 
+class InflightTracker:
+    """ASGI middleware counting requests until their response is sent, refusing new ones once shutdown starts."""
+
+    PROBES = ('/health', '/healthz', '/ready', '/readyz', '/metrics')
+
+    def __init__(self, app, server: 'WebServer'):
+        self.app = app
+        self.server = server
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] in self.PROBES:
+            return await self.app(scope, receive, send)
+
+        server = self.server
+        if server._refusing:
+            response = JSONResponse({'error': 'Server is shutting down'}, status_code=503,
+                                    headers={'Connection': 'close', 'Retry-After': '1'})
+            return await response(scope, receive, send)
+
+        async def close_connection(message):
+            # Clients move off keep-alive connections while we drain
+            if message['type'] == 'http.response.start' and server._draining:
+                message['headers'] = [*message.get('headers', []), (b'connection', b'close')]
+            await send(message)
+
+        server._inflight += 1
+        try:
+            await self.app(scope, receive, close_connection)
+        finally:
+            server._inflight -= 1
+
+
 class WebServer:
     """Production-ready web server with health checks and graceful shutdown."""
-    
-    _shutdown_event: asyncio.Event = None
 
-    def __init__(self, project):
+    def __init__(self, project, max_workers: int = EXECUTOR_WORKERS):
         self.project = project
         self._startup_time = None
         self._request_count = 0
+        self._inflight = 0
+        self._draining = False
+        self._refusing = False
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='runit')
+        self._encoded = EncodedBodies()
+        self.assets = AssetIndex(Path(os.curdir, PUBLIC_FOLDER))
 
     def create_app(self):
         """Create FastAPI app with lifespan management."""
@@ -99,35 +154,82 @@ class WebServer:
             version=VERSION,
             lifespan=lifespan
         )
+        app.add_middleware(InflightTracker, server=self)
         return app
 
     async def on_startup(self):
         """Initialize server on startup."""
         self._startup_time = asyncio.get_event_loop().time()
-        self._shutdown_event = asyncio.Event()
         logger.info("Runit server starting up...")
+        sweep()
+        if not self.assets.built:
+            self.assets.build()
         
-        loop = asyncio.get_event_loop()
+        # Chain to uvicorn's handlers, which stop accepting connections
+        # and let in-flight requests finish before the lifespan ends
         for sig in (signal.SIGINT, signal.SIGTERM):
             try:
-                loop.add_signal_handler(sig, lambda: asyncio.create_task(self.graceful_shutdown()))
-            except NotImplementedError:
+                previous = signal.getsignal(sig)
+                signal.signal(sig, lambda signum, frame, previous=previous: self.on_signal(previous, signum, frame))
+            except ValueError:
+                # Not the main thread (e.g. an embedded or test server)
                 pass
 
+    def on_signal(self, previous, signum, frame):
+        """Start draining, then hand the signal to whoever handled it before."""
+        logger.info("Received shutdown signal, draining...")
+        # Uvicorn stops accepting connections on its next tick; requests
+        # that still arrive meanwhile are served rather than refused
+        self.begin_draining(refuse=False)
+        if callable(previous):
+            previous(signum, frame)
+        elif previous == signal.SIG_DFL:
+            signal.signal(signum, signal.SIG_DFL)
+            signal.raise_signal(signum)
+
     async def on_shutdown(self):
-        """Cleanup on shutdown."""
+        """Wait for in-flight calls up to the deadline, then stop executors and warm workers."""
         logger.info("Runit server shutting down...")
-
-    async def graceful_shutdown(self):
-        """Handle graceful shutdown with signal."""
-        logger.info("Received shutdown signal, initiating graceful shutdown...")
-        self._shutdown_event.set()
-        
-        await asyncio.sleep(0.5)
-        
-        for task in asyncio.all_tasks():
-            if task is not asyncio.current_task():
-                task.cancel()
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        self.begin_draining()
+        if not await self.drain(SHUTDOWN_TIMEOUT):
+            logger.warning(f"[!] {self._inflight} requests still running at the shutdown deadline")
+
+        # A daemon thread, so a stuck runtime can't hold the process past the deadline
+        closer = threading.Thread(target=self.close_runtimes, args=(deadline,), daemon=True)
+        closer.start()
+        # Past the deadline, processes still get a moment to be terminated, then killed
+        while closer.is_alive() and time.monotonic() < deadline + 2:
+            await asyncio.sleep(0.05)
+        if closer.is_alive():
+            logger.warning("[!] Runtimes did not stop before the shutdown deadline")
+
+    def close_runtimes(self, deadline: float):
+        """Stop worker subprocesses, runners of calls still in progress and process pools, then the executor."""
+        # Runners left at this point belong to requests that outlived the drain
+        stopped = Runtime.stop_runners(timeout=1.0)
+        if stopped:
+            logger.warning(f"[!] Stopped {stopped} runner processes still running at the shutdown deadline")
+        WorkerPool.shutdown_all(timeout=max(0.0, deadline - time.monotonic()))
+        ProcessPool.shutdown_all(wait=True)
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def begin_draining(self, refuse: bool = True):
+        """Fail readiness checks and close connections after each response; with `refuse`, answer new requests with 503."""
+        self._draining = True
+        self._refusing = self._refusing or refuse
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait until no request is in flight, at most `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        while self._inflight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return not self._inflight
+
+    async def graceful_shutdown(self, timeout: float = SHUTDOWN_TIMEOUT) -> bool:
+        """Stop taking new work and wait for in-flight requests to finish."""
+        self.begin_draining()
+        return await self.drain(timeout)
 
     def add_routes(self, app):
         """Add all routes including health check endpoints."""
@@ -145,7 +247,9 @@ class WebServer:
         @app.get('/ready')
         @app.get('/readyz')
         async def readiness_check():
-            """Readiness check endpoint for Kubernetes."""
+            """Readiness check endpoint for Kubernetes; not ready while draining."""
+            if self._draining:
+                return JSONResponse({"status": "draining", "in_flight": self._inflight}, status_code=503)
             return JSONResponse({
                 "status": "ready",
                 "project": self.project.name if hasattr(self.project, 'name') else "unknown"
@@ -157,9 +261,61 @@ class WebServer:
             return JSONResponse({
                 "uptime_seconds": asyncio.get_event_loop().time() - self._startup_time if self._startup_time else 0,
                 "total_requests": self._request_count,
-                "project": self.project.name if hasattr(self.project, 'name') else "unknown"
+                "in_flight": self._inflight,
+                "project": self.project.name if hasattr(self.project, 'name') else "unknown",
+                "result_cache": self.project.result_cache.stats(),
+                "function_cache": Runtime._function_cache.stats()
             })
 
+        @app.post('/_batch')
+        async def batch(request: Request):
+            """Run several function calls in one round trip."""
+            self._request_count += 1
+            try:
+                body = await request.json()
+            except ValueError:
+                # Malformed JSON, or a body that isn't UTF-8
+                body = None
+
+            calls = body.get('calls') if isinstance(body, dict) else body
+            if not isinstance(calls, list):
+                return JSONResponse({'error': 'Expected a list of {"function", "args"} calls'}, status_code=400)
+            if len(calls) > BATCH_MAX_CALLS:
+                return JSONResponse({'error': f'At most {BATCH_MAX_CALLS} calls per batch'}, status_code=413)
+
+            stream = request.query_params.get('stream') in ('1', 'true') \
+                or (isinstance(body, dict) and bool(body.get('stream'))) \
+                or 'application/x-ndjson' in request.headers.get('accept', '')
+
+            semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+            tasks = [asyncio.ensure_future(self.run_batch_call(index, call, semaphore))
+                     for index, call in enumerate(calls)]
+
+            if not stream:
+                response = Response(dumps(await asyncio.gather(*tasks)), media_type='application/json')
+                return self.negotiate(request, None, response)
+
+            async def results():
+                try:
+                    for task in asyncio.as_completed(tasks):
+                        yield dumps(await task) + b'\n'
+                finally:
+                    for task in tasks:
+                        task.cancel()
+            return StreamingResponse(results(), media_type='application/x-ndjson')
+
+        # Registered ahead of the function routes, so "public" is a reserved
+        # name: a function called public is only reachable as /public
+        if 'public' in self.project.get_functions():
+            logger.warning('[!] "public" is reserved for static files; /public/... will not reach the function')
+
+        @app.api_route('/public/{path:path}', methods=["GET", "HEAD"])
+        async def public(path: str, request: Request):
+            """Serve a file from the project's public/ directory."""
+            self._request_count += 1
+            # Looking files up may stat them and re-index the folder
+            return await run_in_threadpool(self.serve_asset, request, path)
+
         @app.api_route('/', methods=["GET", "POST"])
         @app.api_route('/{func}', methods=["GET", "POST"])
         @app.api_route('/{func}/', methods=["GET", "POST"])
@@ -168,63 +324,201 @@ class WebServer:
         
         async def serve(func: str = 'index', output_format: str = 'json', request: Request = None):
             self._request_count += 1
-            parameters = await self.get_request_parameters(request)
-            response = self.handle_request(func, output_format, parameters)
-            return self.process_response(output_format, response)
+            try:
+                parameters = await self.get_request_parameters(request)
+            except MalformedUpload as e:
+                return JSONResponse({'error': str(e)}, status_code=400)
+            except UploadTooLarge as e:
+                return JSONResponse({'error': str(e)}, status_code=413)
+            response = await self.handle_request(func, output_format, parameters)
+            if isinstance(response, Stream):
+                sse = output_format == 'sse' or 'text/event-stream' in request.headers.get('accept', '')
+                http_response = StreamingResponse(
+                    self.stream_body(response, sse),
+                    media_type='text/event-stream' if sse else 'application/x-ndjson'
+                )
+            else:
+                http_response = self.negotiate(request, func, self.process_response(output_format, response))
+            return self.release_after(http_response, payloads_in(parameters))
 
-    def handle_request(self, func, output_format, parameters):
-        response = ''
-        result = ''
+    async def handle_request(self, func, output_format, parameters) -> Union[Envelope, Stream]:
         try:
-            result = self.project.serve(func, parameters)
-            self.check_404(result)
-            response = self.parse_result(result)
-        except json.decoder.JSONDecodeError:
-            response = result
-        except Exception:
-            response = self.project.notfound(output_format)
-        finally:
-            return response
+            return await self.project.call_async(func, parameters, self.executor)
+        except Exception as e:
+            logger.exception(f'[!] Error serving {func}')
+            return Envelope(ERROR, error=str(e))
+
+    async def stream_body(self, stream: Stream, sse: bool = False):
+        """Encode stream items as NDJSON lines or Server-Sent Events as they arrive."""
+        async for item in stream.iterate(self.executor):
+            line = item.encode() if stream.encoded else dumps(item)
+            yield b'data: ' + line + b'\n\n' if sse else line + b'\n'
+
+    async def run_batch_call(self, index: int, call, semaphore: asyncio.Semaphore) -> dict:
+        """Run one call of a batch and describe its outcome."""
+        func = call.get('function') if isinstance(call, dict) else None
+        entry = {'index': index, 'function': func}
+        if not isinstance(func, str):
+            return {**entry, 'status': ERROR, 'error': 'Missing function name', 'elapsed_ms': 0.0}
+
+        async with semaphore:
+            start = time.perf_counter()
+            result = await self.handle_request(func, 'json', call.get('args') or {})
+            if isinstance(result, Stream):
+                entry.update(status=OK, result=[item async for item in result.iterate(self.executor)])
+            elif isinstance(result.value, Payload):
+                result.value.release()
+                entry.update(status=ERROR, error='Binary results are only returned by direct calls')
+            elif result.ok:
+                entry.update(status=OK, result=result.value)
+            else:
+                entry.update(status=result.status, error=result.error)
+            entry['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        return entry
 
-    async def get_request_parameters(self, request: Request) -> list:
-        """Extract request parameters safely."""
+    async def get_request_parameters(self, request: Request) -> Union[dict, list]:
+        """Extract request parameters safely; only rejected uploads raise."""
         data = {}
 
         try:
             if request.method.lower() == 'post':
-                if hasattr(request, '_form') and request._form is not None:
-                    data = dict(request._form)
-                
                 content_type = request.headers.get('content-type', '')
                 if 'application/json' in content_type:
                     try:
                         data = await request.json()
                     except json.JSONDecodeError:
                         data = {}
+                elif content_type.startswith('multipart/form-data'):
+                    # Files are streamed to disk as they arrive
+                    data = await parse_multipart(request.stream(), content_type, max_file_size=UPLOAD_MAX_FILE_SIZE)
+                elif content_type.startswith('application/x-www-form-urlencoded'):
+                    data = await parse_urlencoded(request.stream())
+                else:
+                    body = await self.read_body(request, content_type)
+                    data = {'body': body} if body else {}
             else:
                 data = dict(request.query_params)
 
-            data.pop('output_format', None)
+            if isinstance(data, dict):
+                data.pop('output_format', None)
             
-            return list(data.values()) if isinstance(data, dict) else []
+            return data if isinstance(data, (dict, list)) else {}
+        except (MalformedUpload, UploadTooLarge):
+            raise
         except Exception:
-            return []
-
-    def check_404(self, result):
-        if '404' in result:
-            raise RuntimeError('Not Found')
+            return {}
 
-    def parse_result(self, result):
-        return json.loads(result.replace("'", '"'))
+    async def read_body(self, request: Request, content_type: str) -> Union[str, Payload]:
+        """Raw request body: text while small, a payload file once large or binary."""
+        body = await spool(request.stream(), content_type or OCTET_STREAM, PAYLOAD_THRESHOLD)
+        if isinstance(body, Payload):
+            return body
+        try:
+            return body.decode()
+        except UnicodeDecodeError:
+            return write(body, content_type or OCTET_STREAM)
+
+    def release_after(self, response: Response, payloads: list) -> Response:
+        """Delete request payload files once the response has been sent."""
+        if payloads:
+            tasks = BackgroundTasks([response.background] if response.background else [])
+            for payload in payloads:
+                tasks.add_task(payload.release)
+            response.background = tasks
+        return response
+
+    def process_response(self, output_format, envelope: Envelope) -> Response:
+        """Encode a call's outcome once into the HTTP response."""
+        headers = {'Server-Timing': f'fn;dur={envelope.elapsed_ms:.3f}'}
+        if envelope.status == NOT_FOUND:
+            if output_format == 'html':
+                return HTMLResponse(self.project.notfound('html'), status_code=404)
+            return Response(dumps(envelope.error), status_code=404, media_type='application/json')
+        if not envelope.ok:
+            return Response(dumps({'error': envelope.error}), status_code=500,
+                            media_type='application/json', headers=headers)
+
+        value = envelope.value
+        if isinstance(value, Payload):
+            # Served straight from the file, then deleted
+            return FileResponse(value.path, media_type=value.content_type, headers=headers,
+                                background=BackgroundTask(value.release))
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return Response(bytes(value), media_type=OCTET_STREAM, headers=headers)
 
-    def process_response(self, output_format, response):
         if output_format == 'html':
-            return HTMLResponse(response['data'])
-        else:
+            return HTMLResponse(value['data'] if isinstance(value, dict) else str(value), headers=headers)
+        return Response(dumps(envelope.value), media_type='application/json', headers=headers)
+
+    def serve_asset(self, request: Request, path: str) -> Response:
+        """Send a public file from its index entry, or a precompressed sibling the client accepts."""
+        asset = self.assets.lookup(path)
+        if asset is None:
+            return HTMLResponse(self.project.notfound('html'), status_code=404)
+
+        # Byte ranges are only served from the file itself
+        coding = None
+        if asset.variants and 'range' not in request.headers:
+            coding = accepted_encoding(request.headers.get('accept-encoding'), tuple(asset.variants))
+
+        etag = asset.etag_for(coding)
+        headers = {'ETag': etag, 'Cache-Control': f'public, max-age={STATIC_MAX_AGE}'}
+        if asset.variants:
+            headers['Vary'] = 'Accept-Encoding'
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            return Response(status_code=304, headers=headers)
+
+        if coding is None:
+            return FileResponse(asset.path, media_type=asset.media_type, headers=headers, stat_result=asset.stat)
+        filepath, stat = asset.variants[coding]
+        headers['Content-Encoding'] = coding
+        return FileResponse(filepath, media_type=asset.media_type, headers=headers, stat_result=stat)
+
+    def negotiate(self, request: Request, func: Optional[str], response: Response) -> Response:
+        """Add ETag and Cache-Control to GET responses, answer revalidations with 304 and compress the body."""
+        if isinstance(response, (StreamingResponse, FileResponse)) or response.status_code != 200:
             return response
 
-    def start(self, host: str = SERVER_HOST, port: int = SERVER_PORT):
-        """Start the server with production-ready configuration."""
+        body = response.body
+        encoding = None
+        if len(body) >= COMPRESS_MIN_SIZE and is_compressible(response.headers.get('content-type')):
+            encoding = accepted_encoding(request.headers.get('accept-encoding'))
+            response.headers['Vary'] = 'Accept-Encoding'
+
+        cached = func is not None and self.project.cache_settings(func) is not None
+        etag = None
+        if request.method == 'GET':
+            etag = strong_etag(body, encoding)
+            response.headers['ETag'] = etag
+            response.headers['Cache-Control'] = self.cache_control(func)
+            if etag_matches(request.headers.get('if-none-match'), etag):
+                kept = ('ETag', 'Cache-Control', 'Vary', 'Server-Timing')
+                return Response(status_code=304, headers={name: response.headers[name]
+                                                          for name in kept if name in response.headers})
+
+        if encoding:
+            # Cached results repeat, so their compressed body is kept too
+            if cached:
+                body = self._encoded.encode(etag or strong_etag(body, encoding), body, encoding)
+            else:
+                body = compress(body, encoding)
+            response.body = body
+            response.headers['Content-Encoding'] = encoding
+            response.headers['Content-Length'] = str(len(body))
+        return response
+
+    def cache_control(self, func: str) -> str:
+        """Cache-Control of a function: its "cache_control" setting, or public for its cache ttl."""
+        policy = self.project.function_policy(func)
+        if policy.get('cache_control'):
+            return policy['cache_control']
+        settings = self.project.cache_settings(func)
+        if settings is not None:
+            return f"public, max-age={int(settings['ttl'])}"
+        return 'no-cache'
+
+    def start(self, host: str = SERVER_HOST, port: int = SERVER_PORT, workers: int = SERVER_WORKERS):
+        """Start the server with production-ready configuration, forking `workers` processes when above one."""
         app = self.create_app()
         self.add_routes(app)
 
@@ -235,9 +529,17 @@ class WebServer:
             log_level="info",
             access_log=True,
             timeout_keep_alive=30,
-            limit_concurrency=100,
-            limit_max_requests=1000
+            timeout_graceful_shutdown=SHUTDOWN_TIMEOUT,
+            limit_concurrency=LIMIT_CONCURRENCY or None
         )
+
+        # Recycled workers are replaced by the prefork parent,
+        # so a recycling policy needs it even for one worker
+        policy = RecyclePolicy()
+        if workers > 1 or policy.enabled:
+            if hasattr(os, 'fork'):
+                return PreforkServer(self, workers, policy).run(config)
+            logger.warning('[!] Prefork mode needs os.fork; serving from one process without recycling')
         
         server = uvicorn.Server(config)
         
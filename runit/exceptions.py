@@ -5,4 +5,10 @@ class ProjectNameNotSpecified(Exception):
     pass
 
 class ProjectNotFound(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class MalformedUpload(Exception):
+    pass
+
+class UploadTooLarge(Exception):
+    pass
@@ -0,0 +1,80 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Optional, Union
+
+
+class MicroBatcher():
+    '''
+    Merges concurrent calls of one function that
+    arrive within `window` seconds, or until
+    `max_size` calls are queued, into a single
+    call with the list of their arguments. The
+    function must return one result per item,
+    in order; results are handed back to each
+    waiting caller.
+    '''
+
+    def __init__(self, call: Callable[[list], Awaitable[Any]], max_size: int = 32, window: float = 0.005):
+        self.call = call
+        self.max_size = max(1, max_size)
+        self.window = window
+        self._pending: list[tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # The loop only keeps weak references to tasks
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, args: Union[list, dict]) -> Any:
+        '''
+        Queue one call and wait for its share of the batch
+
+        @param args Arguments of the call, passed to the
+                    function as a tuple (see item())
+        @return Result for this call
+        '''
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((MicroBatcher.item(args), future))
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    @staticmethod
+    def item(args: Union[list, dict]) -> tuple:
+        '''
+        One call's entry in the batch. Values given
+        by name are put in the order of their names,
+        not the order the client sent them in.
+
+        @param args Positional arguments, or values by name
+        @return tuple
+        '''
+        if isinstance(args, dict):
+            return tuple(args[name] for name in sorted(args))
+        return tuple(args)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list):
+        try:
+            results = await self.call([args for args, _ in batch])
+            if not isinstance(results, list) or len(results) != len(batch):
+                count = len(results) if isinstance(results, list) else 1
+                raise ValueError(f'Batch function returned {count} results for {len(batch)} calls')
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
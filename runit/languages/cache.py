@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from ..constants import (
+    FUNCTION_CACHE_PATH, FUNCTION_CACHE_SIZE, RESULT_CACHE_SIZE, RESULT_CACHE_BYTES
+)
+
+logger = logging.getLogger('runit.log')
+
+
+class FunctionCache(OrderedDict):
+    '''
+    Bounded LRU of discovered function metadata,
+    backed by a small SQLite file so entries
+    survive restarts. Keys combine the content
+    digest of the module with the loader and
+    runtime that produced the metadata.
+    '''
+
+    def __init__(self, path: Optional[str | Path] = FUNCTION_CACHE_PATH,
+                 max_entries: int = FUNCTION_CACHE_SIZE, digest_ttl: float = 300):
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        self.digest_ttl = digest_ttl
+        self.hits = 0
+        self.misses = 0
+        self._digests: Dict[str, Tuple[tuple, str, float]] = {}
+        self._runtimes: Dict[str, str] = {}
+        self._lock = threading.RLock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_pid: Optional[int] = None
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if not self.path:
+            return None
+        if self._db is None or self._db_pid != os.getpid():
+            try:
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS functions '
+                    '(key TEXT PRIMARY KEY, functions TEXT, accessed REAL)'
+                )
+                self._db_pid = os.getpid()
+            except sqlite3.Error as e:
+                logger.debug(f'[!] Function cache disabled: {e}')
+                self.path = None
+                self._db = None
+        return self._db
+
+    def source_digest(self, module: str) -> str:
+        '''
+        Content digest of a file, memoized per
+        mtime and size and re-verified after
+        `digest_ttl` seconds
+
+        @param module Path of the file
+        @return str Hex digest
+        '''
+        stat = os.stat(module)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._digests.get(module)
+            if cached and cached[0] == signature and time.time() - cached[2] < self.digest_ttl:
+                return cached[1]
+
+        with open(module, 'rb') as file:
+            digest = hashlib.sha256(file.read()).hexdigest()
+        with self._lock:
+            self._digests[module] = (signature, digest, time.time())
+        return digest
+
+    def runtime_identity(self, runtime: str) -> str:
+        '''
+        Cheap stand-in for the runtime version:
+        resolved binary path plus its mtime
+
+        @param runtime Runtime executable
+        @return str Identity string
+        '''
+        if runtime not in self._runtimes:
+            path = shutil.which(runtime) or runtime
+            try:
+                path = os.path.realpath(path)
+                self._runtimes[runtime] = f'{path}@{os.stat(path).st_mtime_ns}'
+            except OSError:
+                self._runtimes[runtime] = runtime
+        return self._runtimes[runtime]
+
+    def make_key(self, module: str, loader: str, runtime: str) -> str:
+        identity = f'{self.source_digest(module)}:{loader}:{self.runtime_identity(runtime)}'
+        return hashlib.sha256(identity.encode()).hexdigest()
+
+    def lookup(self, key: str) -> Optional[dict]:
+        with self._lock:
+            if key in self:
+                self.move_to_end(key)
+                self.hits += 1
+                return self[key]
+
+            db = self._connect()
+            row = None
+            if db is not None:
+                try:
+                    row = db.execute('SELECT functions FROM functions WHERE key = ?', (key,)).fetchone()
+                    if row:
+                        db.execute('UPDATE functions SET accessed = ? WHERE key = ?', (time.time(), key))
+                        db.commit()
+                except sqlite3.Error as e:
+                    logger.debug(f'[!] Function cache read failed: {e}')
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            functions = json.loads(row[0])
+            self._remember(key, functions)
+            return functions
+
+    def store(self, key: str, functions: dict):
+        with self._lock:
+            self._remember(key, functions)
+            db = self._connect()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    'INSERT OR REPLACE INTO functions (key, functions, accessed) VALUES (?, ?, ?)',
+                    (key, json.dumps(functions), time.time())
+                )
+                db.execute(
+                    'DELETE FROM functions WHERE key NOT IN '
+                    '(SELECT key FROM functions ORDER BY accessed DESC LIMIT ?)',
+                    (self.max_entries * 4,)
+                )
+                db.commit()
+            except sqlite3.Error as e:
+                logger.debug(f'[!] Function cache write failed: {e}')
+
+    def _remember(self, key: str, functions: dict):
+        self[key] = functions
+        self.move_to_end(key)
+        while len(self) > self.max_entries:
+            self.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0
+        }
+
+
+class ResultCache(OrderedDict):
+    '''
+    Bounded LRU of function results for functions
+    that opt in with a "cache" setting in runit.json.
+    Keys include the digest of the function's source,
+    so editing a module leaves its old entries to age
+    out. Only results slower than a threshold are
+    admitted, keeping cheap calls from evicting
+    expensive ones.
+    '''
+    MISS = object()
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE, max_bytes: int = RESULT_CACHE_BYTES):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(func: str, args: Any, digest: str) -> str:
+        '''
+        Key for a call; dict arguments are
+        normalized so their order doesn't matter
+
+        @param func Function name
+        @param args Call arguments
+        @param digest Source digest of the function's file
+        @return str
+        '''
+        arguments = json.dumps(args, sort_keys=True, default=str, separators=(',', ':'))
+        return hashlib.sha256(f'{digest}:{func}:{arguments}'.encode()).hexdigest()
+
+    @staticmethod
+    def sizeof(value: Any) -> int:
+        if isinstance(value, (str, bytes)):
+            return len(value)
+        return len(json.dumps(value, default=str))
+
+    def lookup(self, key: str) -> Any:
+        '''
+        Cached result for `key`, or ResultCache.MISS
+        '''
+        with self._lock:
+            entry = super().get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._evict(key)
+            self.misses += 1
+            return ResultCache.MISS
+
+    def store(self, key: str, value: Any, ttl: float, elapsed: float, min_compute: float = 0) -> bool:
+        '''
+        Admit a result if it was slow enough to be
+        worth keeping and fits in the byte budget
+
+        @param key Cache key
+        @param value Function result
+        @param ttl Seconds the result stays valid
+        @param elapsed Seconds the call took
+        @param min_compute Minimum seconds for admission
+        @return bool Whether the result was stored
+        '''
+        size = ResultCache.sizeof(value)
+        if ttl <= 0 or elapsed < min_compute or size > self.max_bytes:
+            return False
+
+        with self._lock:
+            if key in self:
+                self._evict(key)
+            self[key] = (value, time.monotonic() + ttl, size)
+            self.bytes += size
+            while len(self) > self.max_entries or self.bytes > self.max_bytes:
+                self._evict(next(iter(self)))
+        return True
+
+    def _evict(self, key: str):
+        _, _, size = self.pop(key)
+        self.bytes -= size
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0
+        }
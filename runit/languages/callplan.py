@@ -0,0 +1,138 @@
+import json
+import inspect
+import typing
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple, Union
+
+
+def _to_bool(value: str) -> bool:
+    lowered = value.strip().lower()
+    if lowered in ('1', 'true', 'yes', 'on'):
+        return True
+    if lowered in ('0', 'false', 'no', 'off', ''):
+        return False
+    raise ValueError(f'invalid boolean: {value!r}')
+
+
+def _from_json(kind: type) -> Callable[[str], Any]:
+    def coerce(value: str):
+        loaded = json.loads(value)
+        if not isinstance(loaded, kind):
+            raise ValueError(f'expected {kind.__name__}')
+        return loaded
+    return coerce
+
+
+# Request values arrive as strings from query strings and
+# forms; these turn them into what the annotation asks for
+COERCERS: Dict[Any, Callable[[str], Any]] = {
+    int: int,
+    float: float,
+    bool: _to_bool,
+    list: _from_json(list),
+    dict: _from_json(dict),
+}
+COERCER_NAMES = {kind.__name__: coercer for kind, coercer in COERCERS.items()}
+
+
+def _coercer(annotation: Any) -> Optional[Callable[[str], Any]]:
+    if isinstance(annotation, str):
+        return COERCER_NAMES.get(annotation)
+    origin = typing.get_origin(annotation)
+    if origin is Union:
+        options = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        return _coercer(options[0]) if len(options) == 1 else None
+    return COERCERS.get(origin or annotation)
+
+
+class CallPlan():
+    '''
+    Everything needed to call a function,
+    worked out once when its module loads
+    instead of on every request
+    '''
+    __slots__ = ('func', 'is_coroutine', 'is_generator', 'parameters', 'positional_only',
+                 'required', 'defaults', 'varargs', 'varkw', 'coercers')
+
+    def __init__(self, func: Callable):
+        self.func = func
+        self.is_coroutine = inspect.iscoroutinefunction(func)
+        self.is_generator = inspect.isgeneratorfunction(func) or inspect.isasyncgenfunction(func)
+        self.parameters: list[str] = []
+        self.positional_only: list[str] = []
+        self.required: list[str] = []
+        self.defaults: Dict[str, Any] = {}
+        self.varargs = False
+        self.varkw = False
+        self.coercers: Dict[str, Callable[[str], Any]] = {}
+
+        try:
+            hints = typing.get_type_hints(func)
+        except Exception:
+            hints = {}
+
+        for name, parameter in inspect.signature(func).parameters.items():
+            if parameter.kind is parameter.VAR_POSITIONAL:
+                self.varargs = True
+                continue
+            if parameter.kind is parameter.VAR_KEYWORD:
+                self.varkw = True
+                continue
+
+            self.parameters.append(name)
+            if parameter.kind is parameter.POSITIONAL_ONLY:
+                self.positional_only.append(name)
+            if parameter.default is parameter.empty:
+                self.required.append(name)
+            else:
+                self.defaults[name] = parameter.default
+
+            coercer = _coercer(hints.get(name, parameter.annotation))
+            if coercer is not None:
+                self.coercers[name] = coercer
+
+    def coerce(self, name: str, value: Any) -> Any:
+        coercer = self.coercers.get(name)
+        if coercer is None or not isinstance(value, str):
+            return value
+        try:
+            return coercer(value)
+        except ValueError as e:
+            raise TypeError(f'Invalid value for {name}: {e}')
+
+    def bind(self, args: Union[Sequence, dict]) -> Tuple[list, dict]:
+        '''
+        Positional and keyword arguments for a call.
+        Lists are bound in order, dicts by name; keys
+        the function does not take are dropped unless
+        it accepts **kwargs.
+
+        @param args Request arguments
+        @return tuple (args, kwargs)
+        '''
+        if not isinstance(args, dict):
+            names = self.parameters + [None] * max(0, len(args) - len(self.parameters))
+            return [self.coerce(name, value) if name else value
+                    for name, value in zip(names, args)], {}
+
+        missing = [name for name in self.required if name not in args]
+        if missing:
+            raise TypeError(f'Missing required argument(s): {", ".join(missing)}')
+
+        positional = []
+        for name in self.positional_only:
+            if name not in args:
+                break
+            positional.append(self.coerce(name, args[name]))
+        keywords = {name: self.coerce(name, value) for name, value in args.items()
+                    if name not in self.positional_only and (name in self.parameters or self.varkw)}
+        return positional, keywords
+
+
+def compile_plans(functions: Dict[str, Callable]) -> Dict[str, CallPlan]:
+    plans = {}
+    for name, func in functions.items():
+        try:
+            plans[name] = CallPlan(func)
+        except (TypeError, ValueError):
+            continue
+    return plans
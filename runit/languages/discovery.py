@@ -0,0 +1,478 @@
+import os
+import re
+import ast
+from typing import Optional
+
+# Calls at module level that can add names to the
+# namespace in ways a static scan cannot follow
+DYNAMIC_NAMESPACE_CALLS = {'globals', 'vars', 'exec', 'eval', 'setattr', '__import__'}
+
+
+def _literal(node: ast.expr):
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError, RecursionError):
+        return ast.unparse(node)
+
+
+def _yields(node: ast.AST) -> bool:
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, (ast.Yield, ast.YieldFrom)):
+            return True
+        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)):
+            continue
+        if _yields(child):
+            return True
+    return False
+
+
+def _signature(node: ast.FunctionDef | ast.AsyncFunctionDef | ast.Lambda) -> dict:
+    arguments = node.args
+    positional = arguments.posonlyargs + arguments.args
+    parameters = [arg.arg for arg in positional]
+    if arguments.vararg:
+        parameters.append(arguments.vararg.arg)
+    parameters += [arg.arg for arg in arguments.kwonlyargs]
+    if arguments.kwarg:
+        parameters.append(arguments.kwarg.arg)
+
+    defaults = {}
+    for arg, default in zip(positional[len(positional) - len(arguments.defaults):], arguments.defaults):
+        defaults[arg.arg] = _literal(default)
+    for arg, default in zip(arguments.kwonlyargs, arguments.kw_defaults):
+        if default is not None:
+            defaults[arg.arg] = _literal(default)
+
+    annotations = {}
+    if not isinstance(node, ast.Lambda):
+        for arg in positional + arguments.kwonlyargs + [arguments.vararg, arguments.kwarg]:
+            if arg is not None and arg.annotation is not None:
+                annotations[arg.arg] = ast.unparse(arg.annotation)
+
+    return {
+        'parameters': parameters,
+        'defaults': defaults,
+        'annotations': annotations,
+        'is_async': isinstance(node, ast.AsyncFunctionDef),
+        'is_generator': not isinstance(node, ast.Lambda) and _yields(node)
+    }
+
+
+def scan_python(filename: str, _seen: Optional[set] = None) -> Optional[dict]:
+    '''
+    List the public top-level functions of a Python
+    file with their parameters, defaults and annotations
+    without importing it. Functions imported from sibling
+    project modules are followed.
+
+    Returns None when the module builds its namespace
+    dynamically or decorates a function, and has to be
+    imported instead.
+
+    @param filename Path of the Python file
+    @return dict|None Function names mapped to signatures
+    '''
+    _seen = _seen if _seen is not None else set()
+    filename = os.path.realpath(filename)
+    if filename in _seen:
+        return {}
+    _seen.add(filename)
+
+    try:
+        with open(filename, 'rb') as file:
+            tree = ast.parse(file.read(), filename)
+    except (OSError, SyntaxError, ValueError):
+        return None
+
+    functions = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            # A decorator may replace the function with anything
+            if node.name == '__getattr__' or node.decorator_list:
+                return None
+            functions[node.name] = _signature(node)
+            continue
+
+        if isinstance(node, ast.ClassDef):
+            functions.pop(node.name, None)
+            continue
+
+        for child in ast.walk(node):
+            # Conditionally defined functions depend on runtime state
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                return None
+            if isinstance(child, ast.Call) and isinstance(child.func, ast.Name) \
+                    and child.func.id in DYNAMIC_NAMESPACE_CALLS:
+                return None
+
+        if isinstance(node, ast.ImportFrom):
+            for alias in node.names:
+                if alias.name == '*':
+                    return None
+            module_file = _local_module(filename, node)
+            imported = scan_python(module_file, _seen) if module_file else {}
+            if imported is None:
+                return None
+            for alias in node.names:
+                name = alias.asname or alias.name
+                if alias.name in imported:
+                    functions[name] = imported[alias.name]
+                else:
+                    functions.pop(name, None)
+            continue
+
+        if isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            names = [target.id for target in targets if isinstance(target, ast.Name)]
+            value = node.value
+            if isinstance(value, ast.Lambda):
+                for name in names:
+                    functions[name] = _signature(value)
+                continue
+            # A module-level factory call may well hand back a function
+            if isinstance(value, ast.Call) and isinstance(value.func, ast.Name) \
+                    and value.func.id in functions:
+                return None
+            for name in names:
+                functions.pop(name, None)
+
+    return {name: signature for name, signature in functions.items() if not name.startswith('_')}
+
+
+def _local_module(filename: str, node: ast.ImportFrom) -> Optional[str]:
+    if not node.module or node.level > 1:
+        return None
+    candidate = os.path.join(os.path.dirname(filename), *node.module.split('.')) + '.py'
+    return candidate if os.path.isfile(candidate) else None
+
+
+def _sanitize(source: str, hash_comments: bool = False) -> str:
+    '''
+    Drop comments and blank out the delimiters inside
+    string literals so braces and commas in strings
+    don't confuse the bracket matching below
+    '''
+    out = []
+    i, n = 0, len(source)
+    while i < n:
+        char = source[i]
+        if char in '\'"`':
+            j = i + 1
+            while j < n and source[j] != char:
+                j += 2 if source[j] == '\\' else 1
+            literal = source[i:j + 1]
+            out.append(literal[0] + re.sub(r'[{}()\[\],;]', ' ', literal[1:-1]) + literal[-1:])
+            i = j + 1
+        elif source.startswith('//', i) or (hash_comments and char == '#' and not source.startswith('#[', i)):
+            j = source.find('\n', i)
+            i = n if j == -1 else j
+        elif source.startswith('/*', i):
+            j = source.find('*/', i + 2)
+            i = n if j == -1 else j + 2
+            out.append(' ')
+        else:
+            out.append(char)
+            i += 1
+    return ''.join(out)
+
+
+def _closing(source: str, start: int) -> int:
+    '''Index of the bracket closing the one at `start`, -1 if unbalanced'''
+    pairs = {'(': ')', '[': ']', '{': '}'}
+    stack = []
+    for i in range(start, len(source)):
+        char = source[i]
+        if char in pairs:
+            stack.append(pairs[char])
+        elif stack and char == stack[-1]:
+            stack.pop()
+            if not stack:
+                return i
+    return -1
+
+
+def _split(text: str, separator: str = ',') -> list[str]:
+    parts, depth, current = [], 0, []
+    for char in text:
+        if char in '([{':
+            depth += 1
+        elif char in ')]}':
+            depth -= 1
+        if char == separator and depth == 0:
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(char)
+    parts.append(''.join(current))
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _js_parameters(text: str) -> list[str]:
+    parameters = []
+    for part in _split(text):
+        part = part.lstrip('.').strip()
+        name = re.match(r'[\w$]+', part)
+        parameters.append(name.group() if name else part)
+    return parameters
+
+
+JS_FUNCTION = re.compile(r'(?:async\s+)?function\b\s*\*?\s*[\w$]*\s*(?=\()')
+JS_ARROW_SINGLE = re.compile(r'(?:async\s+)?([\w$]+)\s*=>')
+JS_IDENTIFIER = re.compile(r'([\w$]+)\s*(?:[;,}\n]|$)')
+JS_LITERAL = re.compile(r'(?:[-+\d\'"`\[{]|new\b|class\b|true\b|false\b|null\b|undefined\b)')
+
+
+def _js_value(text: str) -> tuple:
+    '''
+    Classify the expression at the start of `text` as
+    ('function', parameters), ('name', identifier),
+    ('value', None) or ('unknown', None)
+    '''
+    text = text.lstrip()
+    match = JS_FUNCTION.match(text)
+    if match:
+        end = _closing(text, match.end())
+        return ('function', _js_parameters(text[match.end() + 1:end])) if end != -1 else ('unknown', None)
+
+    match = re.match(r'(?:async\s*)?(?=\()', text)
+    if match:
+        end = _closing(text, match.end())
+        if end != -1 and re.match(r'\s*(?::[^=;{]+)?=>', text[end + 1:]):
+            return ('function', _js_parameters(text[match.end() + 1:end]))
+        return ('unknown', None)
+
+    match = JS_ARROW_SINGLE.match(text)
+    if match:
+        return ('function', [match.group(1)])
+    if JS_LITERAL.match(text):
+        return ('value', None)
+    match = JS_IDENTIFIER.match(text)
+    if match:
+        return ('name', match.group(1))
+    return ('unknown', None)
+
+
+def scan_javascript(filename: str) -> Optional[dict]:
+    '''
+    List the functions a Javascript/Typescript file
+    exports, through `exports.x =`, `module.exports`
+    or ES `export` declarations, without running it.
+
+    Returns None for exports that can only be
+    resolved by loading the module.
+
+    @param filename Path of the source file
+    @return dict|None Function names mapped to parameters
+    '''
+    try:
+        with open(filename, 'rt', encoding='utf-8') as file:
+            source = _sanitize(file.read())
+    except (OSError, UnicodeDecodeError):
+        return None
+
+    if re.search(r'\bexports\s*\[|Object\.(?:assign|defineProperty|defineProperties)\s*\(\s*(?:module\.)?exports\b'
+                 r'|\bexport\s*\*|\bexport\s*\{[^}]*\}\s*from\b', source):
+        return None
+
+    definitions = {}
+    for match in re.finditer(r'(?<![\w$.])(?:async\s+)?function\b\s*\*?\s*([\w$]+)\s*(?=\()', source):
+        end = _closing(source, match.end())
+        definitions[match.group(1)] = ('function', _js_parameters(source[match.end() + 1:end]))
+    for match in re.finditer(r'\b(?:const|let|var)\s+([\w$]+)\s*(?::[^=;]+)?=(?![=>])', source):
+        definitions.setdefault(match.group(1), _js_value(source[match.end():]))
+    for match in re.finditer(r'\bclass\s+([\w$]+)', source):
+        definitions[match.group(1)] = ('value', None)
+
+    def resolve(value: tuple, depth: int = 0):
+        kind, detail = value
+        if kind == 'name' and depth < 10:
+            if detail not in definitions:
+                return ('unknown', None)
+            return resolve(definitions[detail], depth + 1)
+        return value
+
+    exports = {}
+
+    def export(name: str, value: tuple) -> bool:
+        kind, detail = resolve(value)
+        if kind == 'unknown':
+            return False
+        if kind == 'function':
+            exports[name] = detail
+        else:
+            exports.pop(name, None)
+        return True
+
+    # `module.exports = ...` detaches the `exports` shorthand,
+    # so assignments are replayed in source order
+    detached = False
+    for match in re.finditer(r'(?<![\w$.])(module\.)?exports(?:\.([\w$]+))?\s*=(?!=)', source):
+        module, name = match.group(1), match.group(2)
+        if name:
+            if not module and detached:
+                continue
+            if not export(name, _js_value(source[match.end():])):
+                return None
+            continue
+
+        detached = True
+        if not module:
+            continue
+        rest = source[match.end():].lstrip()
+        end = _closing(rest, 0) if rest.startswith('{') else -1
+        if end == -1:
+            return None
+        exports.clear()
+        for entry in _split(rest[1:end]):
+            if entry.startswith(('...', '[')):
+                return None
+            method = re.match(r'(?:async\s+)?\*?\s*[\'"]?([\w$]+)[\'"]?\s*(?=\()', entry)
+            pair = re.match(r'[\'"]?([\w$]+)[\'"]?\s*:', entry)
+            if method:
+                close = _closing(entry, method.end())
+                exports[method.group(1)] = _js_parameters(entry[method.end() + 1:close])
+            elif pair:
+                if not export(pair.group(1), _js_value(entry[pair.end():])):
+                    return None
+            elif not export(entry, ('name', entry)):
+                return None
+
+    for match in re.finditer(r'\bexport\s+(default\s+)?(?:async\s+)?function\b\s*\*?\s*([\w$]*)\s*(?=\()', source):
+        end = _closing(source, match.end())
+        exports['default' if match.group(1) else match.group(2)] = _js_parameters(source[match.end() + 1:end])
+    for match in re.finditer(r'\bexport\s+(?:const|let|var)\s+([\w$]+)\s*(?::[^=;]+)?=(?![=>])', source):
+        if not export(match.group(1), _js_value(source[match.end():])):
+            return None
+    for match in re.finditer(r'\bexport\s*\{([^}]*)\}', source):
+        for entry in _split(match.group(1)):
+            names = re.split(r'\s+as\s+', entry)
+            if not export(names[-1], ('name', names[0])):
+                return None
+    for match in re.finditer(r'\bexport\s+default\s+(?!(?:async\s+)?function\b|class\b)', source):
+        if not export('default', _js_value(source[match.end():])):
+            return None
+
+    return exports
+
+
+def _php_code(source: str) -> str:
+    code = []
+    for segment in re.split(r'<\?php\b|<\?=', source)[1:]:
+        code.append(segment.split('?>', 1)[0])
+    return '\n'.join(code)
+
+
+def scan_php(filename: str, _seen: Optional[set] = None) -> Optional[dict]:
+    '''
+    List the top-level functions declared in a PHP file,
+    following includes of other project files, without
+    running it. Names are lowercased like PHP reports them.
+
+    Returns None for conditionally declared functions
+    or includes whose path is only known at runtime.
+
+    @param filename Path of the PHP file
+    @return dict|None Function names mapped to parameters
+    '''
+    _seen = _seen if _seen is not None else set()
+    filename = os.path.realpath(filename)
+    if filename in _seen:
+        return {}
+    _seen.add(filename)
+
+    try:
+        with open(filename, 'rt', encoding='utf-8') as file:
+            code = _sanitize(_php_code(file.read()), hash_comments=True)
+    except (OSError, UnicodeDecodeError):
+        return None
+
+    functions = {}
+    blocks: list[str] = []
+    pending = None
+    tokens = re.compile(
+        r'[{};]|(?<![\w$:>])(?:class|interface|trait|enum)\s+\w+|\bnew\s+class\b'
+        r'|\bfunction\b\s*&?\s*(\w*)\s*(?=\()|\b(?:require|include)(?:_once)?\b([^;]*);'
+    )
+    for match in tokens.finditer(code):
+        token = match.group()
+        if token == '{':
+            blocks.append(pending or 'block')
+            pending = None
+        elif token == '}':
+            if blocks:
+                blocks.pop()
+        elif token == ';':
+            pending = None
+        elif token.startswith('function'):
+            pending = 'function'
+            name = match.group(1)
+            if not name or blocks and blocks[-1] == 'class' or 'function' in blocks:
+                continue
+            if blocks:
+                return None
+            end = _closing(code, match.end())
+            parameters = []
+            for part in _split(code[match.end() + 1:end]):
+                variable = re.search(r'\$(\w+)', part)
+                if variable:
+                    parameters.append(variable.group(1))
+            functions[name.lower()] = parameters
+        elif token.startswith(('require', 'include')):
+            if 'function' in blocks:
+                continue
+            path = _php_include_path(filename, match.group(2))
+            if path is None:
+                return None
+            if not path or 'vendor' in path.split(os.sep):
+                continue
+            included = scan_php(path, _seen)
+            if included is None:
+                return None
+            functions.update(included)
+        else:
+            pending = 'class'
+
+    return functions
+
+
+def _php_include_path(filename: str, expression: str) -> Optional[str]:
+    '''
+    Resolve a literal include expression like 'lib.php'
+    or __DIR__ . '/lib.php'. Returns '' for missing
+    files and None when the path isn't a literal.
+    '''
+    expression = expression.strip().strip('()').strip()
+    match = re.fullmatch(r'(?:(__DIR__|dirname\(__FILE__\))\s*\.\s*)?([\'"])([^\'"$]+)\2', expression)
+    if not match:
+        return None
+    path = match.group(3)
+    if match.group(1):
+        path = path.lstrip('/\\')
+    path = os.path.join(os.path.dirname(filename), path)
+    return os.path.realpath(path) if os.path.isfile(path) else ''
+
+
+STATIC_SCANNERS = {
+    '.js': scan_javascript, '.jsx': scan_javascript,
+    '.ts': scan_javascript, '.tsx': scan_javascript,
+    '.php': scan_php
+}
+
+
+def scan_functions(filename: str) -> Optional[dict]:
+    '''
+    Statically list the functions of any supported
+    file as names mapped to parameter lists
+
+    @param filename Path of the source file
+    @return dict|None None when the loader must run
+    '''
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.py':
+        signatures = scan_python(filename)
+        if signatures is None:
+            return None
+        return {name: signature['parameters'] for name, signature in signatures.items()}
+    if extension in STATIC_SCANNERS:
+        return STATIC_SCANNERS[extension](filename)
+    return None
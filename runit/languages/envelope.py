@@ -0,0 +1,133 @@
+import json
+import logging
+from typing import Any, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Runners print their envelope as the last stdout line,
+# prefixed with this ASCII record separator; anything
+# printed before it is the function's own output
+ENVELOPE_MARKER = '\x1e'
+
+logger = logging.getLogger('runit.log')
+
+OK = 'ok'
+ERROR = 'error'
+NOT_FOUND = 'not_found'
+
+
+class FunctionError(Exception):
+    '''
+    Raised by language parsers when a function
+    fails; the message is what the caller sees
+    '''
+    pass
+
+
+def dumps(value: Any) -> bytes:
+    '''
+    Encode a value as JSON once, with orjson when
+    it is installed
+
+    @param value Value to encode
+    @return bytes
+    '''
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(value, default=str, separators=(',', ':')).encode()
+
+
+def encode_frame(frame: dict, format: str = 'json') -> bytes:
+    '''
+    Encode the arguments frame a runner reads from stdin
+
+    @param frame {"args": [...], "kwargs": {...}}
+    @param format "json" or "msgpack"
+    @return bytes
+    '''
+    if format == 'msgpack':
+        import msgpack
+        return msgpack.packb(frame, default=str)
+    return dumps(frame)
+
+
+def loads(data: str | bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class Envelope():
+    '''
+    Outcome of one function call: its status,
+    value or error message, and how long it took
+    '''
+    __slots__ = ('status', 'value', 'error', 'elapsed_ms')
+
+    def __init__(self, status: str = OK, value: Any = None, error: Optional[str] = None,
+                 elapsed_ms: float = 0.0):
+        self.status = status
+        self.value = value
+        self.error = error
+        self.elapsed_ms = elapsed_ms
+
+    @property
+    def ok(self) -> bool:
+        return self.status == OK
+
+    def to_dict(self) -> dict:
+        return {
+            'status': self.status,
+            'value': self.value,
+            'error': self.error,
+            'timings': {'elapsed_ms': round(self.elapsed_ms, 3)}
+        }
+
+    def __repr__(self):
+        return f'Envelope({self.status!r}, value={self.value!r}, error={self.error!r})'
+
+
+def split_output(stdout: str) -> tuple[list[str], Optional[dict]]:
+    '''
+    Separate what a runner printed from the
+    envelope on its last marked line
+
+    @param stdout Runner output
+    @return tuple (printed lines, envelope dict or None)
+    '''
+    # Not splitlines(): it treats the marker itself as a line break
+    lines = stdout.rstrip('\n').split('\n')
+    for index in range(len(lines) - 1, -1, -1):
+        if lines[index].startswith(ENVELOPE_MARKER):
+            return lines[:index], json.loads(lines[index][len(ENVELOPE_MARKER):])
+    return lines, None
+
+
+def read_output(stdout: str) -> Any:
+    '''
+    Value returned by a runner. Printed output is
+    logged at info level; a failed call raises
+    FunctionError. Output without an envelope (an
+    older runner) is decoded as JSON when it is
+    JSON, and returned as text otherwise.
+
+    @param stdout Runner output
+    @return Function value
+    '''
+    printed, envelope = split_output(stdout)
+    if envelope is None:
+        try:
+            return json.loads(stdout)
+        except json.JSONDecodeError:
+            return stdout.strip()
+    if printed:
+        logger.info('\n'.join(printed))
+    if envelope.get('status') != OK:
+        raise FunctionError(envelope.get('error') or 'Function failed')
+    return envelope.get('value')
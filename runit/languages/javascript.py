@@ -11,6 +11,7 @@ class Javascript(Runtime):
     '''
     LOADER = os.path.realpath(os.path.join(JS_TOOLS_DIR, 'loader.js'))
     RUNNER = os.path.realpath(os.path.join(JS_TOOLS_DIR, 'runner.js'))
+    WORKER = os.path.realpath(os.path.join(JS_TOOLS_DIR, 'worker.js'))
     
     def __init__(self, filename, runtime, is_file, is_docker, project_id):
         super().__init__(filename, runtime, is_file, is_docker, project_id)
\ No newline at end of file
@@ -1,10 +1,13 @@
 import os
 import ast
 import json
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
-from ..constants import EXT_TO_RUNTIME, EXT_TO_LOADER, EXT_TO_RUNNER
+from ..constants import EXT_TO_RUNTIME, EXT_TO_LOADER, EXT_TO_RUNNER, DISCOVERY_WORKERS, RUNNER_ARGS_FORMAT
 from .runtime import Runtime
+from .discovery import scan_functions
 
 MULTI_TOOLS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)),'..', 'tools', 'multi')
 
@@ -15,8 +18,12 @@ class Multi(Runtime):
     '''
     LOADER = os.path.realpath(os.path.join(MULTI_TOOLS_DIR, 'loader.py'))
     RUNNER = os.path.realpath(os.path.join(MULTI_TOOLS_DIR, 'runner.py'))
+    LAZY_DISCOVERY = True
 
     def __init__(self, filename, runtime, is_file, is_docker, project_id):
+        self._functions = {}
+        self._discovered = False
+        self._discovery_lock = threading.Lock()
         super().__init__(filename, runtime, is_file, is_docker, project_id)
     
     def load_files(self)-> list[str]:
@@ -29,55 +36,101 @@ class Multi(Runtime):
         '''
         return [sfile for sfile in os.listdir(os.curdir) if os.path.splitext(sfile)[1].lower() in EXT_TO_RUNTIME.keys()]
     
+    @property
+    def functions(self) -> dict:
+        '''
+        Exported functions of all supported files,
+        discovered the first time they are looked up
+        '''
+        if not self._discovered:
+            with self._discovery_lock:
+                if not self._discovered:
+                    self.load_functions_from_supported_files()
+                    self._discovered = True
+        return self._functions
+
+    @functions.setter
+    def functions(self, functions: dict):
+        self._functions = functions
+
+    @staticmethod
+    def scan_file(full_path: str)-> dict:
+        '''
+        Return the exported functions of a single file
+        and their parameters. Sources are scanned
+        statically where possible; loader results are
+        cached by content digest so unchanged files
+        are never loaded twice.
+
+        @param full_path Absolute path of the file
+        @return dict Function names mapped to parameters
+        '''
+        functions = scan_functions(full_path)
+        if functions is not None:
+            return functions
+
+        extension = os.path.splitext(full_path)[1].lower()
+        cache_key = Runtime._function_cache.make_key(
+            full_path, EXT_TO_LOADER[extension], EXT_TO_RUNTIME[extension]
+        )
+        cached = Runtime._function_cache.lookup(cache_key)
+        if cached is not None:
+            return cached
+
+        result = subprocess.run(
+            [EXT_TO_RUNTIME[extension], EXT_TO_LOADER[extension], full_path],
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        result = result.strip()
+
+        if extension == '.py':
+            loaded_functions = ast.literal_eval(result)
+        else:
+            loaded_functions = json.loads(result)
+
+        if isinstance(loaded_functions, list):
+            loaded_functions = {func: [] for func in loaded_functions}
+
+        Runtime._function_cache.store(cache_key, loaded_functions)
+        return loaded_functions
+
     def load_functions_from_supported_files(self):
         '''
         Class method for loading exported
         function names from all supported files 
-        types
+        types. Files are scanned in parallel.
 
         @param None
         @return None
         '''
         
         try:
-            self.functions = {}
-            files = self.load_files()
-            for lfile in files:
+            functions = {}
+            files = [os.path.join(os.path.realpath(os.curdir), lfile) for lfile in self.load_files()]
+            
+            with ThreadPoolExecutor(max_workers=max(1, min(len(files), DISCOVERY_WORKERS))) as executor:
+                scans = {full_path: executor.submit(Multi.scan_file, full_path) for full_path in files}
+            
+            for full_path, scan in scans.items():
                 try:
-                    extension = os.path.splitext(lfile)[1].lower()
-                    loader = EXT_TO_LOADER[extension]
-                    runner = EXT_TO_RUNNER[extension]
-                    runtime = EXT_TO_RUNTIME[extension]
-
-                    full_path = os.path.join(os.path.realpath(os.curdir), lfile)
-                    result = subprocess.run(
-                        [runtime, loader, full_path],
-                        capture_output=True,
-                        text=True,
-                        check=True
-                    ).stdout
-                    result = result.strip()
-                    
-                    if extension == '.php':
-                        loaded_functions = result.split(',')
-                    elif extension == '.js':
-                        loaded_functions = json.loads(result)
-                    else:
-                        loaded_functions = ast.literal_eval(result)
-                    
-                    for func in loaded_functions:
-                        self.functions[func] = {
-                            'runtime': runtime,
-                            'loader': loader,
-                            'runner': runner,
-                            'module': full_path
-                        }
-                
+                    loaded_functions = scan.result()
                 except Exception as e:
                     continue
+                
+                extension = os.path.splitext(full_path)[1].lower()
+                for func, parameters in loaded_functions.items():
+                    functions[func] = {
+                        'runtime': EXT_TO_RUNTIME[extension],
+                        'loader': EXT_TO_LOADER[extension],
+                        'runner': EXT_TO_RUNNER[extension],
+                        'module': full_path,
+                        'parameters': parameters
+                    }
             
-            for key in self.functions.keys():
-                        self.__setattr__(key, self.anon_function)
+            self.functions = functions
+            self.bind_functions(functions)
             
         except Exception as e:
             return str(e)
@@ -91,31 +144,24 @@ class Multi(Runtime):
         '''
         return [func for func in self.functions.keys()]
     
-    def anon_function(self, *args):
-        args_str = ', '.join(args)
-        try:
-            loaded_function = self.functions[self.current_func]
-            runtime = loaded_function['runtime']
-            runner = loaded_function['runner']
-            module = loaded_function['module']
-            
-            if len(args_str):
-                result = subprocess.run(
-                    [runtime, runner, module, self.current_func, args_str],
-                    capture_output=True,
-                    text=True,
-                    check=True
-                ).stdout
-            else:
-                result = subprocess.run(
-                    [runtime, runner, module, self.current_func],
-                    capture_output=True,
-                    text=True,
-                    check=True
-                ).stdout
-
-            return result.strip()
-        except subprocess.CalledProcessError as e:
-            return e.stderr if e.stderr else str(e)
-        except Exception as e:
-            return str(e)
+    def source_file(self, func: str) -> str:
+        return self.functions[func]['module']
+    
+    def runner_command(self, func: str) -> list:
+        loaded_function = self.functions[func]
+        return [loaded_function['runtime'], loaded_function['runner'], loaded_function['module'], func, '-']
+    
+    def frame_arguments(self, func: str, args) -> tuple[list, dict]:
+        # Only the Python runner binds arguments by name
+        if isinstance(args, dict) and self.is_python(func):
+            return [], dict(args)
+        return super().frame_arguments(func, args)
+    
+    def args_format(self, func: str) -> str:
+        return RUNNER_ARGS_FORMAT if self.is_python(func) else 'json'
+    
+    def is_python(self, func: str) -> bool:
+        return os.path.splitext(self.functions[func]['module'])[1].lower() == '.py'
+    
+    def parameters(self, func: str) -> list:
+        return list(self.functions[func]['parameters'])
@@ -0,0 +1,271 @@
+import os
+import hmac
+import mmap
+import time
+import uuid
+import shutil
+import hashlib
+import secrets
+from pathlib import Path
+from typing import Any, AsyncIterator, Optional, Sequence, Union
+
+from ..constants import PAYLOAD_DIR, PAYLOAD_THRESHOLD
+
+# Runners and warm workers inherit this and write
+# their large binary results next to request bodies
+os.environ.setdefault('RUNIT_PAYLOAD_DIR', str(PAYLOAD_DIR))
+# Handles are signed with this key, shared with runners
+# only, so clients can't forge one pointing at any file
+PAYLOAD_KEY = os.environ.setdefault('RUNIT_PAYLOAD_KEY', secrets.token_hex(32))
+
+HANDLE_KEY = '$payload'
+OCTET_STREAM = 'application/octet-stream'
+
+
+class Payload():
+    '''
+    Large request body, uploaded file or function
+    result kept in a file under the payload directory.
+    Only its handle (path, size, content type and
+    the uploaded file name) crosses
+    process boundaries; the data is memory-mapped
+    by whoever reads it instead of being copied
+    through pipes and JSON.
+    '''
+    __slots__ = ('path', 'size', 'content_type', 'filename')
+
+    def __init__(self, path: Union[str, Path], size: Optional[int] = None, content_type: str = OCTET_STREAM,
+                 filename: Optional[str] = None):
+        self.path = str(path)
+        self.size = os.path.getsize(self.path) if size is None else size
+        self.content_type = content_type or OCTET_STREAM
+        self.filename = filename
+
+    def view(self) -> Union[mmap.mmap, bytes]:
+        '''
+        Read-only memory map of the data. Supports
+        slicing, find() and the buffer protocol.
+
+        @param None
+        @return mmap
+        '''
+        if not self.size:
+            return b''
+        with open(self.path, 'rb') as file:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self) -> bytes:
+        with open(self.path, 'rb') as file:
+            return file.read()
+
+    def open(self):
+        return open(self.path, 'rb')
+
+    @property
+    def owned(self) -> bool:
+        '''
+        Whether the file lives in the payload directory;
+        payloads made from other files are never deleted
+        '''
+        return in_payload_dir(self.path)
+
+    def release(self):
+        '''
+        Delete the file once nobody needs it
+
+        @param None
+        @return None
+        '''
+        if not self.owned:
+            return
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def link(self) -> 'Payload':
+        '''
+        Another owned file with the same data, a
+        hard link where the filesystem allows it,
+        that can be released independently
+
+        @param None
+        @return Payload
+        '''
+        path = new_path()
+        try:
+            os.link(self.path, path)
+        except OSError:
+            shutil.copyfile(self.path, path)
+        return Payload(path, self.size, self.content_type, self.filename)
+
+    def to_handle(self) -> dict:
+        handle = {HANDLE_KEY: self.path, 'size': self.size, 'content_type': self.content_type,
+                  'token': sign(self.path)}
+        if self.filename is not None:
+            handle['filename'] = self.filename
+        return handle
+
+    @classmethod
+    def from_handle(cls, handle: dict) -> 'Payload':
+        return cls(handle[HANDLE_KEY], handle.get('size'), handle.get('content_type'), handle.get('filename'))
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Payload) and other.path == self.path
+
+    def __hash__(self) -> int:
+        return hash(self.path)
+
+    def __repr__(self):
+        return f'Payload({self.path!r}, size={self.size}, content_type={self.content_type!r})'
+
+
+def in_payload_dir(path: str) -> bool:
+    return os.path.dirname(os.path.realpath(path)) == os.path.realpath(PAYLOAD_DIR)
+
+
+def sign(path: str) -> str:
+    return hmac.new(PAYLOAD_KEY.encode(), path.encode(), hashlib.sha256).hexdigest()
+
+
+def is_handle(value: Any) -> bool:
+    '''
+    Whether a value is a handle issued by this server
+    or its runners: signed with the payload key and
+    naming a file in the payload directory. Lookalike
+    dicts sent by clients are not.
+
+    @param value Decoded value
+    @return bool
+    '''
+    if not isinstance(value, dict):
+        return False
+    path, token = value.get(HANDLE_KEY), value.get('token')
+    if not isinstance(path, str) or not isinstance(token, str):
+        return False
+    return hmac.compare_digest(token, sign(path)) and in_payload_dir(path)
+
+
+def resolve(value: Any) -> Any:
+    '''
+    Payload for a handle a runner sent back, any
+    other value (including forged handles) unchanged
+
+    @param value Decoded value
+    @return Payload|Any
+    '''
+    return Payload.from_handle(value) if is_handle(value) else value
+
+
+def to_handles(args: Sequence, kwargs: dict) -> tuple[list, dict]:
+    '''
+    Replace payloads in runner arguments with their
+    handles, so the frame carries paths, not data
+
+    @param args Positional arguments
+    @param kwargs Named arguments
+    @return tuple (args, kwargs)
+    '''
+    def handle(value):
+        if isinstance(value, list):
+            return [handle(item) for item in value]
+        return value.to_handle() if isinstance(value, Payload) else value
+    return [handle(value) for value in args], {name: handle(value) for name, value in kwargs.items()}
+
+
+def payloads_in(args: Any) -> list[Payload]:
+    '''
+    Payloads among request arguments, including
+    repeated form fields holding several files
+
+    @param args Request arguments
+    @return list
+    '''
+    values = args.values() if isinstance(args, dict) else args if isinstance(args, list) else ()
+    found = []
+    for value in values:
+        if isinstance(value, list):
+            found.extend(item for item in value if isinstance(item, Payload))
+        elif isinstance(value, Payload):
+            found.append(value)
+    return found
+
+
+def new_path() -> Path:
+    directory = Path(PAYLOAD_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / uuid.uuid4().hex
+
+
+def write(data: bytes, content_type: str = OCTET_STREAM) -> Payload:
+    '''
+    Store data as a payload file
+
+    @param data Bytes-like data
+    @param content_type Media type of the data
+    @return Payload
+    '''
+    path = new_path()
+    with open(path, 'wb') as file:
+        file.write(data)
+    return Payload(path, len(memoryview(data)), content_type)
+
+
+async def spool(chunks: AsyncIterator[bytes], content_type: str = OCTET_STREAM,
+                threshold: int = PAYLOAD_THRESHOLD) -> Union[bytes, Payload]:
+    '''
+    Read a request body, keeping it in memory while
+    it is small and moving it to a payload file as
+    soon as it grows past `threshold` bytes
+
+    @param chunks Body chunks as they arrive
+    @param content_type Media type of the body
+    @param threshold Largest body kept in memory
+    @return bytes|Payload
+    '''
+    buffer = bytearray()
+    file, path, size = None, None, 0
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if file is None:
+                buffer += chunk
+                if len(buffer) <= threshold:
+                    continue
+                path = new_path()
+                file = open(path, 'wb')
+                chunk, buffer = buffer, None
+            file.write(chunk)
+    except BaseException:
+        if file is not None:
+            file.close()
+            os.unlink(path)
+        raise
+
+    if file is None:
+        return bytes(buffer)
+    file.close()
+    return Payload(path, size, content_type)
+
+
+def sweep(max_age: float = 3600):
+    '''
+    Delete payload files left behind by calls
+    that never finished, e.g. after a crash
+
+    @param max_age Age in seconds after which files are removed
+    @return None
+    '''
+    directory = Path(PAYLOAD_DIR)
+    if not directory.is_dir():
+        return
+    expired = time.time() - max_age
+    for path in directory.iterdir():
+        try:
+            if path.stat().st_mtime < expired:
+                path.unlink()
+        except OSError:
+            pass
@@ -1,5 +1,6 @@
 import os
 from .runtime import Runtime
+from ..constants import PHP_WORKER_MAX_REQUESTS
 
 PHP_TOOLS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..','tools', 'php')
 
@@ -10,6 +11,8 @@ class PHP(Runtime):
     '''
     LOADER = os.path.realpath(os.path.join(PHP_TOOLS_DIR, 'loader.php'))
     RUNNER = os.path.realpath(os.path.join(PHP_TOOLS_DIR, 'runner.php'))
+    WORKER = os.path.realpath(os.path.join(PHP_TOOLS_DIR, 'worker.php'))
+    WORKER_MAX_REQUESTS = PHP_WORKER_MAX_REQUESTS
     
     def __init__(self, filename, runtime, is_file, is_docker, project_id):
         super().__init__(filename, runtime, is_file, is_docker, project_id)
@@ -0,0 +1,155 @@
+import os
+import gc
+import sys
+import zlib
+import asyncio
+import threading
+import importlib.util
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Union
+
+from ..constants import PROCESS_POOL_SIZE
+from .callplan import CallPlan
+
+# Set in each pool process by `_initialize`
+_module = None
+_module_error: Optional[Exception] = None
+_plans: Dict[str, CallPlan] = {}
+
+
+def _initialize(module: str):
+    global _module, _module_error
+    try:
+        directory = os.path.dirname(module)
+        env_path = os.path.join(directory, '.env')
+        if os.path.exists(env_path):
+            from dotenv import load_dotenv
+            load_dotenv(env_path)
+        if directory not in sys.path:
+            sys.path.insert(0, directory)
+
+        spec = importlib.util.spec_from_file_location('runit_module', module)
+        _module = importlib.util.module_from_spec(spec)
+        sys.modules['runit_module'] = _module
+        spec.loader.exec_module(_module)
+        # The imported heap lives as long as the process; keep
+        # the collector from rescanning it on every call
+        gc.freeze()
+    except Exception as e:
+        _module_error = e
+
+
+def _warm() -> int:
+    return os.getpid()
+
+
+def _call(func_name: str, args: Union[list, dict]):
+    if _module_error is not None:
+        raise _module_error
+
+    if func_name not in _plans:
+        func = getattr(_module, func_name, None)
+        if not callable(func):
+            raise AttributeError(f'No function found by the name: {func_name}')
+        _plans[func_name] = CallPlan(func)
+
+    plan = _plans[func_name]
+    positional, keywords = plan.bind(args)
+    if plan.is_coroutine:
+        return asyncio.run(plan.func(*positional, **keywords))
+    return plan.func(*positional, **keywords)
+
+
+class ProcessPool():
+    '''
+    Pre-warmed processes with a project module
+    already imported, for CPU-bound functions that
+    would otherwise serialize on the server's GIL.
+    Calls to the same function stick to the same
+    process while it is free, so its caches stay
+    warm, and spill to the least busy one otherwise.
+    '''
+    _pools: Dict[str, 'ProcessPool'] = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, module: str, size: int = PROCESS_POOL_SIZE, generation: Any = None):
+        self.module = module
+        self.size = max(1, size)
+        self.generation = generation
+        methods = multiprocessing.get_all_start_methods()
+        # Forking the threaded server directly is unsafe; a
+        # forkserver gives cheap, clean children where available
+        self._context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        self._lock = threading.Lock()
+        self.executors = [self._spawn() for _ in range(self.size)]
+        self.inflight = [0] * self.size
+
+    @classmethod
+    def get(cls, module: str, generation: Any = None, **kwargs) -> 'ProcessPool':
+        '''
+        Return the shared pool for `module`, replacing it
+        when the module generation (e.g. mtime) changed
+        '''
+        with cls._pools_lock:
+            pool = cls._pools.get(module)
+            if pool is not None and pool.generation != generation:
+                pool.shutdown()
+                pool = None
+            if pool is None:
+                pool = cls(module, generation=generation, **kwargs)
+                cls._pools[module] = pool
+            return pool
+
+    @classmethod
+    def shutdown_all(cls, wait: bool = False):
+        with cls._pools_lock:
+            pools, cls._pools = cls._pools, {}
+        for pool in pools.values():
+            pool.shutdown(wait)
+
+    def _spawn(self) -> ProcessPoolExecutor:
+        executor = ProcessPoolExecutor(1, mp_context=self._context,
+                                       initializer=_initialize, initargs=(self.module,))
+        # Start the process and import the module ahead of the first call
+        executor.submit(_warm)
+        return executor
+
+    def _slot(self, func: str) -> int:
+        preferred = zlib.crc32(func.encode()) % self.size
+        if not self.inflight[preferred]:
+            return preferred
+        return min(range(self.size), key=self.inflight.__getitem__)
+
+    def _release(self, index: int):
+        with self._lock:
+            self.inflight[index] = max(0, self.inflight[index] - 1)
+
+    def submit(self, func: str, args: Union[list, dict]) -> Future:
+        '''
+        Run `func` with `args` in one of the pool processes
+
+        @param func Function name
+        @param args Positional arguments, or values by name
+        @return Future Resolves to the function result
+        '''
+        with self._lock:
+            index = self._slot(func)
+            try:
+                future = self.executors[index].submit(_call, func, args)
+            except BrokenProcessPool:
+                # The process died (e.g. killed by the OOM killer); replace it
+                self.executors[index].shutdown(wait=False)
+                self.executors[index] = self._spawn()
+                self.inflight[index] = 0
+                future = self.executors[index].submit(_call, func, args)
+            self.inflight[index] += 1
+        future.add_done_callback(lambda _: self._release(index))
+        return future
+
+    def shutdown(self, wait: bool = False):
+        with self._lock:
+            executors, self.executors = self.executors, []
+        for executor in executors:
+            executor.shutdown(wait=wait, cancel_futures=True)
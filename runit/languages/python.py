@@ -4,10 +4,14 @@ import ast
 import time
 import inspect
 import asyncio
+import threading
 import importlib.util
-from typing import Callable, Dict, Any, Optional
+from typing import Callable, Dict, Any, Optional, Sequence, Union
 
 from .runtime import Runtime
+from .discovery import scan_python
+from .processes import ProcessPool
+from .callplan import CallPlan, compile_plans
 
 PY_TOOLS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'tools', 'python')
 
@@ -18,22 +22,43 @@ class Python(Runtime):
     '''
     LOADER = os.path.realpath(os.path.join(PY_TOOLS_DIR, 'loader.py'))
     RUNNER = os.path.realpath(os.path.join(PY_TOOLS_DIR, 'runner.py'))
+    # The zygote forks a child per call, so one warm process per project is enough
+    WORKER = os.path.realpath(os.path.join(PY_TOOLS_DIR, 'zygote.py')) if hasattr(os, 'fork') else ''
+    WORKERS = 1
+    KEYWORD_ARGUMENTS = True
+    ARGS_FORMATS = ('json', 'msgpack')
     
     _module_cache: Dict[str, Any] = {}
     _module_mtimes: Dict[str, float] = {}
+    _module_plans: Dict[str, Dict[str, CallPlan]] = {}
 
     def __init__(self, filename, runtime, is_file=False, is_docker=False, project_id=''):
         self._loaded_module = None
         self._loaded_functions: Dict[str, Callable] = {}
+        self._plans: Dict[str, CallPlan] = {}
+        self._load_attempted = False
+        self._load_lock = threading.Lock()
+        self.signatures: Dict[str, dict] = {}
         self.module = os.path.realpath(os.path.join(os.curdir, filename))
         
-        if not is_file and not is_docker:
-            self._load_module_in_memory()
-        
         super().__init__(filename, runtime, is_file, is_docker, project_id)
 
-    def _load_module_in_memory(self):
+    @property
+    def in_memory(self) -> bool:
+        return not self.is_file and not self.is_docker
+
+    def _load_module_in_memory(self) -> bool:
         """Load the Python module directly into memory for faster execution."""
+        if self._load_attempted:
+            return self._loaded_module is not None
+        
+        with self._load_lock:
+            if not self._load_attempted:
+                self._import_module()
+                self._load_attempted = True
+        return self._loaded_module is not None
+
+    def _import_module(self):
         if not os.path.exists(self.module):
             return
             
@@ -61,10 +86,11 @@ class Python(Runtime):
                 
                 Python._module_cache[module_key] = self._loaded_module
                 Python._module_mtimes[module_key] = mtime
+                Python._module_plans.pop(module_key, None)
                 
                 self._extract_functions_from_module()
         except Exception as e:
-            pass
+            self._loaded_module = None
 
     def _extract_functions_from_module(self):
         """Extract callable functions from the loaded module."""
@@ -74,84 +100,84 @@ class Python(Runtime):
         for name, obj in inspect.getmembers(self._loaded_module):
             if inspect.isfunction(obj) and not name.startswith('_'):
                 self._loaded_functions[name] = obj
+        
+        # Plans are compiled once per import and shared by every
+        # parser built on the same module until it changes
+        if self.module not in Python._module_plans:
+            Python._module_plans[self.module] = compile_plans(self._loaded_functions)
+        self._plans = Python._module_plans[self.module]
+
+    def is_generator(self, func_name: str) -> bool:
+        """Whether an in-memory function yields results that should be streamed."""
+        if not self.in_memory:
+            return False
+        plan = self._plans.get(func_name)
+        if plan is not None:
+            return plan.is_generator
+        return bool(self.signatures.get(func_name, {}).get('is_generator'))
+
+    def prepare(self, func: str):
+        """Import the module, so coroutine functions are known before the first call is dispatched."""
+        if self.in_memory:
+            self._load_module_in_memory()
+
+    def is_coroutine(self, func_name: str) -> bool:
+        """Whether a coroutine function is loaded in memory and can be awaited natively."""
+        if not self.in_memory or not self._load_attempted:
+            return False
+        plan = self._plans.get(func_name)
+        return plan is not None and plan.is_coroutine
+
+    def process_pool(self) -> ProcessPool:
+        """Shared pool of warm processes with this module imported, for CPU-bound functions."""
+        return ProcessPool.get(self.module, generation=os.path.getmtime(self.module))
 
     def load_functions_from_supported_files(self):
-        """Load function metadata, using in-memory module if available."""
+        """Load function metadata statically, importing the module only when it has to."""
         try:
-            if self._loaded_functions:
-                self.functions = {name: list(inspect.signature(func).parameters.keys()) 
-                                 for name, func in self._loaded_functions.items()}
+            signatures = scan_python(self.module) if os.path.exists(self.module) else None
+            if signatures is not None:
+                self.signatures = signatures
+                self.functions = {name: signature['parameters'] 
+                                 for name, signature in signatures.items()}
+            elif self.in_memory and self._load_module_in_memory():
+                self.functions = {name: list(plan.parameters) 
+                                 for name, plan in self._plans.items()}
             else:
                 super().load_functions_from_supported_files()
             
-            for key in self.functions.keys():
-                self.__setattr__(key, self.anon_function)
+            self.bind_functions(self.functions)
         except Exception as e:
             return str(e)
 
-    def anon_function(self, *args):
-        """Execute function in-memory if available, otherwise fall back to subprocess."""
-        func_name = self.current_func
+    def invoke(self, func: str, args: Union[Sequence, dict] = ()):
+        """Execute function in-memory if available, otherwise fall back to the zygote or a subprocess."""
+        if self.in_memory and self._load_module_in_memory() and func in self._plans:
+            return self._execute_in_memory(func, args)
         
-        if func_name in self._loaded_functions:
-            return self._execute_in_memory(func_name, *args)
-        
-        return super().anon_function(*args)
+        return super().invoke(func, args)
 
-    def _execute_in_memory(self, func_name: str, *args):
+    def _execute_in_memory(self, func_name: str, args: Union[Sequence, dict] = ()):
         """Execute a function directly in memory."""
-        try:
-            func = self._loaded_functions[func_name]
-            sig = inspect.signature(func)
-            params = list(sig.parameters.keys())
-            
-            if asyncio.iscoroutinefunction(func):
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    if len(params) and args:
-                        result = loop.run_until_complete(func(*args))
-                    else:
-                        result = loop.run_until_complete(func())
-                finally:
-                    loop.close()
-            else:
-                if len(params) and args:
-                    result = func(*args)
-                else:
-                    result = func()
-            
-            return result
-        except Exception as e:
-            return str(e)
+        plan = self._plans[func_name]
+        positional, keywords = plan.bind(args)
+        
+        if plan.is_coroutine:
+            return asyncio.run(plan.func(*positional, **keywords))
+        return plan.func(*positional, **keywords)
 
-    async def anon_function_async(self, *args):
+    async def invoke_async(self, func: str, args: Union[Sequence, dict] = ()):
         """Async version for use in async web servers."""
-        func_name = self.current_func
-        
-        if func_name in self._loaded_functions:
-            return await self._execute_in_memory_async(func_name, *args)
+        if self.in_memory and self._load_module_in_memory() and func in self._plans:
+            return await self._execute_in_memory_async(func, args)
         
-        return self.anon_function(*args)
+        return self.invoke(func, args)
 
-    async def _execute_in_memory_async(self, func_name: str, *args):
+    async def _execute_in_memory_async(self, func_name: str, args: Union[Sequence, dict] = ()):
         """Execute a function in memory, handling async functions properly."""
-        try:
-            func = self._loaded_functions[func_name]
-            sig = inspect.signature(func)
-            params = list(sig.parameters.keys())
-            
-            if asyncio.iscoroutinefunction(func):
-                if len(params) and args:
-                    result = await func(*args)
-                else:
-                    result = await func()
-            else:
-                if len(params) and args:
-                    result = func(*args)
-                else:
-                    result = func()
-            
-            return result
-        except Exception as e:
-            return str(e)
+        plan = self._plans[func_name]
+        positional, keywords = plan.bind(args)
+        
+        if plan.is_coroutine:
+            return await plan.func(*positional, **keywords)
+        return plan.func(*positional, **keywords)
@@ -1,12 +1,22 @@
+import io
 import os
 import ast
+import json
 import time
+import signal
+import tempfile
+import threading
 import subprocess
-from typing import Callable
-from datetime import datetime, timedelta
+from typing import Optional, Sequence, Union
 
 from dotenv import load_dotenv
-from ..constants import EXT_TO_RUNTIME
+from ..constants import WORKER_POOL_SIZE, RUNNER_ARGS_FORMAT
+from .cache import FunctionCache
+from .discovery import scan_functions
+from .workers import WorkerPool, WorkerError
+from .streams import Stream
+from .envelope import FunctionError, ENVELOPE_MARKER, read_output, encode_frame
+from .payloads import resolve, to_handles
 
 load_dotenv()
 
@@ -17,8 +27,19 @@ class Runtime():
     '''
     LOADER = ""
     RUNNER = ""
-    _function_cache = {}
+    WORKER = ""
+    WORKERS = WORKER_POOL_SIZE
+    WORKER_MAX_REQUESTS = 0
+    LAZY_DISCOVERY = False
+    # Whether the runner can bind arguments by name,
+    # and which stdin encodings it understands
+    KEYWORD_ARGUMENTS = False
+    ARGS_FORMATS = ('json',)
     _cache_ttl = 300
+    _function_cache = FunctionCache(digest_ttl=_cache_ttl)
+    # Runner processes of calls in progress, stopped on shutdown
+    _runners: set = set()
+    _runners_lock = threading.Lock()
     
     def __init__(self, filename="", runtime="", is_file = False, is_docker=False, project_id=''):
         self.filename = filename
@@ -28,9 +49,85 @@ class Runtime():
         self.project_id = project_id
         self.module = os.path.realpath(os.path.join(os.curdir, self.filename))
         self.functions = {}
+        self._local = threading.local()
         self.current_func: str = 'index'
-        self.load_functions_from_supported_files()
+        if not self.LAZY_DISCOVERY:
+            self.load_functions_from_supported_files()
     
+    @property
+    def current_func(self) -> str:
+        '''
+        Function the next anon_function call runs.
+        Only used by anon_function; servers call
+        invoke() with the function name instead.
+        '''
+        return getattr(self._local, 'current_func', 'index')
+
+    @current_func.setter
+    def current_func(self, func: str):
+        self._local.current_func = func
+
+    def bind_functions(self, functions: dict):
+        '''
+        Expose each discovered function as a method
+        of the parser that invokes it by name
+
+        @param functions Discovered functions
+        @return None
+        '''
+        for name in functions:
+            if not hasattr(type(self), name):
+                self.__setattr__(name, lambda *args, func=name: self.invoke(func, args))
+
+    def parameters(self, func: str) -> list:
+        '''
+        Parameter names of a discovered function
+
+        @param func Function name
+        @return list
+        '''
+        return list(self.functions[func])
+
+    def source_file(self, func: str) -> str:
+        '''
+        File a function is defined in
+
+        @param func Function name
+        @return str
+        '''
+        return self.module
+
+    def is_generator(self, func: str) -> bool:
+        '''
+        Whether `func` is known to yield its
+        result incrementally
+
+        @param func Function name
+        @return bool
+        '''
+        return False
+
+    def is_coroutine(self, func: str) -> bool:
+        '''
+        Whether `func` can be awaited directly on
+        the caller's event loop
+
+        @param func Function name
+        @return bool
+        '''
+        return False
+
+    def prepare(self, func: str):
+        '''
+        Load whatever calling `func` needs ahead of
+        the call; run off the event loop, so that
+        deciding how to call it doesn't block
+
+        @param func Function name
+        @return None
+        '''
+        pass
+
     def load_functions_from_supported_files(self):
         '''
         Class method for loading exported
@@ -41,17 +138,19 @@ class Runtime():
         '''
         
         try:
-            if os.path.exists(self.module):
-                mtime = os.path.getmtime(self.module)
-                cache_key = (self.module, mtime)
-                
-                if cache_key in Runtime._function_cache:
-                    cached_data = Runtime._function_cache[cache_key]
-                    if time.time() - cached_data['timestamp'] < Runtime._cache_ttl:
-                        self.functions = cached_data['functions']
-                        for key in self.functions.keys():
-                            self.__setattr__(key, self.anon_function)
-                        return
+            functions = self.static_functions()
+            if functions is not None:
+                self.functions = functions
+                self.bind_functions(functions)
+                return
+            
+            cache_key = self.cache_key()
+            if cache_key:
+                functions = Runtime._function_cache.lookup(cache_key)
+                if functions is not None:
+                    self.functions = functions
+                    self.bind_functions(functions)
+                    return
             
             if self.is_docker:
                 import docker
@@ -70,20 +169,40 @@ class Runtime():
             
             self.functions = ast.literal_eval(result)
             
-            if os.path.exists(self.module):
-                mtime = os.path.getmtime(self.module)
-                cache_key = (self.module, mtime)
-                Runtime._function_cache[cache_key] = {
-                    'functions': self.functions,
-                    'timestamp': time.time()
-                }
+            if cache_key:
+                Runtime._function_cache.store(cache_key, self.functions)
             
-            for key in self.functions.keys():
-                self.__setattr__(key, self.anon_function)
+            self.bind_functions(self.functions)
                 
         except Exception as e:
             return str(e)
         
+    def static_functions(self) -> Optional[dict]:
+        '''
+        Functions found by reading the source
+        without running it, None when the
+        loader has to be used instead
+
+        @param None
+        @return dict|None
+        '''
+        if not os.path.exists(self.module):
+            return None
+        return scan_functions(self.module)
+
+    def cache_key(self):
+        '''
+        Key of this module's metadata in the
+        function cache, None if it can't be cached
+
+        @param None
+        @return str|None
+        '''
+        if not os.path.exists(self.module):
+            return None
+        runtime = f'docker:{self.project_id}' if self.is_docker else self.iruntime
+        return Runtime._function_cache.make_key(self.module, self.LOADER, runtime)
+        
     def list_functions(self):
         '''
         List Class methods
@@ -93,38 +212,243 @@ class Runtime():
         '''
         return [func for func in self.functions]
 
-    def anon_function(self, *args):
-        args_str = ', '.join(args)
+    def worker_pool(self) -> WorkerPool:
+        '''
+        Shared pool of warm workers for this module,
+        restarted whenever the module changes on disk
+
+        @param None
+        @return WorkerPool
+        '''
+        return WorkerPool.get(
+            f'{self.iruntime}:{self.module}',
+            [self.iruntime, self.WORKER],
+            generation=os.path.getmtime(self.module),
+            size=self.WORKERS,
+            max_requests=self.WORKER_MAX_REQUESTS,
+            cwd=os.path.dirname(self.module)
+        )
+
+    def call_worker(self, func: str, *args, **kwargs):
+        args, kwargs = to_handles(args, kwargs)
+        request = {'module': self.module, 'function': func, 'args': args}
+        if kwargs:
+            request['kwargs'] = kwargs
+        response = self.worker_pool().call(request)
+        if 'error' in response:
+            raise FunctionError(str(response['error']))
+        return resolve(response.get('result'))
+
+    def frame_arguments(self, func: str, args: Union[Sequence, dict]) -> tuple[list, dict]:
+        '''
+        Split request arguments into what the runner
+        takes positionally and by name. Named values
+        are put in parameter order for runners that
+        only take positional arguments.
+
+        @param func Function name
+        @param args Request arguments
+        @return tuple (args, kwargs)
+        '''
+        if not isinstance(args, dict):
+            return list(args), {}
+        if self.KEYWORD_ARGUMENTS:
+            return [], dict(args)
+        parameters = self.parameters(func) if func in self.functions else []
+        ordered = [args[name] for name in parameters if name in args]
+        return (ordered if ordered else list(args.values())), {}
+
+    def args_format(self, func: str) -> str:
+        return RUNNER_ARGS_FORMAT if RUNNER_ARGS_FORMAT in self.ARGS_FORMATS else 'json'
+
+    def runner_command(self, func: str) -> list:
+        # "-" tells the runner to read its arguments from stdin
+        return [self.iruntime, self.RUNNER, self.module, func, '-']
+
+    def runner_input(self, func: str, args: Union[Sequence, dict]) -> tuple[bytes, dict]:
+        '''
+        Arguments frame for the runner's stdin and
+        the environment telling it how it is encoded
+
+        @param func Function name
+        @param args Request arguments
+        @return tuple (frame bytes, environment)
+        '''
+        # Large payloads travel as handles to their files
+        positional, named = to_handles(*self.frame_arguments(func, args))
+        format = self.args_format(func)
+        frame = encode_frame({'args': positional, 'kwargs': named}, format)
+        return frame, {**os.environ, 'RUNIT_ARGS_FORMAT': format}
+
+    def invoke(self, func: str, args: Union[Sequence, dict] = ()):
+        '''
+        Run a function with the given arguments.
+        Nothing is stored on the parser, so calls
+        may run concurrently from any thread.
+
+        @param func Function name
+        @param args Positional arguments, or values by name
+        @return Function result
+        @raises FunctionError When the function fails
+        '''
+        if self.WORKER and WORKER_POOL_SIZE and not self.is_file and not self.is_docker:
+            positional, named = self.frame_arguments(func, args)
+            try:
+                return self.call_worker(func, *positional, **named)
+            except WorkerError as e:
+                raise FunctionError(str(e))
+        
         try:
-            if len(args):
-                if self.is_file:
-                    return subprocess.run(
-                        [self.iruntime, self.filename, args_str],
-                        check=True
-                    ).returncode
-                else:
-                    result = subprocess.run(
-                        [self.iruntime, self.RUNNER, self.module, self.current_func, args_str],
-                        capture_output=True,
-                        text=True,
-                        check=True
-                    ).stdout
-            else:
-                if self.is_file:
-                    return subprocess.run(
-                        [self.iruntime, self.filename],
-                        check=True
-                    ).returncode
-                else:
-                    result = subprocess.run(
-                        [self.iruntime, self.RUNNER, self.module, self.current_func],
-                        capture_output=True,
-                        text=True,
-                        check=True
-                    ).stdout
-
-            return result.strip()
+            if self.is_file:
+                args = list(args.values()) if isinstance(args, dict) else list(args)
+                command = [self.iruntime, self.filename, ', '.join(args)] if len(args) else [self.iruntime, self.filename]
+                process = Runtime.start_runner(command, capture=False)
+                code = Runtime.wait_runner(process)[0]
+                if code:
+                    raise subprocess.CalledProcessError(code, command)
+                return code
+            
+            # Arguments go over stdin so they keep their types and
+            # aren't limited by the size of the command line
+            frame, env = self.runner_input(func, args)
+            command = self.runner_command(func)
+            code, result, errors = Runtime.wait_runner(Runtime.start_runner(command, env=env), frame)
+            if code:
+                raise subprocess.CalledProcessError(code, command, result, errors)
+            return resolve(read_output(result.decode(errors='replace')))
         except subprocess.CalledProcessError as e:
-            return e.stderr if e.stderr else str(e)
-        except Exception as e:
-            return str(e)
+            raise FunctionError(e.stderr.decode(errors='replace') if e.stderr else str(e))
+
+    async def invoke_async(self, func: str, args: Union[Sequence, dict] = ()):
+        '''
+        Awaitable counterpart of invoke() for
+        functions that can run on the event loop
+
+        @param func Function name
+        @param args Positional arguments
+        @return Function result
+        '''
+        return self.invoke(func, args)
+
+    def stream(self, func: str, args: Union[Sequence, dict] = ()) -> Stream:
+        '''
+        Run a function through its runner and stream
+        its stdout line by line as it is printed
+
+        @param func Function name
+        @param args Positional arguments, or values by name
+        @return Stream Lines of output
+        '''
+        command = self.runner_command(func)
+        frame, env = self.runner_input(func, args)
+        # Runners write generator items as they are produced, and
+        # stdout must reach the pipe line by line, not on exit
+        env = {**env, 'RUNIT_STREAM': '1', 'PYTHONUNBUFFERED': '1'}
+
+        def lines():
+            with tempfile.TemporaryFile() as errors:
+                process = Runtime.start_runner(command, env=env, stderr=errors)
+                try:
+                    process.stdin.write(frame)
+                    process.stdin.close()
+                    for line in io.TextIOWrapper(process.stdout, errors='replace'):
+                        line = line.rstrip('\n')
+                        if not line.startswith(ENVELOPE_MARKER):
+                            yield line
+                            continue
+                        envelope = json.loads(line[len(ENVELOPE_MARKER):])
+                        if envelope.get('status') != 'ok':
+                            yield envelope.get('error') or 'Function failed'
+                        elif envelope.get('value') is not None:
+                            yield json.dumps(envelope['value'], default=str)
+                    if process.wait() != 0:
+                        errors.seek(0)
+                        yield errors.read().decode(errors='replace').strip()
+                finally:
+                    if process.poll() is None:
+                        Runtime.signal_runner(process, signal.SIGKILL)
+                        process.wait()
+                    process.stdout.close()
+                    Runtime.forget_runner(process)
+        return Stream(lines(), encoded=True)
+
+    @classmethod
+    def start_runner(cls, command: list, env: Optional[dict] = None, capture: bool = True,
+                     stderr=subprocess.PIPE) -> subprocess.Popen:
+        '''
+        Start a runner process and track it until
+        its call finishes. It gets its own process
+        group, so it and anything it spawns can be
+        stopped together on shutdown.
+
+        @param command Runner command line
+        @param env Environment of the runner
+        @param capture Whether stdin and stdout are piped
+        @param stderr Where the runner's stderr goes
+        @return Popen
+        '''
+        pipe = subprocess.PIPE if capture else None
+        process = subprocess.Popen(command, stdin=pipe, stdout=pipe, stderr=stderr if capture else None,
+                                   env=env, bufsize=0, start_new_session=True)
+        with cls._runners_lock:
+            cls._runners.add(process)
+        return process
+
+    @classmethod
+    def wait_runner(cls, process: subprocess.Popen, input: Optional[bytes] = None) -> tuple:
+        '''
+        Send a runner its input and wait for it to exit
+
+        @param process Process from start_runner()
+        @param input Arguments frame
+        @return tuple (exit code, stdout, stderr)
+        '''
+        try:
+            stdout, stderr = process.communicate(input)
+        except BaseException:
+            cls.signal_runner(process, signal.SIGKILL)
+            process.wait()
+            raise
+        finally:
+            cls.forget_runner(process)
+        return process.returncode, stdout, stderr
+
+    @classmethod
+    def forget_runner(cls, process: subprocess.Popen):
+        with cls._runners_lock:
+            cls._runners.discard(process)
+
+    @staticmethod
+    def signal_runner(process: subprocess.Popen, signum: int):
+        try:
+            os.killpg(process.pid, signum)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    @classmethod
+    def stop_runners(cls, timeout: float = 0.0) -> int:
+        '''
+        Terminate the runners of calls still in
+        progress, killing those that outlive `timeout`
+
+        @param timeout Seconds they get to exit after SIGTERM
+        @return int Number of runners stopped
+        '''
+        with cls._runners_lock:
+            runners, cls._runners = cls._runners, set()
+        for process in runners:
+            cls.signal_runner(process, signal.SIGTERM)
+        deadline = time.monotonic() + timeout
+        for process in runners:
+            try:
+                process.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                cls.signal_runner(process, signal.SIGKILL)
+                process.wait()
+        return len(runners)
+
+    def anon_function(self, *args):
+        return self.invoke(self.current_func, args)
+
+    async def anon_function_async(self, *args):
+        return await self.invoke_async(self.current_func, args)
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+# share(result, last) gives each caller its own copy of a
+# result it can't share; `last` is the final caller to get it
+Share = Optional[Callable[[Any, bool], Any]]
+
+
+class SingleFlight():
+    '''
+    Collapses concurrent calls that share a key
+    into one execution. Callers arriving while it
+    is in flight wait for it and get its result
+    (or exception); the next call after it
+    finishes runs again.
+    '''
+
+    def __init__(self):
+        self._calls: Dict[Hashable, list] = {}
+        self._tasks: Dict[Hashable, list] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, share: Share = None) -> Any:
+        '''
+        Run `fn(*args)` unless a call with `key`
+        is already running in another thread
+
+        @param key Identity of the call
+        @param fn Function to run
+        @param share Called with the result for every caller
+        @return Result of the shared call
+        '''
+        with self._lock:
+            entry = self._calls.get(key)
+            leader = entry is None
+            if leader:
+                entry = self._calls[key] = [Future(), 0]
+            entry[1] += 1
+        future = entry[0]
+
+        if leader:
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+
+        try:
+            result = future.result()
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                last = entry[1] == 0
+        return share(result, last) if share is not None else result
+
+    async def do_async(self, key: Hashable, fn: Callable[..., Awaitable], *args, share: Share = None) -> Any:
+        '''
+        Await `fn(*args)` unless a call with `key`
+        is already pending on this event loop. A
+        waiter being cancelled doesn't cancel the
+        shared call.
+
+        @param key Identity of the call
+        @param fn Coroutine function to run
+        @param share Called with the result for every caller
+        @return Result of the shared call
+        '''
+        key = (id(asyncio.get_running_loop()), key)
+        entry = self._tasks.get(key)
+        if entry is None or entry[0].done():
+            task = asyncio.ensure_future(fn(*args))
+            entry = self._tasks[key] = [task, 0]
+            task.add_done_callback(lambda done: self._forget(key, done))
+        entry[1] += 1
+        try:
+            result = await asyncio.shield(entry[0])
+        finally:
+            entry[1] -= 1
+        return share(result, entry[1] == 0) if share is not None else result
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        entry = self._tasks.get(key)
+        if entry is not None and entry[0] is task:
+            del self._tasks[key]
+
+    def __len__(self) -> int:
+        return len(self._calls) + len(self._tasks)
@@ -0,0 +1,60 @@
+import asyncio
+import inspect
+from concurrent.futures import Executor
+from typing import Any, AsyncIterator, Optional
+
+_DONE = object()
+
+
+def is_stream(value: Any) -> bool:
+    return inspect.isgenerator(value) or inspect.isasyncgen(value) or isinstance(value, Stream)
+
+
+class Stream():
+    '''
+    Result of a function that produces its output
+    incrementally: the items of a (async) generator,
+    or lines a runner already encoded and printed.
+    Items are consumed once, as they are produced.
+    '''
+
+    def __init__(self, items: Any, encoded: bool = False):
+        self.items = items
+        self.encoded = encoded
+
+    async def iterate(self, executor: Optional[Executor] = None) -> AsyncIterator[Any]:
+        '''
+        Iterate the items on the event loop; blocking
+        generators are advanced on `executor`
+
+        @param executor Executor for sync generators
+        @return AsyncIterator
+        '''
+        if inspect.isasyncgen(self.items) or hasattr(self.items, '__aiter__'):
+            async for item in self.items:
+                yield item
+            return
+
+        loop = asyncio.get_running_loop()
+        iterator = iter(self.items)
+        try:
+            while True:
+                item = await loop.run_in_executor(executor, next, iterator, _DONE)
+                if item is _DONE:
+                    break
+                yield item
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                await loop.run_in_executor(executor, close)
+
+    def collect(self) -> list:
+        '''
+        All items at once, for callers that
+        cannot consume a stream (e.g. the CLI)
+        '''
+        if inspect.isasyncgen(self.items):
+            async def drain():
+                return [item async for item in self.items]
+            return asyncio.run(drain())
+        return list(self.items)
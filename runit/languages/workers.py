@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import signal
+import itertools
+import threading
+import subprocess
+from concurrent.futures import Future, TimeoutError
+from typing import Any, Dict, Optional
+
+from ..constants import WORKER_POOL_SIZE, WORKER_TIMEOUT
+
+
+class WorkerError(RuntimeError):
+    '''
+    Raised when a worker process dies or
+    reports a failed invocation
+    '''
+    pass
+
+
+class Worker():
+    '''
+    Long-lived interpreter process speaking
+    newline-delimited JSON over stdin/stdout.
+    Several requests can be in flight at once;
+    responses are matched back by id.
+    '''
+
+    def __init__(self, command: list[str], cwd: Optional[str] = None):
+        self.command = command
+        self.served = 0
+        self.retiring = False
+        self.stuck = False
+        self._pending: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=cwd,
+            text=True,
+            bufsize=1,
+            # Its own process group, so stopping it also stops
+            # whatever it forked (e.g. the zygote's children)
+            start_new_session=True
+        )
+        self._reader = threading.Thread(target=self._read_responses, daemon=True)
+        self._reader.start()
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    @property
+    def inflight(self) -> int:
+        return len(self._pending)
+
+    def submit(self, request_id: int, payload: dict) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if not self.alive:
+                raise WorkerError(f'Worker {self.process.pid} is not running')
+            self._pending[request_id] = future
+            self.served += 1
+            try:
+                self.process.stdin.write(json.dumps({'id': request_id, **payload}) + '\n') # type: ignore
+                self.process.stdin.flush() # type: ignore
+            except (BrokenPipeError, OSError, ValueError) as e:
+                self._pending.pop(request_id, None)
+                raise WorkerError(f'Worker {self.process.pid} crashed: {e}')
+        return future
+
+    def _read_responses(self):
+        for line in self.process.stdout: # type: ignore
+            try:
+                response = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            future = self._pending.pop(response.get('id'), None)
+            if future is not None:
+                future.set_result(response)
+            if self.retiring and not self._pending:
+                self.kill() if self.stuck else self.close()
+
+        self.process.wait()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(WorkerError(
+                f'Worker {self.process.pid} exited with code {self.process.returncode}'
+            ))
+
+    def abandon(self, request_id: int):
+        '''
+        Give up on a call that never answered. The
+        worker takes no new calls, finishes the others
+        it is running, then is killed, since the
+        abandoned call may never return.
+        '''
+        with self._lock:
+            self._pending.pop(request_id, None)
+        self.stuck = True
+        self.retire()
+
+    def retire(self):
+        '''
+        Stop routing requests to this worker and
+        close it once its in-flight calls drain
+        '''
+        self.retiring = True
+        if not self._pending:
+            self.kill() if self.stuck else self.close()
+
+    def stop(self, timeout: Optional[float] = None):
+        '''
+        Retire the worker and wait for it to exit,
+        terminating it once `timeout` has passed
+
+        @param timeout Seconds to wait; None waits forever
+        @return None
+        '''
+        self.retire()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.signal(signal.SIGTERM)
+            try:
+                self.process.wait(1)
+            except subprocess.TimeoutExpired:
+                self.kill()
+                self.process.wait()
+
+    def close(self):
+        try:
+            self.process.stdin.close() # type: ignore
+        except OSError:
+            pass
+
+    def kill(self):
+        self.signal(signal.SIGKILL)
+
+    def signal(self, signum: int):
+        try:
+            os.killpg(self.process.pid, signum)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+class WorkerPool():
+    '''
+    Pool of warm workers for one project module.
+    Workers are spawned lazily up to `size`,
+    replaced when they crash and recycled after
+    `max_requests` calls when that is set.
+    '''
+    _pools: Dict[str, 'WorkerPool'] = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, command: list[str], size: int = WORKER_POOL_SIZE,
+                 max_requests: int = 0, cwd: Optional[str] = None, generation: Any = None):
+        self.command = command
+        self.size = max(1, size)
+        self.max_requests = max_requests
+        self.cwd = cwd
+        self.generation = generation
+        self.workers: list[Worker] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, key: str, command: list[str], generation: Any = None, **kwargs) -> 'WorkerPool':
+        '''
+        Return the shared pool for `key`, replacing it
+        when the module generation (e.g. mtime) changed
+        '''
+        with cls._pools_lock:
+            pool = cls._pools.get(key)
+            if pool is not None and pool.generation != generation:
+                pool.shutdown()
+                pool = None
+            if pool is None:
+                pool = cls(command, generation=generation, **kwargs)
+                cls._pools[key] = pool
+            return pool
+
+    @classmethod
+    def shutdown_all(cls, timeout: Optional[float] = None):
+        '''
+        Shut every pool down. With a timeout, wait up
+        to that long in total for in-flight calls,
+        then terminate the workers still running.
+        '''
+        with cls._pools_lock:
+            pools, cls._pools = cls._pools, {}
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for pool in pools.values():
+            pool.shutdown(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def _acquire(self) -> Worker:
+        with self._lock:
+            for worker in self.workers:
+                if not worker.alive:
+                    worker.retire()
+                elif self.max_requests and worker.served >= self.max_requests:
+                    worker.retire()
+            self.workers = [w for w in self.workers if w.alive and not w.retiring]
+
+            idle = min(self.workers, key=lambda w: w.inflight, default=None)
+            if idle is None or (idle.inflight and len(self.workers) < self.size):
+                idle = Worker(self.command, self.cwd)
+                self.workers.append(idle)
+            return idle
+
+    def call(self, payload: dict, timeout: Optional[float] = WORKER_TIMEOUT) -> dict:
+        '''
+        Send a call to the least busy worker
+
+        @param payload Request frame
+        @param timeout Seconds to wait for the result; 0 or None waits forever
+        @return dict Response frame
+        @raises WorkerError When the worker crashes or the call times out
+        '''
+        worker = self._acquire()
+        request_id = next(self._ids)
+        future = worker.submit(request_id, payload)
+        try:
+            return future.result(timeout or None)
+        except TimeoutError:
+            # Fail this call alone; the worker is replaced once its other calls finish
+            worker.abandon(request_id)
+            raise WorkerError(f'Worker {worker.process.pid} did not answer within {timeout}s')
+
+    def shutdown(self, timeout: Optional[float] = None):
+        with self._lock:
+            workers, self.workers = self.workers, []
+        if timeout is None:
+            for worker in workers:
+                worker.retire()
+            return
+        deadline = time.monotonic() + timeout
+        for worker in workers:
+            worker.stop(max(0.0, deadline - time.monotonic()))
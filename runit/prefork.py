@@ -0,0 +1,311 @@
+import os
+import gc
+import sys
+import time
+import random
+import signal
+import socket
+import struct
+import asyncio
+import logging
+import selectors
+from typing import Dict, Optional
+
+import uvicorn
+
+from .constants import RECYCLE_MAX_REQUESTS, RECYCLE_MAX_RSS_MB, RECYCLE_MAX_AGE
+
+logger = logging.getLogger('runit.server')
+
+# Respawning faster than this means workers are crash-looping
+MIN_WORKER_LIFETIME = 1.0
+# How often workers check their recycling policy
+RECYCLE_CHECK_INTERVAL = 1.0
+
+# Messages from workers to the parent: a code and the worker's pid
+MESSAGE = struct.Struct('!ci')
+READY = b'R'
+RECYCLE = b'X'
+
+
+def rss_bytes() -> int:
+    '''
+    Resident set size of this process; the peak
+    where the current value isn't available
+
+    @param None
+    @return int
+    '''
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RecyclePolicy():
+    '''
+    When a worker should be replaced: after serving
+    `max_requests` requests, growing by `max_rss_mb`
+    over its RSS at startup, or living `max_age`
+    seconds. Zero turns a limit off. Each worker
+    gets limits jittered by up to 10%, so workers
+    started together don't all recycle together.
+    '''
+
+    def __init__(self, max_requests: int = RECYCLE_MAX_REQUESTS, max_rss_mb: float = RECYCLE_MAX_RSS_MB,
+                 max_age: float = RECYCLE_MAX_AGE):
+        self.max_requests = max_requests
+        self.max_rss_mb = max_rss_mb
+        self.max_age = max_age
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_requests or self.max_rss_mb or self.max_age)
+
+    def jittered(self) -> 'RecyclePolicy':
+        factor = random.uniform(0.9, 1.1)
+        return RecyclePolicy(int(self.max_requests * factor), self.max_rss_mb * factor, self.max_age * factor)
+
+    def reason(self, requests: int, rss_growth: int, age: float) -> Optional[str]:
+        '''
+        Why a worker is due for replacement
+
+        @param requests Requests served so far
+        @param rss_growth Bytes of RSS gained since startup
+        @param age Seconds since startup
+        @return str|None None while it isn't due
+        '''
+        if self.max_requests and requests >= self.max_requests:
+            return f'served {requests} requests'
+        if self.max_rss_mb and rss_growth >= self.max_rss_mb * 1024 * 1024:
+            return f'grew by {rss_growth // (1024 * 1024)} MB'
+        if self.max_age and age >= self.max_age:
+            return f'reached {int(age)}s'
+        return None
+
+
+class PreforkServer():
+    '''
+    Runs a WebServer in several worker processes
+    forked from one warm parent. The project is
+    loaded before forking, so each worker starts
+    with its modules, discovered functions and
+    config already in memory, shared copy-on-write
+    with its siblings. Workers accept connections
+    from one inherited listening socket; the parent
+    only supervises them.
+
+    A worker due for recycling asks the parent for
+    a replacement and keeps serving. The parent
+    forks the replacement (warm, like every worker),
+    and only once it is accepting connections tells
+    the old worker to drain and exit.
+    '''
+
+    def __init__(self, web_server, workers: int, policy: Optional[RecyclePolicy] = None):
+        self.web_server = web_server
+        self.workers = max(1, workers)
+        self.policy = policy or RecyclePolicy()
+        self.children: Dict[int, float] = {}
+        # Replacement pid -> pid of the worker it replaces
+        self.replacing: Dict[int, int] = {}
+        self.retiring: set = set()
+        self.socket: Optional[socket.socket] = None
+        self.reader: Optional[int] = None
+        self.writer: Optional[int] = None
+        self.stopping = False
+
+    def warm(self):
+        '''
+        Load everything workers would otherwise load
+        on their first request, then freeze the heap
+        so the collector doesn't touch (and copy) the
+        shared pages in every worker
+
+        @param None
+        @return None
+        '''
+        project = self.web_server.project
+        parser = project.lang_parser
+        if parser is not None and getattr(parser, 'in_memory', False):
+            parser._load_module_in_memory()
+        self.web_server.assets.build()
+        project.notfound('html')
+
+        gc.collect()
+        gc.freeze()
+
+    def bind(self, host: str, port: int) -> socket.socket:
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+
+    def run(self, config: uvicorn.Config):
+        '''
+        Bind, warm up, fork the workers and supervise
+        them until SIGINT or SIGTERM
+
+        @param config Uvicorn configuration of each worker
+        @return None
+        '''
+        self.socket = self.bind(config.host, config.port)
+        self.reader, self.writer = os.pipe()
+        self.warm()
+        logger.info(f'Prefork server on {config.host}:{config.port} with {self.workers} workers')
+
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        try:
+            for _ in range(self.workers):
+                self.spawn(config)
+            self.supervise(config)
+        finally:
+            self.socket.close()
+            os.close(self.reader)
+            os.close(self.writer)
+
+    def spawn(self, config: uvicorn.Config) -> int:
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return pid
+
+        # Worker: default signal handling, so uvicorn can install its own
+        code = 0
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.close(self.reader)
+            asyncio.run(self.serve_worker(config))
+        except BaseException:
+            logger.exception('[!] Worker failed')
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    async def serve_worker(self, config: uvicorn.Config):
+        server = uvicorn.Server(config)
+        watcher = asyncio.ensure_future(self.watch(server))
+        try:
+            await server.serve(sockets=[self.socket])
+        finally:
+            watcher.cancel()
+
+    async def watch(self, server: uvicorn.Server):
+        '''
+        Tell the parent once this worker accepts
+        connections, then ask to be replaced when
+        the recycling policy says so; repeated until
+        the parent acts on it
+
+        @param server This worker's uvicorn server
+        @return None
+        '''
+        while not server.started:
+            await asyncio.sleep(0.05)
+        self.notify(READY)
+        if not self.policy.enabled:
+            return
+
+        policy = self.policy.jittered()
+        started, baseline = time.monotonic(), rss_bytes()
+        while True:
+            await asyncio.sleep(RECYCLE_CHECK_INTERVAL)
+            reason = policy.reason(server.server_state.total_requests, rss_bytes() - baseline,
+                                   time.monotonic() - started)
+            if reason:
+                logger.info(f'Worker {os.getpid()} {reason}, requesting a replacement')
+                self.notify(RECYCLE)
+                # Ask again later in case the replacement failed to start
+                await asyncio.sleep(30)
+
+    def notify(self, code: bytes):
+        os.write(self.writer, MESSAGE.pack(code, os.getpid()))
+
+    def supervise(self, config: uvicorn.Config):
+        selector = selectors.DefaultSelector()
+        selector.register(self.reader, selectors.EVENT_READ)
+        buffer = b''
+        try:
+            while self.children:
+                if selector.select(timeout=0.2):
+                    buffer += os.read(self.reader, 4096)
+                    while len(buffer) >= MESSAGE.size:
+                        code, pid = MESSAGE.unpack(buffer[:MESSAGE.size])
+                        buffer = buffer[MESSAGE.size:]
+                        self.handle(code, pid, config)
+                self.reap(config)
+        finally:
+            selector.close()
+
+    def handle(self, code: bytes, pid: int, config: uvicorn.Config):
+        if self.stopping or pid not in self.children:
+            return
+        if code == RECYCLE and pid not in self.retiring and pid not in self.replacing.values():
+            replacement = self.spawn(config)
+            self.replacing[replacement] = pid
+        elif code == READY and pid in self.replacing:
+            # The replacement is accepting; the old worker can drain
+            old = self.replacing.pop(pid)
+            self.retiring.add(old)
+            self.signal(old, signal.SIGTERM)
+
+    def reap(self, config: uvicorn.Config):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+
+            started = self.children.pop(pid, None)
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                continue
+            # A replacement that died before it was ready; the
+            # worker it was meant to replace will ask again
+            if self.replacing.pop(pid, None) is not None or started is None or self.stopping:
+                continue
+            # A worker that died while its replacement was starting
+            # is already replaced
+            replacement = next((new for new, old in self.replacing.items() if old == pid), None)
+            if replacement is not None:
+                del self.replacing[replacement]
+                continue
+
+            code = os.waitstatus_to_exitcode(status)
+            if code != 0:
+                logger.warning(f'[!] Worker {pid} exited with code {code}, replacing it')
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                time.sleep(MIN_WORKER_LIFETIME)
+            if not self.stopping:
+                self.spawn(config)
+
+    def signal(self, pid: int, signum: int):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def stop(self, signum, frame=None):
+        '''
+        Ask every worker to finish; the supervisor
+        returns once they have all exited
+        '''
+        if self.stopping:
+            return
+        self.stopping = True
+        logger.info('Stopping workers...')
+        for pid in list(self.children):
+            self.signal(pid, signal.SIGTERM)
@@ -3,21 +3,33 @@
 import os
 import sys
 import json
+import time
+import asyncio
 import logging
 from pathlib import Path
 from zipfile import ZipFile
 from io import TextIOWrapper
 from typing import Optional, Union, Callable
+from functools import lru_cache
 from threading import Thread
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Executor, ThreadPoolExecutor, as_completed
 
 from dotenv import load_dotenv
 
 from .languages import LanguageParser
+from .languages.runtime import Runtime
+from .languages.cache import ResultCache
+from .languages.singleflight import SingleFlight
+from .languages.batching import MicroBatcher
+from .languages.streams import Stream, is_stream
+from .languages.envelope import Envelope, FunctionError, ERROR, NOT_FOUND
+from .languages.payloads import Payload
+from .static import precompress
 from .constants import (
     TEMPLATES_FOLDER, STARTER_FILES, NOT_FOUND_FILE,
     CONFIG_FILE, STARTER_CONFIG_FILE, IS_RUNNING, PROJECTS_DIR,
-    CURRENT_PROJECT_DIR, DOT_RUNIT_IGNORE, INSTALL_MODULE_LATER_MESSAGE
+    CURRENT_PROJECT_DIR, DOT_RUNIT_IGNORE, INSTALL_MODULE_LATER_MESSAGE,
+    RESULT_CACHE_MIN_MS, PUBLIC_FOLDER
 )
  
 logging.basicConfig(
@@ -37,9 +49,11 @@ class RunIt:
         'win32': os.path.join(os.curdir, 'venv', 'Scripts', 'python.exe'),
         'linux': os.path.join(os.curdir, 'venv', 'bin', 'python')
     }
+    _parser_builds = SingleFlight()
 
     def __init__(self, name, _id="", version="0.0.1", description="", homepage="",
-    language="", runtime="", start_file="", private=False, author=None, is_file: bool = False):
+    language="", runtime="", start_file="", private=False, author=None, is_file: bool = False,
+    functions: Optional[dict] = None):
         global STARTER_FILES
 
         self._id = _id
@@ -51,6 +65,10 @@ class RunIt:
         self.runtime = runtime
         self.private = private
         self.author = author
+        self.functions = functions or {}
+        self.result_cache = ResultCache()
+        self._flights = SingleFlight()
+        self._batchers: dict = {}
         self.config = {}
         self.start_file = start_file if start_file else STARTER_FILES[self.language]
         self._lang_parser = None
@@ -81,15 +99,29 @@ class RunIt:
                 runtime = self.runtime
                 if 'python' in runtime:
                     runtime = os.path.realpath(self.PYTHON_PATHS[sys.platform])
-                self._lang_parser = LanguageParser.detect_language(
-                    filename=self.start_file,
-                    runtime=runtime,
-                    is_docker=RunIt.DOCKER,
-                    project_id=self._id
-                )
+                self._lang_parser = RunIt.build_parser(self.start_file, runtime, self._id, current_mtime)
                 self._lang_parser_mtime = current_mtime
         return self._lang_parser
 
+    @staticmethod
+    def build_parser(start_file: str, runtime: str, project_id: str = '', mtime: Optional[float] = None):
+        '''
+        Build a language parser; concurrent builds of
+        the same start file and mtime wait on one build
+
+        @param start_file Project start file
+        @param runtime Runtime executable
+        @param project_id Project id (docker image)
+        @param mtime Modification time of start_file
+        @return Language parser
+        '''
+        if mtime is None:
+            mtime = os.path.getmtime(start_file)
+        key = (os.path.realpath(start_file), mtime, runtime, RunIt.DOCKER, project_id)
+        return RunIt._parser_builds.do(
+            key, LanguageParser.detect_language, start_file, runtime, False, RunIt.DOCKER, project_id
+        )
+
     @staticmethod
     def exists(name):
         return os.path.exists(os.path.join(os.curdir, name))
@@ -151,7 +183,19 @@ class RunIt:
         if format == 'json':
             return '404 - Not Found'
 
-        with open(os.path.join(TEMPLATES_FOLDER, NOT_FOUND_FILE),'rt') as file:
+        return RunIt.read_template(os.path.join(TEMPLATES_FOLDER, NOT_FOUND_FILE))
+    
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def read_template(path: str) -> str:
+        '''
+        Contents of a bundled template, read from
+        disk once and then served from memory
+
+        @param path Template file
+        @return str
+        '''
+        with open(path, 'rt') as file:
             return file.read()
     
     @staticmethod
@@ -235,72 +279,365 @@ class RunIt:
         if 'python' in project.runtime:
             project.runtime = cls.PYTHON_PATHS[sys.platform]
 
-        if isinstance(args, dict):
-            args = list(args.values())
-
-        args_list = args if isinstance(args, list) else []
+        if not os.path.exists(project.start_file):
+            return cls.notfound()
 
-        lang_parser = LanguageParser.detect_language(
-            filename=project.start_file,
-            runtime=project.runtime,
-            is_docker=cls.DOCKER,
-            project_id=project_id
-        )
+        lang_parser = cls.build_parser(project.start_file, project.runtime, project_id)
         
         if not func in lang_parser.functions:
             return RunIt.notfound()
-        
-        lang_parser.current_func = func
-        
-        parameters = lang_parser.functions[func] # type: ignore
 
         try:
-            if len(parameters):
-                if not len(args_list):
-                    raise Exception('[!] No arguments provided')
-                return getattr(lang_parser, func)(*args_list)
-            else:
-                return getattr(lang_parser, func)()
-        except AttributeError:
-            return cls.notfound()
-        except TypeError as e:
-            return str(e)
+            return lang_parser.invoke(func, RunIt.function_arguments(lang_parser, func, args))
         except Exception as e:
             return str(e)
     
+    @staticmethod
+    def function_arguments(lang_parser, func: str, args: Optional[Union[dict, list]] = None)-> Union[dict, list]:
+        '''
+        Arguments to call `func` with. Dicts are kept
+        so parsers that can bind by name do so.
+
+        @param lang_parser Language parser serving func
+        @param func Function name
+        @param args Request arguments
+        @return dict|list
+        '''
+        if not isinstance(args, (dict, list)):
+            args = []
+
+        parameters = lang_parser.parameters(func)
+
+        if not len(parameters):
+            return []
+        if not len(args):
+            raise Exception(f'[!] Expected arguments: {parameters}')
+        return args
+    
     def serve(self, func: str = 'index', args: Optional[Union[dict,list]]=None):
-        global NOT_FOUND_FILE
-        
-        lang_parser = self.lang_parser
+        '''
+        Run a function and return its value, or its
+        error message when it fails. Streamed items
+        are collected into a list.
+
+        @param func Function name
+        @param args Request arguments
+        @return Function result
+        '''
+        result = self.call(func, args)
+        return result.collect() if isinstance(result, Stream) else RunIt.unwrap(result)
+    
+    def call(self, func: str = 'index', args: Optional[Union[dict,list]]=None) -> Union[Envelope, Stream]:
+        '''
+        Run a function and describe the outcome
+
+        @param func Function name
+        @param args Request arguments
+        @return Envelope, or a Stream for streaming functions
+        '''
+        lang_parser = self.find_function(func)
         
         if lang_parser is None:
-            return RunIt.notfound()
+            return Envelope(NOT_FOUND, error=RunIt.notfound())
         
-        if func not in lang_parser.functions:
-            return RunIt.notfound()
+        if self.is_streaming(lang_parser, func):
+            return self.open_stream(lang_parser, func, args)
         
-        setattr(lang_parser, 'current_func', func)
-       
-        if isinstance(args, dict):
-            args = list(args.values())
+        key, settings = self.result_cache_key(lang_parser, func, args)
+        if key:
+            value = self.result_cache.lookup(key)
+            if value is not ResultCache.MISS:
+                return Envelope(value=value)
+        
+        flight = self.flight_key(func, args, settings)
+        if flight:
+            envelope = self._flights.do(flight, self.execute_call, lang_parser, func, args, share=RunIt.own_result)
+        else:
+            envelope = self.execute_call(lang_parser, func, args)
+        if key:
+            self.cache_result(key, envelope, settings)
+        return envelope
+    
+    def find_function(self, func: str):
+        '''
+        Parser of the current code when it has `func`,
+        rebuilding it first if the start file changed
+
+        @param func Function name
+        @return Runtime|None None when there is no such function
+        '''
+        lang_parser = self.lang_parser
+        if lang_parser is None or func not in lang_parser.functions:
+            return None
+        return lang_parser
+    
+    @staticmethod
+    def unwrap(result: Union[Envelope, Stream]):
+        '''
+        Plain result of a call: the value, the error
+        message, or the stream itself
+
+        @param result Outcome of call()/call_async()
+        @return Function result
+        '''
+        if isinstance(result, Stream):
+            return result
+        return result.value if result.ok else result.error
+    
+    def execute_call(self, lang_parser, func: str, args: Optional[Union[dict,list]]=None) -> Envelope:
+        '''
+        Run one call on the calling thread. Functions
+        with a "batch" setting take a list of calls, so
+        they get a batch of one, as execute_async would
+        merge it with others.
+        '''
+        if self.batch_settings(func) is None:
+            return self.execute(lang_parser, func, args)
+        envelope = self.execute(lang_parser, func, [[MicroBatcher.item(args if args is not None else [])]])
+        if envelope.ok:
+            if not isinstance(envelope.value, list) or len(envelope.value) != 1:
+                count = len(envelope.value) if isinstance(envelope.value, list) else 1
+                return Envelope(ERROR, error=f'Batch function returned {count} results for 1 calls',
+                                elapsed_ms=envelope.elapsed_ms)
+            envelope.value = envelope.value[0]
+        return envelope
+    
+    def execute(self, lang_parser, func: str, args: Optional[Union[dict,list]]=None) -> Envelope:
+        start = time.perf_counter()
+        try:
+            value = lang_parser.invoke(func, RunIt.function_arguments(lang_parser, func, args))
+            return Envelope(value=value, elapsed_ms=(time.perf_counter() - start) * 1000)
+        except Exception as e:
+            return Envelope(ERROR, error=str(e), elapsed_ms=(time.perf_counter() - start) * 1000)
+    
+    def is_streaming(self, lang_parser, func: str) -> bool:
+        '''
+        Whether a function's output is streamed: in-memory
+        generators always are, runner output is streamed
+        line by line for functions with "stream": true
+        '''
+        return lang_parser.is_generator(func) or bool(self.function_policy(func).get('stream'))
+    
+    def open_stream(self, lang_parser, func: str, args: Optional[Union[dict,list]]=None) -> Union[Envelope, Stream]:
+        '''
+        Start a streaming function. Only creates the
+        generator or runner process; items are produced
+        as the stream is consumed.
 
-        args_list = args if type(args) is list  else []
+        @return Stream, or an Envelope when it fails to start
+        '''
+        try:
+            args = RunIt.function_arguments(lang_parser, func, args)
+            if lang_parser.is_generator(func):
+                result = lang_parser.invoke(func, args)
+                return Stream(result) if is_stream(result) else Envelope(value=result)
+            return lang_parser.stream(func, args)
+        except Exception as e:
+            return Envelope(ERROR, error=str(e))
+    
+    def function_policy(self, func: str) -> dict:
+        '''
+        Settings declared for a function under "functions"
+        in runit.json, merged over the project-wide "*" entry
 
-        parameters = lang_parser.functions[func]
+        @param func Function name
+        @return dict Function settings
+        '''
+        return {**self.functions.get('*', {}), **self.functions.get(func, {})}
+    
+    def cache_settings(self, func: str) -> Optional[dict]:
+        '''
+        Result cache settings of a function, from
+        "cache": {"ttl": seconds, "min_compute_ms": ms}
+        or the "cache": seconds shorthand
 
+        @param func Function name
+        @return dict|None None when caching is off
+        '''
+        cache = self.function_policy(func).get('cache')
+        if not cache:
+            return None
+        if isinstance(cache, (int, float)):
+            cache = {'ttl': cache}
+        return cache if cache.get('ttl') else None
+    
+    def result_cache_key(self, lang_parser, func: str, args) -> tuple:
+        settings = self.cache_settings(func)
+        if settings is None:
+            return None, None
         try:
-            if len(parameters):
-                if not len(args_list):
-                    raise Exception(f'[!] Expected arguments: {parameters}')
-                return getattr(lang_parser, func)(*args_list)
+            digest = Runtime._function_cache.source_digest(lang_parser.source_file(func))
+        except (OSError, KeyError):
+            return None, None
+        return ResultCache.make_key(func, args, digest), settings
+    
+    def flight_key(self, func: str, args, cache_settings: Optional[dict]) -> Optional[str]:
+        '''
+        Key under which identical concurrent calls share
+        one execution. Only cached functions, or ones
+        marked "coalesce": true, are assumed safe to share.
+        '''
+        if cache_settings is None and not self.function_policy(func).get('coalesce'):
+            return None
+        return json.dumps([func, args], sort_keys=True, default=str)
+    
+    @staticmethod
+    def own_result(envelope: Envelope, last: bool) -> Envelope:
+        '''
+        Result of a coalesced call for one of its
+        callers. Payload files are deleted once sent,
+        so every caller but the last gets its own link.
+        '''
+        if last or not isinstance(envelope.value, Payload):
+            return envelope
+        return Envelope(envelope.status, envelope.value.link(), envelope.error, envelope.elapsed_ms)
+    
+    def cache_result(self, key: str, envelope: Envelope, settings: dict):
+        # Payload files are deleted once they have been sent
+        if not envelope.ok or isinstance(envelope.value, Payload):
+            return
+        min_compute = settings.get('min_compute_ms', RESULT_CACHE_MIN_MS) / 1000
+        self.result_cache.store(key, envelope.value, float(settings['ttl']),
+                                envelope.elapsed_ms / 1000, min_compute)
+    
+    async def serve_async(self, func: str = 'index', args: Optional[Union[dict,list]]=None,
+                          executor: Optional[Executor] = None):
+        '''
+        Awaitable counterpart of serve()
+
+        @param func Function name
+        @param args Request arguments
+        @param executor Executor for blocking calls
+        @return Function result
+        '''
+        return RunIt.unwrap(await self.call_async(func, args, executor))
+    
+    async def call_async(self, func: str = 'index', args: Optional[Union[dict,list]]=None,
+                         executor: Optional[Executor] = None) -> Union[Envelope, Stream]:
+        '''
+        Run a function without blocking the event loop.
+        Functions configured with "execution": "process"
+        run in a pool of warm Python processes, coroutine
+        functions loaded in memory are awaited on the loop
+        and everything else runs on `executor`. Results of
+        functions with a "cache" setting are reused, and
+        concurrent calls of "batch" functions are merged
+        into one call taking the list of their arguments.
+
+        @param func Function name
+        @param args Request arguments
+        @param executor Executor for blocking calls
+        @return Envelope, or a Stream for streaming functions
+        '''
+        # Rebuilding a parser, discovering functions, importing the
+        # module and hashing its source for the result cache may spawn
+        # loaders and read files, so all of it stays off the loop
+        loop = asyncio.get_running_loop()
+        lang_parser, opened, key, settings = await loop.run_in_executor(executor, self.prepare_call, func, args)
+
+        if lang_parser is None:
+            return Envelope(NOT_FOUND, error=RunIt.notfound())
+        if opened is not None:
+            return opened
+
+        if key:
+            value = self.result_cache.lookup(key)
+            if value is not ResultCache.MISS:
+                return Envelope(value=value)
+        
+        flight = self.flight_key(func, args, settings)
+        if flight:
+            envelope = await self._flights.do_async(flight, self.execute_async, lang_parser, func, args, executor,
+                                                   share=RunIt.own_result)
+        else:
+            envelope = await self.execute_async(lang_parser, func, args, executor)
+        if key:
+            self.cache_result(key, envelope, settings)
+        return envelope
+    
+    def prepare_call(self, func: str, args: Optional[Union[dict,list]]=None) -> tuple:
+        '''
+        The blocking part of call_async(): find the
+        parser, load what the call needs, open the
+        stream of streaming functions and compute the
+        result cache key
+
+        @param func Function name
+        @param args Request arguments
+        @return tuple (parser, opened stream, cache key, cache settings);
+                the parser is None when there is no such function
+        '''
+        lang_parser = self.find_function(func)
+        if lang_parser is None:
+            return None, None, None, None
+        lang_parser.prepare(func)
+        if self.is_streaming(lang_parser, func):
+            return lang_parser, self.open_stream(lang_parser, func, args), None, None
+        return (lang_parser, None, *self.result_cache_key(lang_parser, func, args))
+    
+    async def execute_async(self, lang_parser, func: str, args: Optional[Union[dict,list]]=None,
+                            executor: Optional[Executor] = None) -> Envelope:
+        settings = self.batch_settings(func)
+        if settings is None:
+            return await self.dispatch_async(lang_parser, func, args, executor)
+        
+        batcher = self._batchers.get(func)
+        if batcher is None or (batcher.max_size, batcher.window) != settings:
+            batcher = self._batchers[func] = MicroBatcher(
+                lambda items: self.dispatch_batch(func, items, executor),
+                *settings
+            )
+        start = time.perf_counter()
+        try:
+            value = await batcher.submit(args if args is not None else [])
+            return Envelope(value=value, elapsed_ms=(time.perf_counter() - start) * 1000)
+        except Exception as e:
+            return Envelope(ERROR, error=str(e), elapsed_ms=(time.perf_counter() - start) * 1000)
+    
+    async def dispatch_batch(self, func: str, items: list, executor: Optional[Executor] = None) -> list:
+        lang_parser = await asyncio.get_running_loop().run_in_executor(executor, self.find_function, func)
+        if lang_parser is None:
+            raise FunctionError(f'No function found by the name: {func}')
+        envelope = await self.dispatch_async(lang_parser, func, [items], executor)
+        if not envelope.ok:
+            raise FunctionError(envelope.error)
+        return envelope.value
+    
+    def batch_settings(self, func: str) -> Optional[tuple]:
+        '''
+        Micro-batching settings of a function, from
+        "batch": {"max_size": n, "window_ms": ms}
+        or "batch": true for the defaults
+
+        @param func Function name
+        @return tuple|None (max_size, window seconds)
+        '''
+        batch = self.function_policy(func).get('batch')
+        if not batch:
+            return None
+        if not isinstance(batch, dict):
+            batch = {}
+        return int(batch.get('max_size', 32)), batch.get('window_ms', 5) / 1000
+    
+    async def dispatch_async(self, lang_parser, func: str, args: Optional[Union[dict,list]]=None,
+                             executor: Optional[Executor] = None) -> Envelope:
+        in_process = self.function_policy(func).get('execution') == 'process' \
+            and hasattr(lang_parser, 'process_pool') and lang_parser.in_memory
+
+        if not in_process and not lang_parser.is_coroutine(func):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, self.execute, lang_parser, func, args)
+
+        start = time.perf_counter()
+        try:
+            args_list = RunIt.function_arguments(lang_parser, func, args)
+            if in_process:
+                value = await asyncio.wrap_future(lang_parser.process_pool().submit(func, args_list))
             else:
-                return getattr(lang_parser, func)()
-        except AttributeError as e:
-            return RunIt.notfound()
-        except TypeError as e:
-            return str(e)
+                value = await lang_parser.invoke_async(func, args_list)
+            return Envelope(value=value, elapsed_ms=(time.perf_counter() - start) * 1000)
         except Exception as e:
-            return str(e)
+            return Envelope(ERROR, error=str(e), elapsed_ms=(time.perf_counter() - start) * 1000)
     
     def create_folder(self):
         os.mkdir(os.path.join(os.curdir, self.name))
@@ -336,6 +673,8 @@ class RunIt:
         self.config['private'] = self.private
         self.config['start_file'] = self.start_file
         self.config['author'] = self.author
+        if self.functions:
+            self.config['functions'] = self.functions
         json.dump(self.config, config_file, indent=4)
         config_file.close()
     
@@ -355,6 +694,11 @@ class RunIt:
         zipname = f'{self.name}.zip'
         exclude_set = self.get_exclude_list()
 
+        if os.path.isdir(PUBLIC_FOLDER):
+            count = precompress(PUBLIC_FOLDER)
+            if count:
+                logger.info(f'[+] Precompressed {count} public files')
+
         def should_exclude(filepath: str) -> bool:
             """Check if file/directory should be excluded."""
             basename = os.path.basename(filepath)
@@ -398,6 +742,8 @@ class RunIt:
         self.config['private'] = self.private
         self.config['start_file'] = self.start_file
         self.config['author'] = self.author
+        if self.functions:
+            self.config['functions'] = self.functions
     
     def create_starter_files(self):
         global DOT_RUNIT_IGNORE
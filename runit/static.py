@@ -0,0 +1,171 @@
+import os
+import gzip
+import logging
+import mimetypes
+from typing import Dict, Optional, Union
+from pathlib import Path
+
+from .responses import brotli, is_compressible
+from .constants import COMPRESS_MIN_SIZE
+
+logger = logging.getLogger('runit.server')
+
+# Precompressed siblings, in order of preference
+PRECOMPRESSED = {'br': '.br', 'gzip': '.gz'}
+
+
+class Asset():
+    '''
+    What is needed to answer a request for one
+    public file without touching the disk: its
+    stat result, type, ETag and the precompressed
+    siblings found next to it
+    '''
+    __slots__ = ('path', 'stat', 'media_type', 'etag', 'variants')
+
+    def __init__(self, path: str, stat: os.stat_result):
+        self.path = path
+        self.stat = stat
+        self.media_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        self.variants: Dict[str, tuple[str, os.stat_result]] = {}
+        for coding, suffix in PRECOMPRESSED.items():
+            try:
+                variant = os.stat(path + suffix)
+            except OSError:
+                continue
+            # A sibling older than its source is stale
+            if variant.st_mtime_ns >= stat.st_mtime_ns:
+                self.variants[coding] = (path + suffix, variant)
+
+    def is_current(self) -> bool:
+        '''
+        Whether the file and its siblings are unchanged
+        since they were indexed; serving a stale stat
+        would send the wrong length and ETag
+
+        @param None
+        @return bool
+        '''
+        files = [(self.path, self.stat), *self.variants.values()]
+        for path, indexed in files:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return False
+            if (stat.st_mtime_ns, stat.st_size) != (indexed.st_mtime_ns, indexed.st_size):
+                return False
+        return True
+
+    def etag_for(self, coding: Optional[str] = None) -> str:
+        return self.etag if coding is None else f'{self.etag[:-1]}-{PRECOMPRESSED[coding][1:]}"'
+
+
+class AssetIndex():
+    '''
+    Index of a project's public/ directory, built
+    once at startup. Files added later are indexed
+    on their first request, and files that changed
+    are indexed again when next requested.
+    '''
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = os.path.realpath(root)
+        self.assets: Dict[str, Asset] = {}
+        self.built = False
+
+    def build(self) -> int:
+        '''
+        Stat every public file
+
+        @param None
+        @return int Number of files indexed
+        '''
+        assets = {}
+        for folder, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(folder, filename)
+                if self.is_variant(path) or not os.path.realpath(path).startswith(self.root + os.sep):
+                    continue
+                try:
+                    assets[os.path.relpath(path, self.root)] = Asset(path, os.stat(path))
+                except OSError:
+                    pass
+        self.assets = assets
+        self.built = True
+        if assets:
+            logger.info(f'[+] Indexed {len(assets)} public files')
+        return len(assets)
+
+    @staticmethod
+    def is_variant(path: str) -> bool:
+        for suffix in PRECOMPRESSED.values():
+            if path.endswith(suffix) and os.path.isfile(path[:-len(suffix)]):
+                return True
+        return False
+
+    def lookup(self, path: str) -> Optional[Asset]:
+        '''
+        Asset for a request path, None when there is
+        no such file inside the public directory
+
+        @param path Path relative to public/
+        @return Asset|None
+        '''
+        key = os.path.normpath(path.lstrip('/'))
+        asset = self.assets.get(key)
+        if asset is not None:
+            if asset.is_current():
+                return asset
+            del self.assets[key]
+
+        filepath = os.path.realpath(os.path.join(self.root, key))
+        if not filepath.startswith(self.root + os.sep) or self.is_variant(filepath):
+            return None
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        if not os.path.isfile(filepath):
+            return None
+        asset = self.assets[key] = Asset(filepath, stat)
+        return asset
+
+
+def precompress(root: Union[str, Path], min_size: int = COMPRESS_MIN_SIZE) -> int:
+    '''
+    Write .gz (and .br, when brotli is installed)
+    siblings of the compressible files under `root`,
+    at maximum compression since it's done once
+
+    @param root Public directory
+    @param min_size Smallest file worth compressing
+    @return int Number of files written
+    '''
+    written = 0
+    for folder, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(folder, filename)
+            if AssetIndex.is_variant(path) or path.endswith(tuple(PRECOMPRESSED.values())):
+                continue
+            if not is_compressible(mimetypes.guess_type(path)[0]) or os.path.getsize(path) < min_size:
+                continue
+
+            data = None
+            for coding, suffix in PRECOMPRESSED.items():
+                if coding == 'br' and brotli is None:
+                    continue
+                target = path + suffix
+                if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                    continue
+                if data is None:
+                    with open(path, 'rb') as file:
+                        data = file.read()
+                encoded = brotli.compress(data, quality=11) if coding == 'br' \
+                    else gzip.compress(data, compresslevel=9, mtime=0)
+                if len(encoded) >= len(data):
+                    continue
+                with open(target, 'wb') as file:
+                    file.write(encoded)
+                written += 1
+    return written
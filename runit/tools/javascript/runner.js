@@ -1,27 +1,62 @@
+// Marks the envelope line so it can be told apart
+// from anything the function logs itself
+const ENVELOPE_MARKER = '\x1e';
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+const crypto = require('crypto');
 const args = process.argv;
+const start = process.hrtime.bigint();
 
-if (args.length >= 3) {
+// Binary results are written to a payload file and
+// only its handle is sent back to the server
+const storeResult = (value) => {
+    if (value === undefined) {
+        return null;
+    }
+    if (!(value instanceof Uint8Array)) {
+        return value;
+    }
+    const directory = process.env.RUNIT_PAYLOAD_DIR || os.tmpdir();
+    fs.mkdirSync(directory, { recursive: true });
+    const file = path.join(directory, crypto.randomBytes(16).toString('hex'));
+    fs.writeFileSync(file, value);
+    // Signed with the server's key, so the server knows it issued this handle
+    const token = crypto.createHmac('sha256', process.env.RUNIT_PAYLOAD_KEY || '').update(file).digest('hex');
+    return { $payload: file, size: value.length, content_type: 'application/octet-stream', token };
+};
+
+const elapsed = () => Number(process.hrtime.bigint() - start) / 1e6;
+const send = (envelope) => process.stdout.write(
+    ENVELOPE_MARKER + JSON.stringify({ ...envelope, timings: { elapsed_ms: elapsed() } }) + '\n'
+);
+
+async function main() {
     const filename = args[2];
     const functionname = args[3];
-    const functionArguments = args.length > 4 ? args[4] : undefined;
+    let functionArguments = [];
+    if (args[4] === '-') {
+        // Arguments frame on stdin: {"args": [...], "kwargs": {...}}
+        const data = fs.readFileSync(0, 'utf8');
+        functionArguments = data ? (JSON.parse(data).args || []) : [];
+    } else if (args.length > 4) {
+        functionArguments = [args[4]];
+    }
 
     try {
         const module = require(filename);
         const method = module[functionname];
 
-        if (typeof method === 'function') {
-            const result = functionArguments ? method(functionArguments) : method();
-
-            if (result instanceof Promise) {
-                result.then(output => console.log(output))
-                      .catch(error => console.error("Error executing async function:", error));
-            } else {
-                console.log(result);
-            }
-        } else {
-            console.log('No function found by the name:', functionname);
+        if (typeof method !== 'function') {
+            return send({ status: 'error', error: `No function found by the name: ${functionname}` });
         }
+        const result = await method(...functionArguments);
+        send({ status: 'ok', value: storeResult(result) });
     } catch (error) {
-        console.error("Error:", error);
+        send({ status: 'error', error: String(error) });
     }
 }
+
+if (args.length >= 3) {
+    main();
+}
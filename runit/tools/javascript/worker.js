@@ -0,0 +1,64 @@
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+const crypto = require('crypto');
+const readline = require('readline');
+
+// Protocol frames go to the real stdout; anything the
+// user code logs is redirected to stderr.
+const send = (message) => process.stdout.write(JSON.stringify(message) + '\n');
+console.log = console.error;
+
+const modules = {};
+
+// Binary results are written to a payload file and
+// only its handle is sent back to the server
+const storeResult = (value) => {
+    if (value === undefined) {
+        return null;
+    }
+    if (!(value instanceof Uint8Array)) {
+        return value;
+    }
+    const directory = process.env.RUNIT_PAYLOAD_DIR || os.tmpdir();
+    fs.mkdirSync(directory, { recursive: true });
+    const file = path.join(directory, crypto.randomBytes(16).toString('hex'));
+    fs.writeFileSync(file, value);
+    // Signed with the server's key, so the server knows it issued this handle
+    const token = crypto.createHmac('sha256', process.env.RUNIT_PAYLOAD_KEY || '').update(file).digest('hex');
+    return { $payload: file, size: value.length, content_type: 'application/octet-stream', token };
+};
+
+function loadModule(filename) {
+    if (!(filename in modules)) {
+        const directory = path.dirname(filename);
+        if (fs.existsSync(path.join(directory, '.env'))) {
+            try {
+                require(require.resolve('dotenv', { paths: [directory] }))
+                    .config({ path: path.join(directory, '.env') });
+            } catch (error) {}
+        }
+        modules[filename] = require(filename);
+    }
+    return modules[filename];
+}
+
+async function handle(request) {
+    try {
+        const method = loadModule(request.module)[request.function];
+
+        if (typeof method !== 'function') {
+            return send({ id: request.id, error: `No function found by the name: ${request.function}` });
+        }
+        const result = await method(...(request.args || []));
+        send({ id: request.id, result: storeResult(result) });
+    } catch (error) {
+        send({ id: request.id, error: String(error) });
+    }
+}
+
+readline.createInterface({ input: process.stdin }).on('line', (line) => {
+    if (line.trim()) {
+        handle(JSON.parse(line));
+    }
+});
@@ -8,12 +8,32 @@
 
  require_once __DIR__ . '/manager.php';
  use Runit\Controller\DotEnvEnvironment;
- 
 
-$functionArguments;
+// Marks the envelope line so it can be told apart
+// from anything the function prints itself
+const ENVELOPE_MARKER = "\x1e";
 
-try {
-    if ($argc > 1) {
+$start = microtime(true);
+
+function send($envelope, $start) {
+    $envelope['timings'] = ['elapsed_ms' => (microtime(true) - $start) * 1000];
+    echo ENVELOPE_MARKER . json_encode($envelope) . "\n";
+}
+
+// When streaming, output goes straight to stdout line by line
+// instead of being collected as the result
+$streaming = getenv('RUNIT_STREAM') === '1';
+
+if ($argc > 1) {
+    if ($streaming) {
+        while (ob_get_level() > 0) {
+            ob_end_flush();
+        }
+        ob_implicit_flush(true);
+    } else {
+        ob_start();
+    }
+    try {
         $filename = $argv[1];
         $functionname = $argv[2];
         $filepath = dirname($filename);
@@ -21,17 +41,22 @@ try {
         
         include_once($filename);
 
-        if ($argc > 3) {
-            $functionArguments = $argv[3];
+        $functionArguments = [];
+        if ($argc > 3 && $argv[3] === '-') {
+            // Arguments frame on stdin: {"args": [...], "kwargs": {...}}
+            $frame = json_decode(stream_get_contents(STDIN), true);
+            $functionArguments = $frame['args'] ?? [];
+        } elseif ($argc > 3) {
+            $functionArguments = [$argv[3]];
         }
 
-        if (!isset($functionArguments)) {
-            echo ($functionname)();
-        } else {
-            echo ($functionname)($functionArguments);
+        $result = ($functionname)(...$functionArguments);
+        $output = $streaming ? null : ob_get_clean();
+        send(['status' => 'ok', 'value' => $result ?? $output], $start);
+    } catch (Throwable $th) {
+        if (!$streaming) {
+            ob_end_clean();
         }
-    
+        send(['status' => 'error', 'error' => $th->getMessage()], $start);
     }
-} catch (Exception $th) {
-    echo $th;
 }
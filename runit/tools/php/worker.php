@@ -0,0 +1,48 @@
+<?php
+/**
+ * Long-lived worker serving function calls
+ * as newline-delimited JSON over stdin/stdout
+ * @version 1.0.0
+ */
+
+require_once __DIR__ . '/manager.php';
+use Runit\Controller\DotEnvEnvironment;
+
+$loaded = [];
+
+function send($message)
+{
+    fwrite(STDOUT, json_encode($message) . "\n");
+    fflush(STDOUT);
+}
+
+while (($line = fgets(STDIN)) !== false) {
+    $request = json_decode($line, true);
+    if (!is_array($request)) {
+        continue;
+    }
+
+    $response = ['id' => $request['id']];
+    ob_start();
+    try {
+        $filename = $request['module'];
+        if (!isset($loaded[$filename])) {
+            (new DotEnvEnvironment)->load(dirname($filename));
+            include_once($filename);
+            $loaded[$filename] = true;
+        }
+
+        $functionname = $request['function'];
+        if (!function_exists($functionname)) {
+            throw new Exception("No function found by the name: $functionname");
+        }
+
+        $result = ($functionname)(...($request['args'] ?? []));
+        $output = ob_get_clean();
+        $response['result'] = $result ?? $output;
+    } catch (Throwable $th) {
+        ob_end_clean();
+        $response['error'] = $th->getMessage();
+    }
+    send($response);
+}
@@ -0,0 +1,117 @@
+import os
+import hmac
+import mmap
+import uuid
+import inspect
+import hashlib
+import tempfile
+
+# Handles of large request bodies and results, shared with
+# the server through files in RUNIT_PAYLOAD_DIR. Kept apart
+# from runit itself: runners may run in the project's own
+# interpreter, where runit isn't installed.
+HANDLE_KEY = '$payload'
+OCTET_STREAM = 'application/octet-stream'
+
+
+class Payload():
+    __slots__ = ('path', 'size', 'content_type', 'filename')
+
+    def __init__(self, path, size=None, content_type=OCTET_STREAM, filename=None):
+        self.path = str(path)
+        self.size = os.path.getsize(self.path) if size is None else size
+        self.content_type = content_type or OCTET_STREAM
+        self.filename = filename
+
+    def view(self):
+        if not self.size:
+            return b''
+        with open(self.path, 'rb') as file:
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self):
+        with open(self.path, 'rb') as file:
+            return file.read()
+
+    def open(self):
+        return open(self.path, 'rb')
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f'Payload({self.path!r}, size={self.size}, content_type={self.content_type!r})'
+
+
+def sign(path):
+    key = os.getenv('RUNIT_PAYLOAD_KEY')
+    return hmac.new(key.encode(), path.encode(), hashlib.sha256).hexdigest() if key else None
+
+
+def is_handle(value):
+    # Only handles signed by the server, for files in the payload
+    # directory; clients can send lookalike dicts as arguments
+    if not isinstance(value, dict):
+        return False
+    path, token = value.get(HANDLE_KEY), value.get('token')
+    if not isinstance(path, str) or not isinstance(token, str):
+        return False
+    expected, directory = sign(path), os.getenv('RUNIT_PAYLOAD_DIR')
+    if expected is None or directory is None or not hmac.compare_digest(token, expected):
+        return False
+    return os.path.dirname(os.path.realpath(path)) == os.path.realpath(directory)
+
+
+def resolve(value):
+    if isinstance(value, list):
+        return [resolve(item) for item in value]
+    if is_handle(value):
+        return Payload(value[HANDLE_KEY], value.get('size'), value.get('content_type'), value.get('filename'))
+    return value
+
+
+def resolve_arguments(args, kwargs):
+    return [resolve(value) for value in args], {name: resolve(value) for name, value in kwargs.items()}
+
+
+def bind_keywords(method, args, kwargs):
+    '''
+    Drop named arguments the function doesn't take,
+    unless it accepts **kwargs, the way the server's
+    in-memory call plans bind them
+    '''
+    try:
+        parameters = list(inspect.signature(method).parameters.values())
+    except (TypeError, ValueError):
+        return args, kwargs
+    if any(parameter.kind is parameter.VAR_KEYWORD for parameter in parameters):
+        return args, kwargs
+
+    args, kwargs = list(args), dict(kwargs)
+    if not args:
+        # Positional-only parameters can't be passed by name
+        for parameter in parameters:
+            if parameter.kind is not parameter.POSITIONAL_ONLY or parameter.name not in kwargs:
+                break
+            args.append(kwargs.pop(parameter.name))
+    names = {parameter.name for parameter in parameters
+             if parameter.kind in (parameter.POSITIONAL_OR_KEYWORD, parameter.KEYWORD_ONLY)}
+    return args, {name: value for name, value in kwargs.items() if name in names}
+
+
+def store(value):
+    '''
+    Handle for a binary result, written to a payload
+    file instead of being encoded into the envelope
+    '''
+    if isinstance(value, Payload):
+        return {HANDLE_KEY: value.path, 'size': value.size, 'content_type': value.content_type,
+                'token': sign(value.path)}
+    if not isinstance(value, (bytes, bytearray, memoryview, mmap.mmap)):
+        return value
+    directory = os.getenv('RUNIT_PAYLOAD_DIR') or tempfile.gettempdir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, uuid.uuid4().hex)
+    with open(path, 'wb') as file:
+        file.write(value)
+    return {HANDLE_KEY: path, 'size': os.path.getsize(path), 'content_type': OCTET_STREAM, 'token': sign(path)}
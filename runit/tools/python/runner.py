@@ -1,44 +1,71 @@
 import os
 import sys
+import json
+import time
 import inspect
 import asyncio
 from dotenv import load_dotenv
+from runit_payloads import bind_keywords, resolve_arguments, store
+
+# Marks the envelope line so it can be told apart
+# from anything the function prints itself
+ENVELOPE_MARKER = '\x1e'
 
 args = sys.argv
-functionArguments = None
 
-async def run_async_function(async_func, *args):
-    return await async_func(*args)
+async def run_async_function(async_func, *args, **kwargs):
+    return await async_func(*args, **kwargs)
+
+def send(envelope):
+    sys.stdout.write(ENVELOPE_MARKER + json.dumps(envelope, default=str) + '\n')
+    sys.stdout.flush()
+
+def read_arguments():
+    # "-" means a frame of {"args": [...], "kwargs": {...}} on stdin
+    if len(args) > 3 and args[3] == '-':
+        data = sys.stdin.buffer.read()
+        if os.getenv('RUNIT_ARGS_FORMAT') == 'msgpack':
+            import msgpack
+            frame = msgpack.unpackb(data) if data else {}
+        else:
+            frame = json.loads(data) if data else {}
+        return resolve_arguments(frame.get('args') or [], frame.get('kwargs') or {})
+    if len(args) > 3:
+        return [args[3]], {}
+    return [], {}
 
+start = time.perf_counter()
 try:
     if len(args) >= 3:
         filename = args[1]
         functionname = args[2]
         filepath = os.path.split(filename)[0]
-        filepath = os.path.split(filename)[0]
         env_path = os.path.join(filepath, '.env')
         if os.path.exists(env_path):
             load_dotenv(env_path)
         sys.path.append(filepath)
         module = __import__(str(inspect.getmodulename(filename)))
-        method = [f[1] for f in inspect.getmembers(module, inspect.isfunction) if f[0] == functionname][0]
-        
-        sig = inspect.signature(method)
-        params = sig.parameters
+        methods = [f[1] for f in inspect.getmembers(module, inspect.isfunction) if f[0] == functionname]
+        if not methods:
+            raise LookupError(f'No function found by the name: {functionname}')
+        method = methods[0]
         
-        if len(args) > 3:
-            functionArguments = args[3]
-        
-        if len(params.keys()) and functionArguments:
-            if asyncio.iscoroutinefunction(method):
-                result = asyncio.run(run_async_function(method, functionArguments))
-            else:
-                result = method(functionArguments)
+        positional, named = bind_keywords(method, *read_arguments())
+        if asyncio.iscoroutinefunction(method):
+            result = asyncio.run(run_async_function(method, *positional, **named))
         else:
-            if asyncio.iscoroutinefunction(method):
-                result = asyncio.run(run_async_function(method))
+            result = method(*positional, **named)
+        if inspect.isgenerator(result):
+            if os.getenv('RUNIT_STREAM') == '1':
+                # One JSON line per item, sent as soon as it is produced
+                for item in result:
+                    sys.stdout.write(json.dumps(store(item), default=str) + '\n')
+                    sys.stdout.flush()
+                result = None
             else:
-                result = method()
-        print(result)          
+                result = list(result)
+        send({'status': 'ok', 'value': store(result),
+              'timings': {'elapsed_ms': (time.perf_counter() - start) * 1000}})
 except Exception as e:
-    print(str(e))
\ No newline at end of file
+    send({'status': 'error', 'error': str(e),
+          'timings': {'elapsed_ms': (time.perf_counter() - start) * 1000}})
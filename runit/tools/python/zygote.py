@@ -0,0 +1,145 @@
+import os
+import gc
+import sys
+import json
+import signal
+import inspect
+import asyncio
+import selectors
+
+from runit_payloads import bind_keywords, resolve_arguments, store
+
+# Protocol frames are written to a private copy of stdout;
+# anything printed by user code ends up on stderr.
+protocol = os.fdopen(os.dup(sys.stdout.fileno()), 'wb', buffering=0)
+os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+modules = {}
+children = {}
+selector = selectors.DefaultSelector()
+
+
+def send(message: bytes):
+    protocol.write(message + b'\n')
+
+
+def load_module(filename):
+    if filename not in modules:
+        filepath = os.path.split(filename)[0]
+        env_path = os.path.join(filepath, '.env')
+        if os.path.exists(env_path):
+            try:
+                from dotenv import load_dotenv
+                load_dotenv(env_path)
+            except ImportError:
+                pass
+        sys.path.append(filepath)
+        modules[filename] = __import__(str(inspect.getmodulename(filename)))
+        # Keep the warm heap out of the collector so forked
+        # children don't dirty shared pages while scanning it
+        gc.freeze()
+    return modules[filename]
+
+
+def execute(module, request):
+    try:
+        method = getattr(module, request['function'], None)
+        if not inspect.isfunction(method):
+            return {'id': request['id'], 'error': f"No function found by the name: {request['function']}"}
+
+        args, kwargs = bind_keywords(method, *resolve_arguments(request.get('args') or [], request.get('kwargs') or {}))
+        if asyncio.iscoroutinefunction(method):
+            result = asyncio.run(method(*args, **kwargs))
+        else:
+            result = method(*args, **kwargs)
+        return {'id': request['id'], 'result': store(result)}
+    except Exception as e:
+        return {'id': request['id'], 'error': str(e)}
+
+
+def fork_request(request):
+    try:
+        module = load_module(request['module'])
+    except Exception as e:
+        return send(json.dumps({'id': request['id'], 'error': str(e)}).encode())
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        children.clear()
+        os.close(read_fd)
+        protocol.close()
+        selector.close()
+        response = execute(module, request)
+        data = json.dumps(response, default=str).encode()
+        with os.fdopen(write_fd, 'wb') as pipe:
+            pipe.write(data)
+        os._exit(0)
+
+    os.close(write_fd)
+    children[read_fd] = (pid, request['id'], [])
+    selector.register(read_fd, selectors.EVENT_READ)
+
+
+def collect_child(read_fd):
+    chunk = os.read(read_fd, 65536)
+    if chunk:
+        children[read_fd][2].append(chunk)
+        return
+
+    selector.unregister(read_fd)
+    os.close(read_fd)
+    pid, request_id, chunks = children.pop(read_fd)
+    _, status = os.waitpid(pid, 0)
+    if chunks:
+        send(b''.join(chunks))
+    else:
+        code = os.waitstatus_to_exitcode(status)
+        send(json.dumps({'id': request_id, 'error': f'Function exited with code {code}'}).encode())
+
+
+def kill_children(*_):
+    for pid, _, _ in children.values():
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def stop(signum, frame):
+    kill_children()
+    os._exit(128 + signum)
+
+
+def main():
+    # The server closes stdin once it no longer waits for any
+    # call; children still running then would only be orphaned
+    signal.signal(signal.SIGTERM, stop)
+    stdin_fd = sys.stdin.fileno()
+    selector.register(stdin_fd, selectors.EVENT_READ)
+    buffer = b''
+    stdin_open = True
+
+    while stdin_open or children:
+        for key, _ in selector.select():
+            if key.fd != stdin_fd:
+                collect_child(key.fd)
+                continue
+
+            chunk = os.read(stdin_fd, 65536)
+            if not chunk:
+                selector.unregister(stdin_fd)
+                stdin_open = False
+                kill_children()
+                continue
+
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                if line.strip():
+                    fork_request(json.loads(line))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+from email.message import Message
+from typing import AsyncIterator, Optional
+from urllib.parse import parse_qsl
+
+from .languages.payloads import Payload, new_path
+from .exceptions import MalformedUpload, UploadTooLarge
+from .constants import UPLOAD_MAX_FILE_SIZE, UPLOAD_MAX_FIELD_SIZE, UPLOAD_MAX_PARTS
+
+MAX_HEADER_SIZE = 16 * 1024
+
+PREAMBLE, BOUNDARY, HEADERS, BODY, DONE = range(5)
+
+
+def header_param(value: str, name: str, param: str) -> Optional[str]:
+    '''
+    Parameter of a header value such as the name in
+    `form-data; name="file"`, quoted or RFC 2231 encoded
+
+    @param value Header value
+    @param name Header name
+    @param param Parameter name
+    @return str|None
+    '''
+    message = Message()
+    message[name] = value
+    if param == 'filename':
+        return message.get_filename()
+    result = message.get_param(param, header=name)
+    return result if isinstance(result, str) or result is None else str(result)
+
+
+def add_value(values: dict, name: str, value):
+    # Repeated names collect their values in a list
+    if name not in values:
+        values[name] = value
+    elif isinstance(values[name], list):
+        values[name].append(value)
+    else:
+        values[name] = [values[name], value]
+
+
+class MultipartParser():
+    '''
+    Incremental multipart/form-data parser. Fields
+    are collected as text; every file part is
+    written straight to a payload file as its bytes
+    arrive, so memory use doesn't depend on upload
+    size. Limits are checked while parsing, before
+    more data is accepted.
+    '''
+
+    def __init__(self, boundary: str, max_file_size: int = UPLOAD_MAX_FILE_SIZE,
+                 max_field_size: int = UPLOAD_MAX_FIELD_SIZE, max_parts: int = UPLOAD_MAX_PARTS):
+        # Leading CRLF lets the first boundary match the same
+        # delimiter as the ones between parts
+        self.delimiter = b'\r\n--' + boundary.encode('latin-1')
+        self.max_file_size = max_file_size
+        self.max_field_size = max_field_size
+        self.max_parts = max_parts
+        self.buffer = bytearray(b'\r\n')
+        self.state = PREAMBLE
+        self.parts = 0
+        self.values: dict = {}
+        self.files: list[Payload] = []
+        self._name: Optional[str] = None
+        self._field: Optional[bytearray] = None
+        self._file = None
+        self._payload: Optional[Payload] = None
+
+    def feed(self, chunk: bytes):
+        '''
+        Parse the next chunk of the body
+
+        @param chunk Bytes as they arrived
+        @return None
+        @raises MalformedUpload, UploadTooLarge
+        '''
+        self.buffer += chunk
+        while self._step():
+            pass
+
+    def finish(self) -> dict:
+        '''
+        Values by field name once the whole body has
+        been fed; repeated names give a list
+
+        @param None
+        @return dict
+        '''
+        if self.state != DONE:
+            raise MalformedUpload('Incomplete multipart body')
+        return self.values
+
+    def close(self):
+        '''
+        Delete every file written so far, for
+        uploads that failed or were abandoned
+        '''
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        for payload in self.files:
+            payload.release()
+
+    def _step(self) -> bool:
+        if self.state == PREAMBLE:
+            index = self.buffer.find(self.delimiter)
+            if index < 0:
+                del self.buffer[:max(0, len(self.buffer) - len(self.delimiter))]
+                return False
+            del self.buffer[:index + len(self.delimiter)]
+            self.state = BOUNDARY
+            return True
+
+        if self.state == BOUNDARY:
+            if len(self.buffer) < 2:
+                return False
+            if self.buffer.startswith(b'--'):
+                self.state = DONE
+                self.buffer.clear()
+                return False
+            end = self.buffer.find(b'\r\n')
+            if end < 0:
+                return False
+            if self.buffer[:end].strip(b' \t'):
+                raise MalformedUpload('Malformed multipart boundary')
+            del self.buffer[:end + 2]
+            self.state = HEADERS
+            return True
+
+        if self.state == HEADERS:
+            end = self.buffer.find(b'\r\n\r\n')
+            if end < 0:
+                if len(self.buffer) > MAX_HEADER_SIZE:
+                    raise MalformedUpload('Multipart headers too large')
+                return False
+            self._start_part(bytes(self.buffer[:end]).decode('latin-1'))
+            del self.buffer[:end + 4]
+            self.state = BODY
+            return True
+
+        if self.state == BODY:
+            index = self.buffer.find(self.delimiter)
+            if index < 0:
+                # Keep a possible partial delimiter for the next chunk
+                keep = len(self.delimiter) - 1
+                if len(self.buffer) > keep:
+                    self._write(self.buffer[:-keep])
+                    del self.buffer[:-keep]
+                return False
+            self._write(self.buffer[:index])
+            del self.buffer[:index + len(self.delimiter)]
+            self._end_part()
+            self.state = BOUNDARY
+            return True
+
+        self.buffer.clear()
+        return False
+
+    def _start_part(self, block: str):
+        self.parts += 1
+        if self.parts > self.max_parts:
+            raise UploadTooLarge(f'At most {self.max_parts} form parts are accepted')
+
+        headers = {}
+        for line in block.split('\r\n'):
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        disposition = headers.get('content-disposition', '')
+        self._name = header_param(disposition, 'content-disposition', 'name')
+        if not self._name:
+            raise MalformedUpload('Form part without a name')
+
+        filename = header_param(disposition, 'content-disposition', 'filename')
+        if filename is None:
+            self._field = bytearray()
+            return
+        path = new_path()
+        self._file = open(path, 'wb')
+        self._payload = Payload(path, 0, headers.get('content-type'), filename)
+        self.files.append(self._payload)
+
+    def _write(self, data: bytearray):
+        if not data:
+            return
+        if self._file is not None:
+            self._payload.size += len(data)
+            if self._payload.size > self.max_file_size:
+                raise UploadTooLarge(f'Uploaded files are limited to {self.max_file_size} bytes')
+            self._file.write(data)
+        else:
+            self._field += data
+            if len(self._field) > self.max_field_size:
+                raise UploadTooLarge(f'Form fields are limited to {self.max_field_size} bytes')
+
+    def _end_part(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            value = self._payload
+        else:
+            value = self._field.decode(errors='replace')
+        self._field = self._payload = None
+        add_value(self.values, self._name, value)
+
+
+async def parse_multipart(chunks: AsyncIterator[bytes], content_type: str, **limits) -> dict:
+    '''
+    Parse a streamed multipart/form-data body
+
+    @param chunks Body chunks as they arrive
+    @param content_type Content-Type header, with the boundary
+    @param limits max_file_size, max_field_size and max_parts
+    @return dict Field values and Payloads of uploaded files
+    @raises MalformedUpload, UploadTooLarge
+    '''
+    boundary = header_param(content_type, 'content-type', 'boundary')
+    if not boundary:
+        raise MalformedUpload('Missing multipart boundary')
+
+    parser = MultipartParser(boundary, **limits)
+    try:
+        async for chunk in chunks:
+            parser.feed(chunk)
+        return parser.finish()
+    except BaseException:
+        parser.close()
+        raise
+
+
+async def parse_urlencoded(chunks: AsyncIterator[bytes], max_size: int = UPLOAD_MAX_FIELD_SIZE) -> dict:
+    '''
+    Parse a streamed application/x-www-form-urlencoded body
+
+    @param chunks Body chunks as they arrive
+    @param max_size Largest body accepted
+    @return dict Field values
+    @raises UploadTooLarge
+    '''
+    body = bytearray()
+    async for chunk in chunks:
+        body += chunk
+        if len(body) > max_size:
+            raise UploadTooLarge(f'Form bodies are limited to {max_size} bytes')
+
+    values = {}
+    for name, value in parse_qsl(body.decode(errors='replace'), keep_blank_values=True):
+        add_value(values, name, value)
+    return values
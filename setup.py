@@ -20,6 +20,7 @@ setup(
         'requests>=2.28.0',
         'python-dotenv>=1.0.0',
         'fastapi>=0.100.0',
+        'starlette>=0.39.0',
         'passlib>=1.7.4',
         'docker>=6.0.0',
         'uvicorn>=0.23.0',
@@ -28,6 +29,7 @@ setup(
     ],
     extras_require={
         'ai': ['openai>=1.0.0'],
+        'fast': ['orjson>=3.9.0', 'msgpack>=1.0.0', 'brotli>=1.0.9'],
         'dev': ['pytest>=7.0.0', 'pytest-cov>=4.0.0'],
     },
     keywords='python3 runit developer serverless architecture docker',
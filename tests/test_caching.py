@@ -39,6 +39,65 @@ class TestFunctionCaching:
         assert Runtime._cache_ttl <= 3600, \
             "Cache TTL should be at most 1 hour"
 
+    def test_cache_survives_restart(self, tmp_path):
+        """Ensure metadata stored by one process is found by the next."""
+        from runit.languages.cache import FunctionCache
+
+        module = tmp_path / 'application.py'
+        module.write_text('def index():\n    pass\n')
+
+        first = FunctionCache(tmp_path / 'functions.db')
+        key = first.make_key(str(module), 'loader.py', sys.executable)
+        assert first.lookup(key) is None
+        first.store(key, {'index': []})
+
+        second = FunctionCache(tmp_path / 'functions.db')
+        assert second.lookup(second.make_key(str(module), 'loader.py', sys.executable)) == {'index': []}
+        assert second.stats()['hits'] == 1
+
+    def test_key_follows_content(self, tmp_path):
+        """Ensure editing a module changes its cache key."""
+        from runit.languages.cache import FunctionCache
+
+        module = tmp_path / 'application.py'
+        module.write_text('def index():\n    pass\n')
+        cache = FunctionCache(None)
+        key = cache.make_key(str(module), 'loader.py', sys.executable)
+
+        module.write_text('def index(name):\n    pass\n')
+        assert cache.make_key(str(module), 'loader.py', sys.executable) != key
+
+    def test_memory_front_is_bounded(self):
+        """Ensure the in-memory LRU evicts the least recently used entry."""
+        from runit.languages.cache import FunctionCache
+
+        cache = FunctionCache(None, max_entries=2)
+        cache.store('a', {})
+        cache.store('b', {})
+        cache.lookup('a')
+        cache.store('c', {})
+
+        assert list(cache.keys()) == ['a', 'c']
+        assert cache.stats()['misses'] == 0
+
+    def test_runtime_skips_loader_on_cache_hit(self, tmp_path, monkeypatch):
+        """Ensure a cold parser with cached metadata never spawns the loader."""
+        from runit.languages.cache import FunctionCache
+        from runit.languages.runtime import Runtime
+        from runit.languages.javascript import Javascript
+
+        (tmp_path / 'main.js').write_text("module.exports = require('./handlers')")
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(Runtime, '_function_cache', FunctionCache(tmp_path / 'functions.db'))
+        key = Runtime._function_cache.make_key(str(tmp_path / 'main.js'), Javascript.LOADER, 'node')
+        Runtime._function_cache.store(key, {'index': []})
+        monkeypatch.setattr(Runtime, '_function_cache', FunctionCache(tmp_path / 'functions.db'))
+
+        with patch('runit.languages.runtime.subprocess.run') as run:
+            parser = Javascript('main.js', 'node', False, False, '')
+            assert parser.functions == {'index': []}
+            run.assert_not_called()
+
 
 class TestLanguageParserReuse:
     """Test language parser reuse in RunIt."""
@@ -0,0 +1,261 @@
+"""
+Tests for function discovery in language parsers.
+"""
+import os
+import sys
+import subprocess
+import pytest
+from pathlib import Path
+from unittest.mock import patch, MagicMock
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture(autouse=True)
+def function_cache(tmp_path, monkeypatch):
+    from runit.languages.cache import FunctionCache
+    from runit.languages.runtime import Runtime
+
+    cache = FunctionCache(tmp_path / 'functions.db')
+    monkeypatch.setattr(Runtime, '_function_cache', cache)
+    return cache
+
+
+@pytest.fixture
+def multi_project(tmp_path, monkeypatch):
+    (tmp_path / 'application.py').write_text("def index():\n    return 'python'\n")
+    (tmp_path / 'main.js').write_text("module.exports = require('./hello')\n")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def fake_loader(command, **kwargs):
+    return MagicMock(stdout='{"hello": ["name"]}')
+
+
+class TestMultiDiscovery:
+    """Test lazy, parallel and incremental discovery for Multi projects."""
+
+    def test_discovery_is_lazy(self, multi_project):
+        """Ensure no loader runs until functions are looked up."""
+        from runit.languages.multi import Multi
+
+        with patch('runit.languages.multi.subprocess.run', side_effect=fake_loader) as run:
+            parser = Multi('application.py', 'multi', False, False, '')
+            assert run.call_count == 0
+
+            assert sorted(parser.list_functions()) == ['hello', 'index']
+            assert parser.functions['hello']['parameters'] == ['name']
+            assert parser.parameters('hello') == ['name']
+            assert run.call_count == 1
+
+    def test_unchanged_files_are_not_rescanned(self, multi_project):
+        """Ensure a rebuilt parser only rescans files that changed."""
+        from runit.languages.multi import Multi
+
+        with patch('runit.languages.multi.subprocess.run', side_effect=fake_loader) as run:
+            Multi('application.py', 'multi', False, False, '').list_functions()
+            Multi('application.py', 'multi', False, False, '').list_functions()
+            assert run.call_count == 1
+
+            (multi_project / 'main.js').write_text("module.exports = require('./greetings')\n")
+            Multi('application.py', 'multi', False, False, '').list_functions()
+            assert run.call_count == 2
+            assert run.call_args[0][0][-1].endswith('main.js')
+
+
+PY_MODULE = """
+import os
+from helpers import shout, CONSTANT
+
+print('side effect')
+
+def index():
+    return 'Yay, Python works'
+
+async def greet(name: str, times: int = 2, *, loud=False):
+    return name * times
+
+double = lambda value: value * 2
+
+def _private():
+    pass
+
+class Model:
+    pass
+"""
+
+HELPERS = """
+def shout(text):
+    return text.upper()
+
+CONSTANT = 1
+"""
+
+
+class TestPythonStaticDiscovery:
+    """Test AST-based discovery of Python functions."""
+
+    def test_scan_extracts_signatures(self, tmp_path):
+        """Ensure names, parameters, defaults and annotations are extracted."""
+        from runit.languages.discovery import scan_python
+
+        (tmp_path / 'application.py').write_text(PY_MODULE)
+        (tmp_path / 'helpers.py').write_text(HELPERS)
+        signatures = scan_python(str(tmp_path / 'application.py'))
+
+        assert sorted(signatures) == ['double', 'greet', 'index', 'shout']
+        assert signatures['greet'] == {
+            'parameters': ['name', 'times', 'loud'],
+            'defaults': {'times': 2, 'loud': False},
+            'annotations': {'name': 'str', 'times': 'int'},
+            'is_async': True,
+            'is_generator': False
+        }
+        assert signatures['shout']['parameters'] == ['text']
+
+    @pytest.mark.parametrize('source', [
+        'from os.path import *\n',
+        'def __getattr__(name):\n    pass\n',
+        'def make():\n    return lambda: 1\nindex = make()\n',
+        "globals()['index'] = lambda: 1\n",
+        'try:\n    import x\nexcept ImportError:\n    def index():\n        pass\n',
+        'import functools\n@functools.lru_cache\ndef index():\n    pass\n',
+        'class Handler:\n    pass\ndef wrap(func):\n    return Handler()\n@wrap\ndef index(request):\n    pass\n',
+    ])
+    def test_dynamic_modules_fall_back(self, tmp_path, source):
+        """Ensure namespaces built at runtime are left to the import loader."""
+        from runit.languages.discovery import scan_python
+
+        (tmp_path / 'application.py').write_text(source)
+        assert scan_python(str(tmp_path / 'application.py')) is None
+
+    def test_parser_does_not_import_module(self, tmp_path, monkeypatch, capsys):
+        """Ensure listing functions never executes the user module."""
+        from runit.languages.python import Python
+
+        (tmp_path / 'application.py').write_text(PY_MODULE)
+        (tmp_path / 'helpers.py').write_text(HELPERS)
+        monkeypatch.chdir(tmp_path)
+
+        with patch('runit.languages.runtime.subprocess.run') as run:
+            parser = Python('application.py', sys.executable)
+            assert parser.functions['greet'] == ['name', 'times', 'loud']
+            run.assert_not_called()
+        assert 'side effect' not in capsys.readouterr().out
+
+        assert parser.invoke('index') == 'Yay, Python works'
+        assert 'side effect' in capsys.readouterr().out
+
+
+JS_MODULE = """
+const url = 'http://example.com/{a,b}'
+function helper(a, b = {x: 1}, ...rest) { return a }
+const arrow = async (x, y) => x
+const VERSION = '1.0'
+exports.early = () => 1
+module.exports = {
+    helper,
+    arrow,
+    VERSION,
+    inline: (value) => value,
+    async method(m, n) { return m },
+}
+module.exports.later = (p) => p
+"""
+
+TS_MODULE = """
+export function add(a: number, b?: number): number { return a }
+export const scale = (a: number, by = 2): number => a * by
+const shout = (text: string) => text.toUpperCase()
+export { shout as loud }
+export const LIMIT = 5
+"""
+
+PHP_MODULE = """<html><?php
+include 'helpers.php';
+// function commented($x) {}
+function Index() { return "{"; }
+function printout(string $word = "a,b", ...$rest) { $f = function($q) { return 1; }; }
+class Controller { public function action($request) {} }
+?></html>
+"""
+
+
+class TestStaticExportDiscovery:
+    """Test static export discovery for Javascript and PHP."""
+
+    def test_commonjs_exports(self, tmp_path):
+        """Ensure CommonJS exports are found in source order with parameters."""
+        from runit.languages.discovery import scan_functions
+
+        (tmp_path / 'main.js').write_text(JS_MODULE)
+        assert scan_functions(str(tmp_path / 'main.js')) == {
+            'helper': ['a', 'b', 'rest'],
+            'arrow': ['x', 'y'],
+            'inline': ['value'],
+            'method': ['m', 'n'],
+            'later': ['p']
+        }
+
+    def test_es_module_exports(self, tmp_path):
+        """Ensure ES exports and Typescript annotations are handled."""
+        from runit.languages.discovery import scan_functions
+
+        (tmp_path / 'main.ts').write_text(TS_MODULE)
+        assert scan_functions(str(tmp_path / 'main.ts')) == {
+            'add': ['a', 'b'],
+            'scale': ['a', 'by'],
+            'loud': ['text']
+        }
+
+    @pytest.mark.parametrize('source', [
+        "module.exports = require('./impl')",
+        "module.exports = { ...require('./impl') }",
+        "const impl = require('./impl')\nexports.index = impl.index",
+        "Object.assign(module.exports, handlers)",
+    ])
+    def test_unresolved_javascript_falls_back(self, tmp_path, source):
+        """Ensure exports that need the module loaded are left to the loader."""
+        from runit.languages.discovery import scan_functions
+
+        (tmp_path / 'main.js').write_text(source)
+        assert scan_functions(str(tmp_path / 'main.js')) is None
+
+    def test_php_top_level_functions(self, tmp_path):
+        """Ensure only top-level PHP functions, including included ones, are listed."""
+        from runit.languages.discovery import scan_functions
+
+        (tmp_path / 'index.php').write_text(PHP_MODULE)
+        (tmp_path / 'helpers.php').write_text('<?php function helper($value) {}')
+        assert scan_functions(str(tmp_path / 'index.php')) == {
+            'helper': ['value'],
+            'index': [],
+            'printout': ['word', 'rest']
+        }
+
+    @pytest.mark.parametrize('source', [
+        "<?php if (!function_exists('index')) { function index() {} }",
+        "<?php include $path;",
+    ])
+    def test_unresolved_php_falls_back(self, tmp_path, source):
+        """Ensure conditional declarations and dynamic includes are left to the loader."""
+        from runit.languages.discovery import scan_functions
+
+        (tmp_path / 'index.php').write_text(source)
+        assert scan_functions(str(tmp_path / 'index.php')) is None
+
+    def test_javascript_parser_skips_loader(self, tmp_path, monkeypatch):
+        """Ensure a Javascript parser resolves exports without spawning node."""
+        from runit.languages.javascript import Javascript
+
+        (tmp_path / 'main.js').write_text(JS_MODULE)
+        monkeypatch.chdir(tmp_path)
+        with patch('runit.languages.runtime.subprocess.run') as run:
+            parser = Javascript('main.js', 'node', False, False, '')
+            assert parser.functions['inline'] == ['value']
+            run.assert_not_called()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,1103 @@
+"""
+Tests for request handling in the web server.
+"""
+import os
+import sys
+import json
+import shutil
+import subprocess
+import time
+import asyncio
+import logging
+import pytest
+from pathlib import Path
+
+import httpx
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture(autouse=True)
+def function_cache(tmp_path, monkeypatch):
+    from runit.languages.cache import FunctionCache
+    from runit.languages.runtime import Runtime
+
+    cache = FunctionCache(tmp_path / 'functions.db')
+    monkeypatch.setattr(Runtime, '_function_cache', cache)
+    return cache
+
+
+APPLICATION = """
+import os
+import time
+import threading
+
+IMPORTED_BY = os.getpid()
+
+def index():
+    return 'Yay, Python works'
+
+def printout(string):
+    return string
+
+def sleepy():
+    time.sleep(0.3)
+    return 'rested'
+
+async def thread():
+    return threading.current_thread().name
+
+def pid():
+    import os
+    return os.getpid()
+
+def crunch(n: int):
+    return sum(i * i for i in range(n))
+
+calls = []
+
+def counted(value):
+    calls.append(value)
+    return f'{value}:{len(calls)}'
+
+def slow_counted(value):
+    time.sleep(0.2)
+    calls.append(value)
+    return f'{value}:{len(calls)}'
+
+batches = []
+
+def score(items):
+    batches.append(len(items))
+    return [int(value) * 10 for value, in items]
+
+def combine(items):
+    return [int(a) * 10 - int(b) for a, b in items]
+
+def first(items):
+    return items[:1]
+
+def announce():
+    print('first')
+    time.sleep(1)
+    yield 'last'
+
+def rows(count: int):
+    for i in range(count):
+        yield {'row': i}
+
+async def ticks():
+    for i in range(2):
+        yield i
+
+def quoted():
+    return {"text": "it's 404 free", "code": 404}
+
+def fails():
+    raise ValueError('nope')
+
+def describe(name, times: int = 1, loud: bool = False):
+    text = ' '.join([name] * times)
+    return text.upper() if loud else text
+
+def measure(body):
+    return {'size': len(body), 'type': type(body).__name__, 'head': bytes(body.view()[:4]).decode()}
+
+def blob(size: int):
+    return bytes(size)
+
+def echo(body):
+    return body
+
+def imported_by():
+    return IMPORTED_BY
+
+def listing(n: int):
+    return [{'index': i, 'text': 'lorem ipsum dolor'} for i in range(n)]
+
+def upload(title, document):
+    return {'title': title, 'filename': document.filename, 'size': document.size,
+            'content_type': document.content_type, 'head': document.read()[:5].decode()}
+"""
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    from runit.runit import RunIt
+
+    config = {
+        'name': 'demo',
+        'language': 'python',
+        'runtime': sys.executable,
+        'start_file': 'application.py'
+    }
+    (tmp_path / 'application.py').write_text(APPLICATION)
+    (tmp_path / 'runit.json').write_text(json.dumps(config))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(RunIt.PYTHON_PATHS, sys.platform, sys.executable)
+    return RunIt(**config)
+
+
+@pytest.fixture
+def process_project(project):
+    from runit.languages.processes import ProcessPool
+
+    project.functions = {'*': {'execution': 'process'}, 'index': {'execution': 'thread'}}
+    yield project
+    ProcessPool.shutdown_all()
+
+
+@pytest.fixture
+def app(project):
+    from runit.core import WebServer
+
+    server = WebServer(project, max_workers=4)
+    app = server.create_app()
+    server.add_routes(app)
+    return app
+
+
+def post(app, path, **kwargs):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://runit') as client:
+            return await client.post(path, **kwargs)
+    return asyncio.run(run())
+
+
+def get(app, path, **kwargs):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://runit') as client:
+            return await client.get(path, **kwargs)
+    return asyncio.run(run())
+
+
+def request_all(app, paths):
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://runit') as client:
+            return await asyncio.gather(*(client.get(path) for path in paths))
+    return asyncio.run(run())
+
+
+class TestAsyncDispatch:
+    """Test that function execution does not block the event loop."""
+
+    def test_serves_function(self, app):
+        """Ensure a plain request still returns the function result."""
+        response, = request_all(app, ['/printout?string=hello'])
+        assert response.json() == 'hello'
+
+    def test_blocking_functions_run_concurrently(self, app):
+        """Ensure slow sync functions are offloaded to the executor."""
+        start = time.monotonic()
+        responses = request_all(app, ['/sleepy'] * 4)
+        elapsed = time.monotonic() - start
+
+        assert [r.json() for r in responses] == ['rested'] * 4
+        assert elapsed < 0.9
+
+    def test_coroutines_run_on_the_event_loop(self, app):
+        """Ensure loaded coroutine functions are awaited natively."""
+        request_all(app, ['/index'])
+        response, = request_all(app, ['/thread'])
+        assert not response.json().startswith('runit')
+
+    def test_parser_is_resolved_off_the_event_loop(self, app, project, monkeypatch):
+        """Ensure parser rebuilds, module imports, streams and cache keys never run on the event loop thread."""
+        import threading
+        from runit.runit import RunIt
+        from runit.languages.python import Python
+
+        threads = []
+
+        def record(cls, name):
+            original = getattr(cls, name)
+
+            def wrapper(self, *args):
+                threads.append((name, threading.current_thread()))
+                return original(self, *args)
+            monkeypatch.setattr(cls, name, wrapper)
+
+        for cls, name in ((RunIt, 'find_function'), (RunIt, 'open_stream'),
+                          (RunIt, 'result_cache_key'), (Python, '_import_module')):
+            record(cls, name)
+        project.functions = {'index': {'cache': 60}}
+        index, rows = request_all(app, ['/index', '/rows?count=1'])
+        assert index.json() == 'Yay, Python works' and rows.status_code == 200
+        assert {name for name, _ in threads} == {'find_function', 'open_stream', 'result_cache_key', '_import_module'}
+        assert all(thread is not threading.main_thread() for _, thread in threads)
+
+    def test_first_coroutine_call_runs_on_the_event_loop(self, app):
+        """Ensure an async function is awaited on the server loop from its very first call."""
+        response, = request_all(app, ['/thread'])
+        assert not response.json().startswith('runit')
+
+
+class TestCallPlans:
+    """Test arguments bound through precompiled call plans."""
+
+    def test_binds_by_name_and_coerces(self, app):
+        """Ensure query parameters bind by name in any order and follow annotations."""
+        response, = request_all(app, ['/describe?loud=true&times=2&name=hi'])
+        assert response.json() == 'HI HI'
+
+    def test_missing_argument_is_reported(self, project):
+        """Ensure a missing required argument is reported instead of shifting values."""
+        assert 'name' in project.serve('describe', {'times': '2'})
+
+    def test_plans_are_compiled_once(self, project):
+        """Ensure plans are shared until the module changes."""
+        from runit.languages.python import Python
+
+        first = project.lang_parser
+        first.invoke('index')
+        assert Python._module_plans[first.module] is first._plans
+        assert first._plans['describe'].coercers.keys() == {'times', 'loud'}
+
+
+class TestResultCache:
+    """Test the opt-in per-function result cache."""
+
+    def test_cached_function_runs_once(self, project, app):
+        """Ensure identical calls are served from the cache and show on /metrics."""
+        project.functions = {'counted': {'cache': 60}}
+        first, second, other = [request_all(app, [path])[0]
+                                for path in ['/counted?value=a', '/counted?value=a', '/counted?value=b']]
+        assert first.json() == second.json()
+        assert other.json() != first.json()
+
+        metrics, = request_all(app, ['/metrics'])
+        assert metrics.json()['result_cache']['hits'] >= 1
+
+    def test_functions_without_policy_are_not_cached(self, project):
+        """Ensure caching is opt-in."""
+        assert project.serve('counted', {'value': 'a'}) != project.serve('counted', {'value': 'a'})
+
+    def test_fast_results_are_not_admitted(self, project):
+        """Ensure results quicker than the compute threshold are not stored."""
+        project.functions = {'counted': {'cache': {'ttl': 60, 'min_compute_ms': 1000}}}
+        assert project.serve('counted', {'value': 'a'}) != project.serve('counted', {'value': 'a'})
+        assert project.result_cache.stats()['entries'] == 0
+
+    def test_editing_the_module_invalidates(self, project, tmp_path):
+        """Ensure a changed source digest misses the cache."""
+        project.functions = {'printout': {'cache': 60}}
+        assert project.serve('printout', {'string': 'x'}) == 'x'
+        (tmp_path / 'application.py').write_text(APPLICATION.replace('return string', 'return string * 2'))
+        assert project.serve('printout', {'string': 'x'}) == 'xx'
+
+    def test_lru_is_bounded_by_bytes(self):
+        """Ensure entries are evicted once the byte budget is exceeded."""
+        from runit.languages.cache import ResultCache
+
+        cache = ResultCache(max_entries=10, max_bytes=10)
+        cache.store('a', 'x' * 6, ttl=60, elapsed=1)
+        cache.store('b', 'y' * 6, ttl=60, elapsed=1)
+        assert cache.lookup('a') is ResultCache.MISS
+        assert cache.lookup('b') == 'yyyyyy'
+
+
+class TestSingleFlight:
+    """Test coalescing of identical concurrent work."""
+
+    def test_identical_calls_share_one_execution(self, project, app):
+        """Ensure concurrent identical requests to a coalesced function run it once."""
+        project.functions = {'slow_counted': {'coalesce': True}}
+        responses = request_all(app, ['/slow_counted?value=a'] * 5 + ['/slow_counted?value=b'])
+        results = [r.json() for r in responses]
+
+        assert len(set(results[:5])) == 1
+        assert results[5] != results[0]
+
+    def test_uncoalesced_calls_run_separately(self, project, app):
+        """Ensure functions without the setting are never shared."""
+        responses = request_all(app, ['/slow_counted?value=a'] * 3)
+        assert len({r.json() for r in responses}) == 3
+
+    def test_parser_builds_are_shared(self, project):
+        """Ensure concurrent parser builds for one file and mtime wait on one build."""
+        from concurrent.futures import ThreadPoolExecutor
+        from runit.runit import RunIt
+
+        with patch('runit.runit.LanguageParser.detect_language', side_effect=lambda *a: time.sleep(0.2) or object()) as build:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                parsers = list(executor.map(lambda _: RunIt.build_parser('application.py', sys.executable), range(4)))
+        assert build.call_count == 1
+        assert len({id(parser) for parser in parsers}) == 1
+
+    def test_errors_reach_every_waiter(self):
+        """Ensure an exception in the shared call is raised for all callers."""
+        from runit.languages.singleflight import SingleFlight
+
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.05)
+            raise ValueError('boom')
+
+        async def run():
+            return await asyncio.gather(*(flight.do_async('k', fail) for _ in range(3)), return_exceptions=True)
+
+        assert [str(e) for e in asyncio.run(run())] == ['boom'] * 3
+        assert len(flight) == 0
+
+
+class TestBatch:
+    """Test the batch invocation endpoint."""
+
+    def test_results_are_ordered_with_status(self, app):
+        """Ensure results come back in request order with status and timing."""
+        response = post(app, '/_batch', json=[
+            {'function': 'printout', 'args': {'string': 'one'}},
+            {'function': 'missing'},
+            {'function': 'index'},
+            {'args': {}},
+        ])
+        results = response.json()
+
+        assert [r['index'] for r in results] == [0, 1, 2, 3]
+        assert [r['status'] for r in results] == ['ok', 'not_found', 'ok', 'error']
+        assert results[0]['result'] == 'one'
+        assert all(r['elapsed_ms'] >= 0 for r in results)
+
+    def test_calls_run_concurrently(self, app):
+        """Ensure batch items fan out instead of running one by one."""
+        start = time.monotonic()
+        response = post(app, '/_batch', json={'calls': [{'function': 'sleepy'}] * 4})
+        assert [r['result'] for r in response.json()] == ['rested'] * 4
+        assert time.monotonic() - start < 0.9
+
+    def test_streams_ndjson(self, app):
+        """Ensure streamed batches emit one JSON line per completed call."""
+        response = post(app, '/_batch?stream=1', json=[{'function': 'sleepy'}, {'function': 'index'}])
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+        assert response.headers['content-type'].startswith('application/x-ndjson')
+        assert [line['index'] for line in lines] == [1, 0]
+
+    def test_rejects_malformed_batches(self, app):
+        """Ensure a body that is not a list of calls is rejected."""
+        assert post(app, '/_batch', json={'function': 'index'}).status_code == 400
+        assert post(app, '/_batch', content=b'\xff\xfe[', headers={'content-type': 'application/json'}).status_code == 400
+
+
+class TestMicroBatching:
+    """Test merging of concurrent calls to batchable functions."""
+
+    def test_concurrent_calls_are_merged(self, project, app):
+        """Ensure requests inside the window become one call and get their own results."""
+        project.functions = {'score': {'batch': {'max_size': 8, 'window_ms': 50}}}
+        responses = request_all(app, [f'/score?value={i}' for i in range(5)])
+
+        assert [r.json() for r in responses] == [0, 10, 20, 30, 40]
+        assert project.lang_parser._loaded_module.batches == [5]
+
+    def test_batches_are_capped(self, project, app):
+        """Ensure a full batch is dispatched without waiting for the window."""
+        project.functions = {'score': {'batch': {'max_size': 2, 'window_ms': 1000}}}
+        start = time.monotonic()
+        responses = request_all(app, [f'/score?value={i}' for i in range(4)])
+
+        assert [r.json() for r in responses] == [0, 10, 20, 30]
+        assert project.lang_parser._loaded_module.batches == [2, 2]
+        assert time.monotonic() - start < 0.9
+
+    def test_named_values_bind_by_name(self, project):
+        """Ensure the order a client sends named values in doesn't change the batch item."""
+        project.functions = {'combine': {'batch': {'max_size': 8, 'window_ms': 50}}}
+
+        async def run():
+            return await asyncio.gather(project.serve_async('combine', {'a': '3', 'b': '1'}),
+                                        project.serve_async('combine', {'b': '1', 'a': '3'}))
+
+        assert asyncio.run(run()) == [29, 29]
+
+    def test_synchronous_calls_are_batches_of_one(self, project):
+        """Ensure serve() and call() wrap and unwrap a single call for batch functions."""
+        project.functions = {'combine': {'batch': True}}
+        assert project.serve('combine', {'b': '1', 'a': '3'}) == 29
+        assert project.call('combine', ['3', '1']).value == 29
+
+    def test_mismatched_results_fail_every_caller(self, project):
+        """Ensure a batch returning the wrong number of results is reported to each call."""
+        project.functions = {'first': {'batch': True}}
+
+        async def run():
+            return await asyncio.gather(*(project.serve_async('first', {'item': 'x'}) for _ in range(2)))
+
+        assert all('results for 2 calls' in result for result in asyncio.run(run()))
+
+
+class TestStreaming:
+    """Test streamed results for generators and runner output."""
+
+    def test_generator_streams_ndjson(self, app):
+        """Ensure generator items are sent as NDJSON lines."""
+        response, = request_all(app, ['/rows?count=3'])
+        assert response.headers['content-type'].startswith('application/x-ndjson')
+        assert [json.loads(line) for line in response.text.splitlines()] == [{'row': i} for i in range(3)]
+
+    def test_async_generator_streams_sse(self, app):
+        """Ensure async generators can be consumed as Server-Sent Events."""
+        response, = request_all(app, ['/ticks/sse'])
+        assert response.headers['content-type'].startswith('text/event-stream')
+        assert response.text == 'data: 0\n\ndata: 1\n\n'
+
+    def test_generators_are_detected_statically(self, project):
+        """Ensure streaming is known before the module is imported."""
+        parser = project.lang_parser
+        assert parser.is_generator('rows') and parser.is_generator('ticks')
+        assert not parser.is_generator('index')
+        assert parser._loaded_module is None
+
+    def test_runner_output_streams_by_line(self, project, tmp_path):
+        """Ensure runner stdout is yielded line by line as it is printed."""
+        from runit.languages.runtime import Runtime
+
+        runner = tmp_path / 'runner.py'
+        runner.write_text('import sys, time\nfor i in range(3):\n    print(i, flush=True)\n    time.sleep(0.05)\n')
+        parser = Runtime('application.py', sys.executable)
+        with patch.object(Runtime, 'RUNNER', str(runner)):
+            stream = parser.stream('index')
+            first = next(stream.items)
+            assert first == '0'
+            assert list(stream.items) == ['1', '2']
+
+    def test_python_runner_streams_without_buffering(self, project, monkeypatch):
+        """Ensure printed lines and generator items leave the Python runner as they are produced."""
+        from runit.languages.python import Python
+
+        monkeypatch.delenv('PYTHONUNBUFFERED', raising=False)
+        parser = Python('application.py', sys.executable, is_docker=True)
+        stream = parser.stream('announce')
+        start = time.monotonic()
+        assert next(stream.items) == 'first'
+        assert time.monotonic() - start < 0.9
+        assert list(stream.items) == ['"last"']
+
+    def test_cli_serve_collects_streams(self, project):
+        """Ensure the synchronous path returns all items at once."""
+        assert project.serve('rows', {'count': '2'}) == [{'row': 0}, {'row': 1}]
+
+
+class TestEnvelope:
+    """Test typed results and their encoding."""
+
+    def test_values_keep_their_type(self, app):
+        """Ensure apostrophes and '404' in a result are returned untouched."""
+        response, = request_all(app, ['/quoted'])
+        assert response.status_code == 200
+        assert response.json() == {'text': "it's 404 free", 'code': 404}
+        assert response.headers['server-timing'].startswith('fn;dur=')
+
+    def test_errors_and_missing_functions(self, app):
+        """Ensure failures and unknown functions get their own status codes."""
+        failed, missing = request_all(app, ['/fails', '/missing'])
+        assert failed.status_code == 500
+        assert failed.json() == {'error': 'nope'}
+        assert missing.status_code == 404
+
+    def test_runner_emits_envelope(self, project, capsys):
+        """Ensure the subprocess runner reports typed values apart from printed output."""
+        from runit.languages.runtime import Runtime
+        from runit.languages.python import PY_TOOLS_DIR
+        from runit.languages.envelope import FunctionError
+
+        parser = Runtime('application.py', sys.executable)
+        with patch.object(Runtime, 'RUNNER', os.path.join(PY_TOOLS_DIR, 'runner.py')):
+            assert parser.invoke('quoted') == {'text': "it's 404 free", 'code': 404}
+            with pytest.raises(FunctionError, match='nope'):
+                parser.invoke('fails')
+
+    def test_printed_output_is_logged(self, caplog):
+        """Ensure what a function prints goes to the log, not to stderr."""
+        from runit.languages.envelope import ENVELOPE_MARKER, read_output
+
+        with caplog.at_level(logging.INFO, logger='runit.log'):
+            value = read_output(f'hello\n{ENVELOPE_MARKER}{{"status": "ok", "value": 1}}\n')
+        assert value == 1
+        assert [record.getMessage() for record in caplog.records] == ['hello']
+
+
+class TestRunnerArguments:
+    """Test arguments passed to runners over stdin."""
+
+    def test_python_runner_binds_typed_named_arguments(self, project):
+        """Ensure values keep their types and bind by name in the Python runner."""
+        from runit.languages.python import Python
+
+        parser = Python('application.py', sys.executable, is_docker=True)
+        assert parser.invoke('describe', {'loud': True, 'times': 2, 'name': 'hi'}) == 'HI HI'
+
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason='the zygote needs os.fork')
+    def test_unknown_names_are_dropped_on_every_path(self, project):
+        """Ensure the runner and the zygote ignore extra named arguments like in-memory calls do."""
+        from runit.languages.python import Python
+        from runit.languages.workers import WorkerPool
+
+        arguments = {'string': 'x', 'extra': '1'}
+        assert Python('application.py', sys.executable).invoke('printout', arguments) == 'x'
+        assert Python('application.py', sys.executable, is_docker=True).invoke('printout', arguments) == 'x'
+        try:
+            assert Python('application.py', sys.executable, is_file=True).call_worker('printout', **arguments) == 'x'
+        finally:
+            WorkerPool.shutdown_all()
+
+    def test_large_payloads_bypass_the_command_line(self, project):
+        """Ensure arguments far larger than ARG_MAX reach the function."""
+        from runit.languages.python import Python
+
+        payload = 'x' * (4 * 1024 * 1024)
+        parser = Python('application.py', sys.executable, is_docker=True)
+        with patch('runit.languages.runtime.subprocess.Popen', wraps=subprocess.Popen) as popen:
+            assert len(parser.invoke('printout', [payload])) == len(payload)
+        assert all(len(part) < 1024 for part in popen.call_args[0][0])
+
+    @pytest.mark.skipif(shutil.which('node') is None, reason='node not installed')
+    def test_javascript_runner_orders_named_arguments(self, tmp_path, monkeypatch):
+        """Ensure named values reach positional Javascript parameters in order."""
+        monkeypatch.chdir(tmp_path)
+        from runit.languages.runtime import Runtime
+        from runit.languages.javascript import JS_TOOLS_DIR
+
+        (tmp_path / 'main.js').write_text('exports.sub = (a, b) => a - b\n')
+        parser = Runtime('main.js', 'node')
+        with patch.object(Runtime, 'RUNNER', os.path.join(JS_TOOLS_DIR, 'runner.js')):
+            assert parser.invoke('sub', {'b': 2, 'a': 10}) == 8
+
+
+@pytest.fixture
+def payload_dir(tmp_path, monkeypatch):
+    directory = tmp_path / 'payloads'
+    monkeypatch.setattr('runit.languages.payloads.PAYLOAD_DIR', str(directory))
+    monkeypatch.setenv('RUNIT_PAYLOAD_DIR', str(directory))
+    monkeypatch.setattr('runit.core.PAYLOAD_THRESHOLD', 1024)
+    return directory
+
+
+class TestPayloads:
+    """Test passing large bodies and results through payload files."""
+
+    def test_small_bodies_stay_in_memory(self, payload_dir):
+        """Ensure bodies under the threshold are not written to disk."""
+        from runit.languages.payloads import spool
+
+        async def chunks():
+            yield b'abc'
+            yield b'def'
+
+        assert asyncio.run(spool(chunks(), threshold=16)) == b'abcdef'
+        assert not payload_dir.exists()
+
+    def test_large_body_reaches_function_as_payload(self, app, payload_dir):
+        """Ensure a large body is spooled, mapped by the function and deleted after the response."""
+        body = b'CSV,' + b'x' * 64 * 1024
+        response = post(app, '/measure', content=body, headers={'content-type': 'text/csv'})
+        assert response.json() == {'size': len(body), 'type': 'Payload', 'head': 'CSV,'}
+        assert list(payload_dir.iterdir()) == []
+
+    def test_binary_results_are_sent_raw(self, app, payload_dir):
+        """Ensure bytes results are returned as an octet stream, not JSON."""
+        response, = request_all(app, ['/blob?size=3'])
+        assert response.headers['content-type'] == 'application/octet-stream'
+        assert response.content == b'\x00\x00\x00'
+
+    def test_payload_results_are_served_from_file(self, app, payload_dir):
+        """Ensure returned payloads are streamed from their file, then deleted."""
+        body = bytes(range(256)) * 32
+        response = post(app, '/echo', content=body, headers={'content-type': 'image/png'})
+        assert response.headers['content-type'] == 'image/png'
+        assert response.content == body
+        assert list(payload_dir.iterdir()) == []
+
+    def test_coalesced_payload_results_are_not_shared(self, payload_dir):
+        """Ensure each caller of a coalesced call gets a payload file it can release on its own."""
+        from runit.runit import RunIt
+        from runit.languages.envelope import Envelope
+        from runit.languages.payloads import write
+        from runit.languages.singleflight import SingleFlight
+
+        flight = SingleFlight()
+
+        async def produce():
+            await asyncio.sleep(0.05)
+            return Envelope(value=write(b'shared' * 1000))
+
+        async def run():
+            return await asyncio.gather(*(flight.do_async('k', produce, share=RunIt.own_result) for _ in range(3)))
+
+        payloads = [envelope.value for envelope in asyncio.run(run())]
+        assert len({payload.path for payload in payloads}) == 3
+        for index, payload in enumerate(payloads):
+            payload.release()
+            assert all(other.read() == b'shared' * 1000 for other in payloads[index + 1:])
+        assert list(payload_dir.iterdir()) == []
+
+    def test_runner_exchanges_handles(self, project, payload_dir):
+        """Ensure runners receive payload handles and hand binary results back as files."""
+        from runit.languages.python import Python
+        from runit.languages.payloads import Payload, write
+
+        parser = Python('application.py', sys.executable, is_docker=True)
+        payload = write(b'PNG!' + b'.' * 4096, 'image/png')
+        assert parser.invoke('measure', {'body': payload}) == {'size': 4100, 'type': 'Payload', 'head': 'PNG!'}
+
+        result = parser.invoke('blob', {'size': 5000})
+        assert isinstance(result, Payload) and result.read() == b'\x00' * 5000
+        result.release()
+        payload.release()
+        assert list(payload_dir.iterdir()) == []
+
+    def test_forged_handles_are_passed_through(self, project, tmp_path, payload_dir):
+        """Ensure client dicts shaped like handles never open files outside the payload directory."""
+        from runit.languages.python import Python
+        from runit.languages.payloads import is_handle, resolve, sign
+
+        secret = tmp_path / 'secret.txt'
+        secret.write_text('private')
+        forged = {'$payload': str(secret)}
+        assert resolve(forged) == forged
+        assert not is_handle({**forged, 'token': 'x' * 64})
+        assert not is_handle({**forged, 'token': sign(str(secret))})
+
+        parser = Python('application.py', sys.executable, is_docker=True)
+        assert parser.invoke('printout', {'string': forged}) == forged
+
+    @pytest.mark.skipif(shutil.which('node') is None, reason='node not installed')
+    def test_forged_handles_are_not_served(self, tmp_path, payload_dir, monkeypatch):
+        """Ensure a handle echoed back by a function is not served as a file."""
+        from runit.languages.runtime import Runtime
+        from runit.languages.javascript import JS_TOOLS_DIR
+
+        secret = tmp_path / 'secret.txt'
+        secret.write_text('private')
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / 'main.js').write_text('exports.printout = (string) => string\n')
+        parser = Runtime('main.js', 'node')
+        with patch.object(Runtime, 'RUNNER', os.path.join(JS_TOOLS_DIR, 'runner.js')):
+            assert parser.invoke('printout', [{'$payload': str(secret)}]) == {'$payload': str(secret)}
+
+    def test_foreign_files_are_never_released(self, tmp_path, payload_dir):
+        """Ensure payloads pointing outside the payload directory are left alone."""
+        from runit.languages.payloads import Payload
+
+        path = tmp_path / 'data.bin'
+        path.write_bytes(b'keep')
+        Payload(path).release()
+        assert path.exists()
+
+
+class TestUploads:
+    """Test streaming form and file uploads into functions."""
+
+    def test_multipart_files_reach_function_as_payloads(self, app, payload_dir):
+        """Ensure uploaded files arrive as named payloads and are deleted after the response."""
+        response = post(app, '/upload', data={'title': 'report'},
+                        files={'document': ('data.csv', b'a,b\n' * 1000, 'text/csv')})
+        assert response.json() == {'title': 'report', 'filename': 'data.csv', 'size': 4000,
+                                   'content_type': 'text/csv', 'head': 'a,b\na'}
+        assert list(payload_dir.iterdir()) == []
+
+    def test_parser_handles_any_chunking(self, payload_dir):
+        """Ensure delimiters split across chunks are still found."""
+        from runit.uploads import MultipartParser
+
+        body = (b'--XyZ\r\nContent-Disposition: form-data; name="note"\r\n\r\nhi --XyZ there\r\n'
+                b'--XyZ\r\nContent-Disposition: form-data; name="f"; filename="a.bin"\r\n\r\n'
+                b'\r\n--Xy\r\n--XyZ--\r\n')
+        parser = MultipartParser('XyZ')
+        for index in range(len(body)):
+            parser.feed(body[index:index + 1])
+        values = parser.finish()
+        assert values['note'] == 'hi --XyZ there'
+        assert values['f'].read() == b'\r\n--Xy'
+        parser.close()
+
+    def test_oversized_files_are_rejected_while_streaming(self, app, payload_dir):
+        """Ensure a file over the limit gets 413 and leaves nothing on disk."""
+        with patch('runit.core.UPLOAD_MAX_FILE_SIZE', 1024):
+            response = post(app, '/upload', data={'title': 'big'},
+                            files={'document': ('big.bin', b'x' * 4096)})
+        assert response.status_code == 413
+        assert list(payload_dir.iterdir()) == []
+
+    def test_urlencoded_and_malformed_forms(self, app, payload_dir):
+        """Ensure url-encoded fields are passed and broken multipart bodies get 400."""
+        response = post(app, '/printout', data={'string': 'form value'})
+        assert response.json() == 'form value'
+
+        response = post(app, '/printout', content=b'--b\r\nbroken',
+                        headers={'content-type': 'multipart/form-data; boundary=b'})
+        assert response.status_code == 400
+
+
+class TestHttpCaching:
+    """Test compression, validators and Cache-Control of responses."""
+
+    def test_large_bodies_are_compressed(self, app):
+        """Ensure bodies over the threshold are gzipped and small ones are not."""
+        response = get(app, '/listing?n=500', headers={'accept-encoding': 'gzip'})
+        assert response.headers['content-encoding'] == 'gzip'
+        assert int(response.headers['content-length']) < len(response.content) / 5
+        assert len(response.json()) == 500
+
+        response = get(app, '/listing?n=1', headers={'accept-encoding': 'gzip'})
+        assert 'content-encoding' not in response.headers
+
+    def test_unchanged_results_answer_304(self, app):
+        """Ensure a matching If-None-Match gets an empty 304."""
+        first = get(app, '/listing?n=500', headers={'accept-encoding': 'gzip'})
+        etag = first.headers['etag']
+        assert etag.startswith('"') and etag.endswith('-gz"')
+
+        again = get(app, '/listing?n=500', headers={'accept-encoding': 'gzip', 'if-none-match': etag})
+        assert again.status_code == 304 and again.content == b''
+        assert again.headers['etag'] == etag
+
+        changed = get(app, '/listing?n=501', headers={'accept-encoding': 'gzip', 'if-none-match': etag})
+        assert changed.status_code == 200
+
+    def test_cache_control_follows_function_policy(self, project, app):
+        """Ensure the cache ttl becomes max-age, and uncached functions must revalidate."""
+        project.functions = {'listing': {'cache': 30}, 'index': {'cache_control': 'private, max-age=5'}}
+        assert get(app, '/listing?n=2').headers['cache-control'] == 'public, max-age=30'
+        assert get(app, '/index').headers['cache-control'] == 'private, max-age=5'
+        assert get(app, '/printout?string=x').headers['cache-control'] == 'no-cache'
+        assert 'etag' not in post(app, '/printout', json={'string': 'x'}).headers
+
+    def test_accept_encoding_negotiation(self):
+        """Ensure refused codings are never chosen."""
+        from runit.responses import accepted_encoding, etag_matches
+
+        assert accepted_encoding('gzip, deflate') in ('gzip', 'br')
+        assert accepted_encoding('gzip;q=0, identity') is None
+        assert accepted_encoding(None) is None
+        assert etag_matches('W/"a", "b"', '"a"') and not etag_matches('"b"', '"a"')
+
+
+class TestStaticAssets:
+    """Test serving files from the project's public/ directory."""
+
+    @pytest.fixture
+    def public(self, project, tmp_path):
+        from runit.static import precompress
+
+        (tmp_path / 'public' / 'css').mkdir(parents=True)
+        (tmp_path / 'public' / 'css' / 'site.css').write_text('body { color: red; }\n' * 200)
+        (tmp_path / 'public' / 'logo.bin').write_bytes(bytes(range(256)))
+        precompress(tmp_path / 'public')
+        return tmp_path / 'public'
+
+    def test_precompressed_siblings_are_preferred(self, public, app):
+        """Ensure .gz siblings are written once and sent to clients that accept gzip."""
+        from runit.static import precompress
+
+        assert (public / 'css' / 'site.css.gz').exists()
+        assert not (public / 'logo.bin.gz').exists()
+        assert precompress(public) == 0
+
+        response = get(app, '/public/css/site.css', headers={'accept-encoding': 'gzip'})
+        assert response.headers['content-encoding'] == 'gzip'
+        assert response.headers['content-type'].startswith('text/css')
+        assert response.headers['etag'].endswith('-gz"')
+        assert response.text == 'body { color: red; }\n' * 200
+
+        plain = get(app, '/public/css/site.css', headers={'accept-encoding': 'identity'})
+        assert 'content-encoding' not in plain.headers
+
+    def test_ranges_and_revalidation(self, public, app):
+        """Ensure byte ranges are honoured and a matching ETag gets 304."""
+        response = get(app, '/public/logo.bin', headers={'range': 'bytes=10-13'})
+        assert response.status_code == 206
+        assert response.content == bytes([10, 11, 12, 13])
+
+        etag = get(app, '/public/logo.bin').headers['etag']
+        assert get(app, '/public/logo.bin', headers={'if-none-match': etag}).status_code == 304
+
+    def test_changed_files_are_indexed_again(self, public, app):
+        """Ensure a file edited after it was indexed is sent whole, with a new ETag."""
+        first = get(app, '/public/logo.bin')
+        (public / 'logo.bin').write_bytes(b'new logo, longer than before' * 20)
+
+        second = get(app, '/public/logo.bin')
+        assert second.content == b'new logo, longer than before' * 20
+        assert second.headers['etag'] != first.headers['etag']
+
+    def test_only_public_files_are_served(self, public, app):
+        """Ensure missing files get the 404 page and paths can't escape public/."""
+        from runit.core import WebServer
+
+        assert get(app, '/public/missing.js').status_code == 404
+        assert WebServer(None).assets.lookup('../runit.json') is None
+        assert WebServer(None).assets.lookup('css/site.css.gz') is None
+
+    def test_assets_are_looked_up_off_the_event_loop(self, public, app, monkeypatch):
+        """Ensure file lookups, which may stat and re-index, run in the threadpool."""
+        import threading
+        from runit.static import AssetIndex
+
+        threads = []
+        lookup = AssetIndex.lookup
+
+        def record(index, path):
+            threads.append(threading.current_thread())
+            return lookup(index, path)
+
+        monkeypatch.setattr(AssetIndex, 'lookup', record)
+        assert get(app, '/public/logo.bin').status_code == 200
+        assert threads and threading.main_thread() not in threads
+
+    def test_public_is_a_reserved_name(self, project, caplog):
+        """Ensure a function named public is reported, since its path routes are taken by static files."""
+        from runit.core import WebServer
+
+        server = WebServer(project)
+        with patch.object(project, 'get_functions', return_value=['index', 'public']), \
+                caplog.at_level(logging.WARNING, logger='runit.server'):
+            server.add_routes(server.create_app())
+        assert any('reserved' in record.getMessage() for record in caplog.records)
+
+    def test_not_found_page_is_read_once(self, project):
+        """Ensure the 404 template is served from memory after the first read."""
+        from runit.runit import RunIt
+
+        RunIt.read_template.cache_clear()
+        assert RunIt.notfound('html') == RunIt.notfound('html')
+        assert RunIt.read_template.cache_info().hits == 1
+
+
+PREFORK_SERVER = """
+import sys, json
+sys.path.insert(0, {root!r})
+from runit.runit import RunIt
+from runit.core import WebServer
+
+RunIt.PYTHON_PATHS[sys.platform] = sys.executable
+WebServer(RunIt(**json.load(open('runit.json')))).start('127.0.0.1', {port}, {workers})
+"""
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='prefork needs os.fork')
+class TestPrefork:
+    """Test the multi-process prefork server."""
+
+    @pytest.fixture
+    def start(self, project, tmp_path):
+        import socket
+        import signal
+
+        servers = []
+
+        def start(workers, **env):
+            with socket.socket() as probe:
+                probe.bind(('127.0.0.1', 0))
+                port = probe.getsockname()[1]
+            root = str(Path(__file__).parent.parent)
+            script = PREFORK_SERVER.format(root=root, port=port, workers=workers)
+            server = subprocess.Popen([sys.executable, '-c', script], cwd=tmp_path, env={**os.environ, **env},
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            servers.append(server)
+            return server, f'http://127.0.0.1:{port}'
+
+        yield start
+        for server in servers:
+            server.send_signal(signal.SIGTERM)
+            assert server.wait(timeout=15) == 0
+
+    @staticmethod
+    def call(url, func):
+        with httpx.Client(base_url=url) as client:
+            return client.get(f'/{func}').json()
+
+    def workers(self, url, expected, timeout=10):
+        seen, deadline = set(), time.monotonic() + timeout
+        while len(seen) < expected and time.monotonic() < deadline:
+            try:
+                seen.add(self.call(url, 'pid'))
+            except httpx.TransportError:
+                time.sleep(0.1)
+        return seen
+
+    def test_workers_share_warm_parent_and_are_replaced(self, start):
+        """Ensure workers are forked after the module is imported, and dead ones are replaced."""
+        import signal
+
+        server, url = start(2)
+        pids = self.workers(url, 2)
+        assert len(pids) == 2 and server.pid not in pids
+        assert self.call(url, 'imported_by') == server.pid
+
+        victim = pids.pop()
+        os.kill(victim, signal.SIGKILL)
+        replaced = self.workers(url, 2) - {victim}
+        assert len(replaced) == 2 and pids <= replaced
+
+    def test_recycled_workers_are_swapped_without_errors(self, start):
+        """Ensure a worker over its request limit is replaced while requests keep succeeding."""
+        server, url = start(1, RUNIT_RECYCLE_MAX_REQUESTS='5')
+        assert self.workers(url, 1)
+
+        pids, failures, deadline = [], 0, time.monotonic() + 10
+        while len(set(pids)) < 2 and time.monotonic() < deadline:
+            try:
+                pids.append(self.call(url, 'pid'))
+            except httpx.TransportError:
+                failures += 1
+            time.sleep(0.02)
+        assert len(set(pids)) >= 2
+        assert failures == 0
+
+        # The recycled worker drains and exits
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                os.kill(pids[0], 0)
+            except ProcessLookupError:
+                break
+            time.sleep(0.1)
+        else:
+            pytest.fail('Recycled worker is still running')
+
+    def test_in_flight_requests_finish_on_sigterm(self, start):
+        """Ensure a request running when SIGTERM arrives still completes before the server exits."""
+        import signal
+        from concurrent.futures import ThreadPoolExecutor
+
+        server, url = start(2)
+        assert self.workers(url, 2)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = executor.submit(self.call, url, 'sleepy')
+            time.sleep(0.1)
+            server.send_signal(signal.SIGTERM)
+            assert pending.result(timeout=10) == 'rested'
+        assert server.wait(timeout=15) == 0
+
+
+class TestDraining:
+    """Test connection draining on shutdown."""
+
+    @pytest.fixture
+    def server(self, project):
+        from runit.core import WebServer
+
+        server = WebServer(project, max_workers=4)
+        server.app = server.create_app()
+        server.add_routes(server.app)
+        return server
+
+    def test_drain_waits_for_in_flight_requests(self, server):
+        """Ensure draining fails readiness, refuses new calls and lets running ones finish."""
+        async def run():
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://runit') as client:
+                assert (await client.get('/ready')).status_code == 200
+                slow = asyncio.ensure_future(client.get('/sleepy'))
+                while not server._inflight:
+                    await asyncio.sleep(0.01)
+
+                server.begin_draining()
+                ready = await client.get('/ready')
+                refused = await client.get('/index')
+                drained = await server.drain(5)
+                return ready, refused, drained, await slow
+
+        ready, refused, drained, slow = asyncio.run(run())
+        assert ready.status_code == 503 and ready.json()['status'] == 'draining'
+        assert refused.status_code == 503 and refused.headers['connection'] == 'close'
+        assert drained and server._inflight == 0
+        assert slow.json() == 'rested'
+
+    def test_signal_keeps_serving_until_listeners_close(self, server):
+        """Ensure a shutdown signal fails readiness but still serves requests, closing their connections."""
+        async def run():
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://runit') as client:
+                server.begin_draining(refuse=False)
+                return await client.get('/ready'), await client.get('/index')
+
+        ready, served = asyncio.run(run())
+        assert ready.status_code == 503
+        assert served.json() == 'Yay, Python works' and served.headers['connection'] == 'close'
+
+    def test_drain_gives_up_at_the_deadline(self, server):
+        """Ensure drain returns False while a request is still running past its timeout."""
+        server._inflight = 1
+        assert asyncio.run(server.drain(0.1)) is False
+
+    def test_runners_are_stopped_at_the_deadline(self):
+        """Ensure runner processes of calls that outlive the drain are terminated."""
+        from runit.languages.runtime import Runtime
+
+        process = Runtime.start_runner([sys.executable, '-c', 'import time; time.sleep(60)'])
+        assert Runtime.stop_runners(timeout=0.5) == 1
+        assert process.poll() is not None
+        process.communicate()
+
+    def test_worker_pools_stop_within_timeout(self, tmp_path):
+        """Ensure shutting down warm workers terminates the ones that don't exit in time."""
+        from runit.languages.workers import Worker, WorkerPool
+
+        command = [sys.executable, '-c', 'import time; time.sleep(60)']
+        pool = WorkerPool.get('draining', command)
+        worker = Worker(command)
+        pool.workers.append(worker)
+
+        start = time.monotonic()
+        WorkerPool.shutdown_all(timeout=0.2)
+        assert time.monotonic() - start < 5
+        assert not worker.alive
+
+
+class TestInvoke:
+    """Test that parsers can be invoked concurrently without shared state."""
+
+    def test_concurrent_invocations_run_their_own_function(self, project):
+        """Ensure interleaved calls on one parser never swap functions."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        parser = project.lang_parser
+        calls = [('printout', [str(i)]) if i % 2 else ('index', []) for i in range(40)]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda call: parser.invoke(*call), calls))
+
+        assert results == [args[0] if args else 'Yay, Python works' for _, args in calls]
+
+    def test_bound_methods_call_their_function(self, project):
+        """Ensure the per-function attributes invoke the function they are named after."""
+        parser = project.lang_parser
+        assert parser.printout('hello') == 'hello'
+        assert parser.index() == 'Yay, Python works'
+
+
+class TestProcessExecution:
+    """Test the opt-in process pool for CPU-bound Python functions."""
+
+    def test_policy_merges_project_defaults(self, process_project):
+        """Ensure per-function settings override the "*" entry."""
+        assert process_project.function_policy('crunch') == {'execution': 'process'}
+        assert process_project.function_policy('index') == {'execution': 'thread'}
+
+    def test_runs_in_pool_process(self, process_project):
+        """Ensure process-mode functions run outside the server process."""
+        import os
+
+        async def run():
+            return await asyncio.gather(
+                process_project.serve_async('pid', {}),
+                process_project.serve_async('crunch', {'n': '10'})
+            )
+        pid, total = asyncio.run(run())
+        assert pid != os.getpid()
+        assert total == 285
+
+    def test_same_function_keeps_affinity(self, process_project):
+        """Ensure sequential calls to one function reuse the same worker."""
+        pids = {asyncio.run(process_project.serve_async('pid', {})) for _ in range(3)}
+        assert len(pids) == 1
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
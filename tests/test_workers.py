@@ -0,0 +1,221 @@
+"""
+Tests for the long-lived language worker pools.
+"""
+import os
+import sys
+import time
+import shutil
+import pytest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from runit.languages.workers import WorkerPool, WorkerError
+
+requires_node = pytest.mark.skipif(shutil.which('node') is None, reason='node not installed')
+
+
+@pytest.fixture(autouse=True)
+def function_cache(tmp_path, monkeypatch):
+    from runit.languages.cache import FunctionCache
+    from runit.languages.runtime import Runtime
+
+    cache = FunctionCache(tmp_path / 'functions.db')
+    monkeypatch.setattr(Runtime, '_function_cache', cache)
+    return cache
+
+JS_MODULE = """
+module.exports = {
+    index: () => 'Yay, Javascript works!!!',
+    add: (a, b) => Number(a) + Number(b),
+    later: async (value) => { console.log('noise'); return {value} },
+    crash: () => process.exit(3)
+}
+"""
+
+
+@pytest.fixture
+def js_project(tmp_path, monkeypatch):
+    (tmp_path / 'main.js').write_text(JS_MODULE)
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    WorkerPool.shutdown_all()
+
+
+PY_MODULE = """
+import os
+import time
+
+def index():
+    return 'Yay, Python works'
+
+def pid():
+    return os.getpid()
+
+async def later(value):
+    print('noise')
+    return [value]
+
+def crash():
+    os._exit(4)
+
+def nap(path):
+    with open(path, 'w') as file:
+        file.write(str(os.getpid()))
+    time.sleep(60)
+"""
+
+
+@pytest.fixture
+def py_project(tmp_path, monkeypatch):
+    (tmp_path / 'application.py').write_text(PY_MODULE)
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    WorkerPool.shutdown_all()
+
+
+ECHO_WORKER = """
+import sys, json
+for line in sys.stdin:
+    request = json.loads(line)
+    if request['function'] == 'exit':
+        sys.exit(1)
+    if request['function'] == 'hang':
+        continue
+    print(json.dumps({'id': request['id'], 'result': request['args']}), flush=True)
+"""
+
+
+@pytest.fixture
+def echo_pool(tmp_path):
+    script = tmp_path / 'worker.py'
+    script.write_text(ECHO_WORKER)
+    pool = WorkerPool([sys.executable, str(script)], size=1, max_requests=2)
+    yield pool
+    pool.shutdown()
+
+
+class TestWorkerPool:
+    """Test worker recycling and crash detection."""
+
+    def test_worker_recycled_after_max_requests(self, echo_pool):
+        """Ensure a worker is replaced once it served max_requests calls."""
+        echo_pool.call({'function': 'echo', 'args': [1]})
+        first = echo_pool.workers[0]
+        echo_pool.call({'function': 'echo', 'args': [2]})
+        response = echo_pool.call({'function': 'echo', 'args': [3]})
+
+        assert response['result'] == [3]
+        assert echo_pool.workers[0] is not first
+        first.process.wait(timeout=5)
+        assert not first.alive
+
+    def test_crash_fails_pending_call(self, echo_pool):
+        """Ensure a worker dying mid-request surfaces as WorkerError."""
+        with pytest.raises(WorkerError):
+            echo_pool.call({'function': 'exit', 'args': []})
+        assert echo_pool.call({'function': 'echo', 'args': []})['result'] == []
+
+    def test_unanswered_call_times_out_and_worker_is_replaced(self, echo_pool):
+        """Ensure a call that never settles fails alone and its worker is killed."""
+        with pytest.raises(WorkerError):
+            echo_pool.call({'function': 'hang', 'args': []}, timeout=0.2)
+        stuck = echo_pool.workers[0]
+        stuck.process.wait(timeout=5)
+
+        assert echo_pool.call({'function': 'echo', 'args': [1]})['result'] == [1]
+        assert echo_pool.workers[0] is not stuck
+
+
+@requires_node
+class TestJavascriptWorkers:
+    """Test the persistent node worker pool."""
+
+    def test_calls_are_served_by_warm_worker(self, js_project):
+        """Ensure repeated calls reuse the same worker process."""
+        from runit.languages.javascript import Javascript
+
+        parser = Javascript('main.js', 'node', False, False, '')
+        assert parser.call_worker('index') == 'Yay, Javascript works!!!'
+        assert parser.call_worker('add', 2, 3) == 5
+
+        pool = parser.worker_pool()
+        assert len(pool.workers) == 1
+        assert pool.workers[0].served == 2
+
+    def test_async_results_and_logging(self, js_project):
+        """Ensure promises are awaited and console output stays off the protocol."""
+        from runit.languages.javascript import Javascript
+
+        parser = Javascript('main.js', 'node', False, False, '')
+        assert parser.call_worker('later', 'x') == {'value': 'x'}
+
+    def test_crashed_worker_is_replaced(self, js_project):
+        """Ensure a crashing call fails and the next call gets a fresh worker."""
+        from runit.languages.javascript import Javascript
+
+        parser = Javascript('main.js', 'node', False, False, '')
+        with pytest.raises(WorkerError):
+            parser.call_worker('crash')
+        assert parser.call_worker('index') == 'Yay, Javascript works!!!'
+
+    def test_pool_restarts_when_module_changes(self, js_project):
+        """Ensure editing the module hands out a new pool."""
+        from runit.languages.javascript import Javascript
+
+        parser = Javascript('main.js', 'node', False, False, '')
+        pool = parser.worker_pool()
+        os.utime('main.js', (0, 0))
+        assert parser.worker_pool() is not pool
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='fork not available')
+class TestPythonZygote:
+    """Test the forking Python zygote."""
+
+    def test_each_call_runs_in_a_forked_child(self, py_project):
+        """Ensure calls are isolated in children of one warm zygote."""
+        from runit.languages.python import Python
+
+        parser = Python('application.py', sys.executable, is_file=True)
+        first, second = parser.call_worker('pid'), parser.call_worker('pid')
+
+        pool = parser.worker_pool()
+        assert len(pool.workers) == 1
+        assert first != second
+        assert pool.workers[0].process.pid not in (first, second)
+
+    def test_results_and_crashes(self, py_project):
+        """Ensure results keep their type and a dying child only fails its call."""
+        from runit.languages.python import Python
+        from runit.languages.envelope import FunctionError
+
+        parser = Python('application.py', sys.executable, is_file=True)
+        assert parser.call_worker('later', 'x') == ['x']
+        with pytest.raises(FunctionError, match='Function exited with code 4'):
+            parser.call_worker('crash')
+        assert parser.call_worker('index') == 'Yay, Python works'
+
+
+    def test_children_are_killed_when_stdin_closes(self, py_project):
+        """Ensure calls still running are not orphaned once the server closes the zygote."""
+        from runit.languages.python import Python
+
+        parser = Python('application.py', sys.executable, is_file=True)
+        worker = parser.worker_pool()._acquire()
+        marker = py_project / 'child.pid'
+        worker.submit(1, {'module': parser.module, 'function': 'nap', 'args': [str(marker)]})
+
+        deadline = time.monotonic() + 5
+        while not marker.exists() or not marker.read_text():
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        child = int(marker.read_text())
+
+        worker.close()
+        worker.process.wait(timeout=5)
+        with pytest.raises(ProcessLookupError):
+            os.kill(child, 0)
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])